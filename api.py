@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from wire import decode_body, request_headers
+from metrics import record_request, timed
+
+BASE_URL = os.environ.get("TASK_APP_BACKEND_URL", "http://localhost:8000").rstrip("/")
+
+POOL_SIZE = int(os.environ.get("TASK_APP_POOL_SIZE", "10"))
+MAX_RETRIES = int(os.environ.get("TASK_APP_MAX_RETRIES", "3"))
+RETRY_BACKOFF = float(os.environ.get("TASK_APP_RETRY_BACKOFF", "0.3"))
+# Task reads ask for this wire shape: normalized, columnar, or json for the
+# plain nested payload
+WIRE_SHAPE = os.environ.get("TASK_APP_WIRE_SHAPE", "normalized")
+
+# (connect, read) timeouts in seconds, per endpoint
+DEFAULT_TIMEOUT = (3.05, 10)
+TIMEOUTS = {
+    "auth": (3.05, 5),
+    "tasks": (3.05, 15),
+    "team_tasks": (3.05, 15),
+    "teams": (3.05, 5),
+    "team_members": (3.05, 5),
+    "tags": (3.05, 5),
+    "bootstrap": (3.05, 15),
+    "user": (3.05, 5),
+    "transfer": (3.05, 300),
+    # Above the backend's long-poll wait and its event stream heartbeat
+    "changes": (3.05, 35),
+    "events": (3.05, 45),
+}
+
+# Only verbs that are safe to replay are retried; POST is never retried
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+RETRY_STATUSES = (502, 503, 504)
+
+WATERMARK_HEADER = "X-Sync-Watermark"
+
+
+class BackendError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BackendClient:
+    def __init__(self, base_url=BASE_URL, pool_size=POOL_SIZE, max_retries=MAX_RETRIES,
+                 backoff_factor=RETRY_BACKOFF, timeouts=None, wire_shape=WIRE_SHAPE):
+        self.base_url = base_url.rstrip("/")
+        self.wire_headers = request_headers(wire_shape)
+        self.timeouts = dict(TIMEOUTS, **(timeouts or {}))
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Flipped off the first time the backend answers a page request with a
+        # plain task list, so boards fall back to full-board loading
+        self.supports_paging = True
+        # Likewise for the board bootstrap; a 404 means per-team requests
+        self.supports_bootstrap = True
+
+    def _request(self, method, endpoint, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeouts.get(endpoint, DEFAULT_TIMEOUT))
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.RequestException:
+            record_request(endpoint, method, "error", time.perf_counter() - started, 0)
+            raise
+        # Bytes on the wire when the backend says; streamed bodies are not
+        # read here just to be measured
+        size = response.headers.get("Content-Length")
+        if size is None and not kwargs.get("stream"):
+            size = len(response.content)
+        record_request(endpoint, method, response.status_code, time.perf_counter() - started, int(size or 0))
+        return response
+
+    def close(self):
+        self.session.close()
+
+    def auth(self, uid):
+        return self._request("POST", "auth", "/auth", json={"uid": uid})
+
+    def _read_tasks(self, endpoint, path, params=None, headers=None):
+        # Task reads negotiate the compact encodings; read their bodies with
+        # read_body rather than response.json()
+        return self._request("GET", endpoint, path, params=params, headers=dict(self.wire_headers, **(headers or {})))
+
+    def _sync_args(self, since, etag):
+        args = {}
+        if since is not None:
+            args["params"] = {"since": since}
+        if etag is not None:
+            args["headers"] = {"If-None-Match": etag}
+        return args
+
+    def get_tasks(self, uid, since=None, etag=None):
+        return self._read_tasks("tasks", f"/tasks/{uid}", **self._sync_args(since, etag))
+
+    def get_task_page(self, uid, **params):
+        return self._read_tasks("tasks", f"/tasks/{uid}", params=params)
+
+    def get_team_task_page(self, team_id, **params):
+        return self._read_tasks("team_tasks", f"/team-tasks/{team_id}", params=params)
+
+    def search_tasks(self, uid, query, **params):
+        # Ranked full-text matches, paged like get_task_page
+        return self._read_tasks("tasks", f"/tasks/{uid}/search", params=dict(params, q=query))
+
+    def search_team_tasks(self, team_id, query, **params):
+        return self._read_tasks("team_tasks", f"/team-tasks/{team_id}/search", params=dict(params, q=query))
+
+    def create_task(self, task, idempotency_key=None):
+        # A create sent again with the same key answers with the task the
+        # first one created
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        return self._request("POST", "tasks", "/tasks/", json=task, headers=headers)
+
+    def update_task(self, task_id, task):
+        return self._request("PUT", "tasks", f"/tasks/{task_id}", json=task)
+
+    def delete_task(self, task_id):
+        return self._request("DELETE", "tasks", f"/tasks/{task_id}")
+
+    def bulk_tasks(self, operations):
+        # One request, one backend transaction, one result per operation
+        return self._request("POST", "tasks", "/tasks/bulk", json={"operations": operations})
+
+    def get_teams(self, uid):
+        return self._request("GET", "teams", f"/teams/{uid}")
+
+    def get_team_members(self, team_id):
+        return self._request("GET", "team_members", f"/teams/{team_id}/members")
+
+    def get_bootstrap(self, uid, since=None, with_tasks=True):
+        # The user's teams with their members and tasks in one response; with
+        # since, only the tasks changed or deleted after that watermark
+        params = {} if with_tasks else {"tasks": "false"}
+        if since:
+            params["since"] = since
+        return self._read_tasks("bootstrap", f"/bootstrap/{uid}", params=params)
+
+    def get_tags(self, uid):
+        # Names of the user's personal tags, for autocomplete
+        return self._request("GET", "tags", f"/tags/{uid}")
+
+    def get_team_tags(self, team_id):
+        return self._request("GET", "tags", f"/team-tags/{team_id}")
+
+    def get_team_tasks(self, team_id, since=None, etag=None):
+        return self._read_tasks("team_tasks", f"/team-tasks/{team_id}", **self._sync_args(since, etag))
+
+    def create_user(self, username, email):
+        return self._request("POST", "user", "/user", json={"username": username, "email": email})
+
+    def get_changes(self, uid, after=None, timeout=25):
+        # Long poll for changes to the user's boards after event id after;
+        # without it, only the id to start from
+        params = {"timeout": timeout}
+        if after is not None:
+            params["after"] = after
+        return self._request("GET", "changes", f"/changes/{uid}", params=params)
+
+    def stream_changes(self, uid, last_event_id=None):
+        # The same changes as server-sent events, until the connection drops
+        headers = {"Accept": "text/event-stream"}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = str(last_event_id)
+        return self._request("GET", "events", f"/events/{uid}", headers=headers, stream=True)
+
+    def import_records(self, kind, stream, fmt):
+        # kind is users, teams, memberships or tasks; the file object is sent
+        # as a streamed body rather than read into memory
+        return self._request("POST", "transfer", f"/import/{kind}", params={"format": fmt}, data=stream)
+
+    def export_records(self, kind, fmt):
+        # Read the body with iter_content; exports can be large
+        return self._request("GET", "transfer", f"/export/{kind}", params={"format": fmt}, stream=True)
+
+
+def read_body(response):
+    # JSON or MessagePack, normalized or not, back to the nested task shape
+    with timed("decode_body"):
+        return decode_body(response.headers.get("Content-Type", ""), response.content)
+
+def parse_board_response(response, what):
+    # Normalizes the three answers a board read can get: 304 for an unchanged
+    # board, a delta body for a since= request, or a full task list
+    etag = response.headers.get("ETag")
+    watermark = response.headers.get(WATERMARK_HEADER)
+    if response.status_code == 304:
+        return {"mode": "unchanged", "tasks": [], "deleted": [], "watermark": None, "etag": etag}
+    if response.status_code != 200:
+        raise BackendError(f"Failed to retrieve {what}. Error {response.status_code}", response.status_code)
+    body = read_body(response)
+    if isinstance(body, dict) and "tasks" in body:
+        return {
+            "mode": "delta",
+            "tasks": body["tasks"],
+            "deleted": body.get("deleted", []),
+            "watermark": body.get("watermark") or watermark,
+            "etag": etag,
+        }
+    if watermark is None:
+        # Backends without the header still let us sync from the newest change
+        watermark = max((task["updated_at"] for task in body if task.get("updated_at")), default=None)
+    return {"mode": "full", "tasks": body, "deleted": [], "watermark": watermark, "etag": etag}
+
+
+def parse_page_response(response, what):
+    if response.status_code != 200:
+        raise BackendError(f"Failed to retrieve {what}. Error {response.status_code}", response.status_code)
+    body = read_body(response)
+    if isinstance(body, list):
+        # The backend ignored the paging parameters
+        return {"tasks": body, "next_cursor": None, "total": len(body), "paged": False}
+    return {"tasks": body["tasks"], "next_cursor": body.get("next_cursor"), "total": body.get("total"), "paged": True}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    # One pooled client per process, shared by every session and rerun
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BackendClient()
+    return _client
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+from stub_backend import BENCHMARK_USER_ID, StubBackend, StubData
+
+# Headless benchmark of the Streamlit app against stub_backend. Each
+# scenario drives login.py through streamlit.testing's AppTest and records
+# rerun wall time, requests and bytes served by the stub, and peak Python
+# memory, for boards of several sizes. Results can be saved as a baseline
+# and later runs compared against it.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "login.py")
+BASELINE_PATH = os.path.join(APP_DIR, "benchmark_baseline.json")
+
+SCENARIOS = ("login", "personal_board", "team_board", "edit_dialog")
+# (tasks, teams) per run
+DEFAULT_SIZES = ((10, 1), (1000, 10), (10000, 20), (50000, 50))
+DEFAULT_LATENCY = 0.02
+DEFAULT_REPEAT = 3
+RUN_TIMEOUT = 300
+# A metric this much worse than the baseline counts as a regression
+REGRESSION_THRESHOLD = 0.2
+METRICS = ("wall_ms", "requests", "bytes", "peak_kb")
+
+# AppTest has no browser, so the cookie component never reports ready;
+# the app gets this in-memory cookie jar instead
+COOKIES = {}
+
+APP_SCRIPT = f"""
+import runpy
+import sys
+sys.path.insert(0, {APP_DIR!r})
+import benchmark
+benchmark.install_cookie_jar()
+runpy.run_path({APP_PATH!r}, run_name="__main__")
+"""
+
+
+class CookieJar:
+    def __init__(self, prefix="", password=None):
+        pass
+
+    def ready(self):
+        return True
+
+    def get(self, key, default=None):
+        return COOKIES.get(key, default)
+
+    def __getitem__(self, key):
+        return COOKIES[key]
+
+    def __setitem__(self, key, value):
+        COOKIES[key] = value
+
+    def save(self):
+        pass
+
+
+def install_cookie_jar():
+    module = types.ModuleType("streamlit_cookies_manager")
+    module.EncryptedCookieManager = CookieJar
+    sys.modules["streamlit_cookies_manager"] = module
+
+def reset_app_state():
+    # Process-wide caches would otherwise carry one run's data into the next
+    import streamlit as st
+    import api
+    from cache import board_cache
+    st.cache_data.clear()
+    board_cache.clear()
+    if api._client is not None:
+        api._client.close()
+    api._client = None
+    COOKIES.clear()
+
+def new_app(uid=None, page=None):
+    from streamlit.testing.v1 import AppTest
+    reset_app_state()
+    if uid is not None:
+        COOKIES.update({"authenticated": "True", "session": uid})
+    at = AppTest.from_string(APP_SCRIPT, default_timeout=RUN_TIMEOUT)
+    if page is not None:
+        at.session_state["page"] = page
+    return at
+
+def button(at, label):
+    return next(widget for widget in at.button if widget.label == label)
+
+def scenario_steps(name, uid):
+    # (prepare, measured): prepare builds the app and brings it to the state
+    # the scenario starts from; measured is the interaction being timed
+    if name == "login":
+        def prepare():
+            at = new_app().run()
+            at.text_input[0].input(uid)
+            return at
+        return prepare, lambda at: button(at, "Login").click().run()
+    if name == "personal_board":
+        return (lambda: new_app(uid, "personal_board")), lambda at: at.run()
+    if name == "team_board":
+        return (lambda: new_app(uid, "team_board")), lambda at: at.run()
+    if name == "edit_dialog":
+        return (lambda: new_app(uid, "team_board").run()), lambda at: button(at, "Edit Task").click().run()
+    raise ValueError(f"Unknown scenario: {name}")
+
+def run_scenario(stub, name, repeat):
+    uid = stub.data.users[BENCHMARK_USER_ID]["uid"]
+    prepare, measured = scenario_steps(name, uid)
+    walls = []
+    errors = []
+    for _ in range(repeat):
+        at = prepare()
+        stub.reset_metrics()
+        started = time.perf_counter()
+        at = measured(at)
+        walls.append((time.perf_counter() - started) * 1000)
+        errors = [str(exception.value) for exception in at.exception]
+        counts = stub.metrics()
+
+    # Memory in a separate run, since tracing slows everything down
+    at = prepare()
+    tracemalloc.start()
+    measured(at)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "wall_ms": round(statistics.median(walls), 1),
+        "requests": counts["requests"],
+        "bytes": counts["bytes"],
+        "peak_kb": round(peak / 1024),
+        "errors": errors,
+    }
+
+def run_benchmarks(sizes=DEFAULT_SIZES, scenarios=SCENARIOS, latency=DEFAULT_LATENCY, repeat=DEFAULT_REPEAT):
+    # The stub keeps one address for every size, so the client built from
+    # TASK_APP_BACKEND_URL keeps pointing at it
+    stub = StubBackend(StubData(tasks=0, teams=0), latency=latency).start()
+    os.environ["TASK_APP_BACKEND_URL"] = stub.url
+    # The change listener's own requests would blur the request counts
+    os.environ["TASK_APP_LIVE_UPDATES"] = "False"
+    results = []
+    try:
+        for tasks, teams in sizes:
+            stub.data = StubData(tasks=tasks, teams=teams)
+            for name in scenarios:
+                result = run_scenario(stub, name, repeat)
+                results.append(dict(result, scenario=name, tasks=tasks, teams=teams))
+                print(format_result(results[-1]), flush=True)
+    finally:
+        stub.stop()
+    return results
+
+def result_key(result):
+    return f"{result['scenario']}/{result['tasks']}x{result['teams']}"
+
+def format_result(result, baseline=None):
+    line = (
+        f"{result_key(result):<28} {result['wall_ms']:>9.1f} ms {result['requests']:>5} req "
+        f"{result['bytes'] / 1024:>10.1f} KB {result['peak_kb']:>8} KB peak"
+    )
+    if result['errors']:
+        line += f"  ERRORS: {'; '.join(result['errors'])}"
+    if baseline is not None:
+        line += "  " + " ".join(f"{metric} {change:+.0%}" for metric, change in changes(result, baseline).items())
+    return line
+
+def changes(result, baseline):
+    return {
+        metric: (result[metric] - baseline[metric]) / baseline[metric]
+        for metric in METRICS if baseline.get(metric)
+    }
+
+def compare(results, baseline_path=BASELINE_PATH, threshold=REGRESSION_THRESHOLD):
+    # Returns the regressions: results worse than the baseline by more than
+    # threshold on any metric
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None:
+            continue
+        print(format_result(result, previous))
+        worse = [metric for metric, change in changes(result, previous).items() if change > threshold]
+        if worse:
+            regressions.append(f"{result_key(result)}: {', '.join(worse)}")
+    return regressions
+
+def save_baseline(results, latency, baseline_path=BASELINE_PATH):
+    with open(baseline_path, "w") as f:
+        json.dump({"latency": latency, "python": sys.version.split()[0], "results": results}, f, indent=2)
+
+def parse_sizes(value):
+    return tuple(tuple(int(part) for part in size.split("x")) for size in value.split(","))
+
+if __name__ == "__main__":
+    # The app script imports this module by name; make that the running
+    # copy so both share COOKIES
+    sys.modules.setdefault("benchmark", sys.modules["__main__"])
+    parser = argparse.ArgumentParser(description="Benchmark the app against a stub backend")
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_SIZES, help="e.g. 1000x10,50000x50 (tasks x teams)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="seconds per stub request")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {BASELINE_PATH}")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline; exit 1 on regressions")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.scenarios.split(","), args.latency, args.repeat)
+    if args.save_baseline:
+        save_baseline(results, args.latency)
+    if args.compare:
+        regressions = compare(results)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,243 @@
+import copy
+import time
+from datetime import date, timedelta
+
+DEFAULT_MAX_AGE = 60
+
+STATUSES = ("Todo", "In Progress", "Done")
+GROUP_BYS = {
+    "status": "Status",
+    "tag": "Tag",
+    "assignee": "Assignee",
+    "due_week": "Due week",
+}
+NO_TAG = "No tag"
+UNASSIGNED = "Unassigned"
+NO_DUE_DATE = "No due date"
+
+
+def due_week(due_date):
+    # Bucket label plus a sort key, so weeks come out in calendar order
+    if not due_date:
+        return NO_DUE_DATE, date.max
+    day = date.fromisoformat(due_date)
+    monday = day - timedelta(days=day.weekday())
+    return f"Week of {monday.isoformat()}", monday
+
+
+class BoardIndex:
+    # Built once per board version in a single pass over the tasks. Holds one
+    # card per task with its display strings already joined, and the cards
+    # grouped by every supported group-by, so switching the grouping or
+    # rerunning the page never rescans the task list.
+
+    def __init__(self, tasks):
+        self.cards = []
+        self.groups = {group_by: {} for group_by in GROUP_BYS}
+        self._order = {"status": {status: i for i, status in enumerate(STATUSES)}, "due_week": {}}
+
+        for task in tasks:
+            tag_names = [tag['name'] for tag in task.get('tags') or []]
+            assignee_names = [assignee['username'] for assignee in task.get('assignees') or []]
+            week, week_start = due_week(task.get('due_date'))
+            card = {
+                'task': task,
+                'heading': f"{task['title']}\n\n {task['due_date']}",
+                'tags': ", ".join(tag_names),
+                'assignees': ", ".join(assignee_names),
+            }
+            self.cards.append(card)
+            self.groups["status"].setdefault(task['status'], []).append(card)
+            for name in tag_names or [NO_TAG]:
+                self.groups["tag"].setdefault(name, []).append(card)
+            for name in assignee_names or [UNASSIGNED]:
+                self.groups["assignee"].setdefault(name, []).append(card)
+            self.groups["due_week"].setdefault(week, []).append(card)
+            self._order["due_week"][week] = week_start
+
+    def __len__(self):
+        return len(self.cards)
+
+    def columns(self, group_by="status"):
+        # (label, cards) pairs in display order
+        groups = self.groups[group_by]
+        if group_by == "status":
+            # The three Kanban columns always show, even when empty
+            labels = list(STATUSES) + sorted(label for label in groups if label not in STATUSES)
+        elif group_by == "due_week":
+            labels = sorted(groups, key=self._order["due_week"].get)
+        else:
+            placeholder = NO_TAG if group_by == "tag" else UNASSIGNED
+            labels = sorted(label for label in groups if label != placeholder)
+            if placeholder in groups:
+                labels.append(placeholder)
+        return [(label, groups.get(label, [])) for label in labels]
+
+
+class BoardStore:
+    # Session-local copies of task boards, keyed like the read cache:
+    # ("tasks", uid) or ("team_tasks", team_id). Writes patch these copies in
+    # place before the request goes out; the undo log they return restores
+    # the previous state if the backend rejects the change.
+
+    def __init__(self, boards):
+        # boards is a plain dict kept in st.session_state
+        self._boards = boards
+
+    def _changed(self, key):
+        # Any mutation makes the cached index stale
+        self._boards[key]['index'] = None
+
+    def index(self, key):
+        entry = self._boards[key]
+        if entry.get('index') is None:
+            entry['index'] = BoardIndex(entry['tasks'])
+        return entry['index']
+
+    def get(self, key, max_age=DEFAULT_MAX_AGE):
+        entry = self._boards.get(key)
+        if entry is None or time.monotonic() - entry['loaded_at'] > max_age:
+            return None
+        return entry['tasks']
+
+    def entry(self, key):
+        # The board with its sync metadata, however old it is
+        return self._boards.get(key)
+
+    def put(self, key, tasks, watermark=None, etag=None, **extra):
+        # Copy so patches never leak into the process-wide read cache. extra
+        # holds per-board metadata such as a column page's next cursor.
+        self._boards[key] = dict(
+            extra,
+            tasks=copy.deepcopy(tasks),
+            loaded_at=time.monotonic(),
+            watermark=watermark,
+            etag=etag,
+            index=None,
+        )
+        return self._boards[key]['tasks']
+
+    def extend(self, key, tasks, **extra):
+        # Append the next page to a column page entry
+        entry = self._boards[key]
+        entry['tasks'].extend(copy.deepcopy(tasks))
+        entry.update(extra)
+        self._changed(key)
+        return entry['tasks']
+
+    def touch(self, key, etag=None):
+        entry = self._boards[key]
+        entry['loaded_at'] = time.monotonic()
+        if etag is not None:
+            entry['etag'] = etag
+        return entry['tasks']
+
+    def merge(self, key, changed, deleted, watermark, etag=None):
+        # Apply a delta sync: upsert changed tasks, drop deleted ids
+        entry = self._boards[key]
+        changed = {task['task_id']: copy.deepcopy(task) for task in changed}
+        deleted = set(deleted)
+        tasks = []
+        for task in entry['tasks']:
+            if task['task_id'] in deleted:
+                continue
+            tasks.append(changed.pop(task['task_id'], task))
+        tasks.extend(changed.values())
+        entry['tasks'][:] = tasks
+        entry['watermark'] = watermark or entry['watermark']
+        self._changed(key)
+        return self.touch(key, etag)
+
+    def drop(self, key):
+        self._boards.pop(key, None)
+
+    def expire(self, key):
+        # Kept for its watermark, but synced on the next read
+        entry = self._boards.get(key)
+        if entry is not None:
+            entry['loaded_at'] = float("-inf")
+
+    def board_keys(self):
+        return [key for key in self._boards if len(key) == 2]
+
+    def page_keys(self, key):
+        # Column pages and search results are stored under key + ("column", ...)
+        # and key + ("search", ...)
+        prefix = tuple(key)
+        return [page_key for page_key in self._boards if len(page_key) > len(prefix) and page_key[:len(prefix)] == prefix]
+
+    def drop_pages(self, key):
+        for page_key in self.page_keys(key):
+            del self._boards[page_key]
+
+    def drop_stale_pages(self, key, statuses, task_ids):
+        # After tasks changed elsewhere: the column pages of the statuses they
+        # left or entered, pages holding them, and every search result,
+        # since matches and their ranks may have moved
+        for page_key in self.page_keys(key):
+            stale = page_key[len(key)] == "search" or page_key[len(key) + 1] in statuses or any(
+                task['task_id'] in task_ids for task in self._boards[page_key]['tasks']
+            )
+            if stale:
+                del self._boards[page_key]
+
+    def find_on(self, key, task_id):
+        # The task as held by a board or any of its pages
+        for board_key in [key] + self.page_keys(key):
+            entry = self._boards.get(board_key)
+            for task in entry['tasks'] if entry else []:
+                if task['task_id'] == task_id:
+                    return task
+        return None
+
+    def _locate(self, task_id):
+        for key, entry in self._boards.items():
+            for index, task in enumerate(entry['tasks']):
+                if task['task_id'] == task_id:
+                    yield key, index, task
+
+    def find(self, task_id):
+        for _, _, task in self._locate(task_id):
+            return task
+        return None
+
+    def update(self, task_id, changes):
+        undo = []
+        for key, index, task in list(self._locate(task_id)):
+            patched = dict(task, **changes)
+            self._boards[key]['tasks'][index] = patched
+            self._changed(key)
+            undo.append((key, index, task, patched))
+        return undo
+
+    def remove(self, task_id):
+        undo = []
+        for key, index, task in reversed(list(self._locate(task_id))):
+            del self._boards[key]['tasks'][index]
+            self._changed(key)
+            undo.append((key, index, task, None))
+        return undo
+
+    def add(self, key, task):
+        entry = self._boards.get(key)
+        if entry is None:
+            return []
+        entry['tasks'].append(task)
+        self._changed(key)
+        return [(key, len(entry['tasks']) - 1, None, task)]
+
+    def restore(self, undo):
+        # Undo entries are (key, index, old, new): old=None means new was
+        # added, new=None means old was removed from index
+        for key, index, old, new in reversed(undo):
+            entry = self._boards.get(key)
+            if entry is None:
+                continue
+            tasks = entry['tasks']
+            self._changed(key)
+            if old is None:
+                tasks[:] = [task for task in tasks if task is not new]
+            elif new is None:
+                tasks.insert(index, old)
+            else:
+                tasks[:] = [old if task is new else task for task in tasks]
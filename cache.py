@@ -0,0 +1,516 @@
+import fnmatch
+import functools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from metrics import record_cache
+
+try:
+    import redis
+except ImportError:
+    # Only needed for the network backend
+    redis = None
+
+MISSING = object()
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 1024
+
+# Which store backs board_cache: "memory" keeps it in this process; "sqlite"
+# shares one file between every process on the host; "redis" shares a
+# network key-value server between hosts
+CACHE_BACKEND = os.environ.get("TASK_APP_CACHE_BACKEND", "memory")
+CACHE_PATH = os.environ.get("TASK_APP_CACHE_PATH", os.path.join(tempfile.gettempdir(), "task_app_cache.sqlite3"))
+CACHE_URL = os.environ.get("TASK_APP_CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_BYTES = int(os.environ.get("TASK_APP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# In front of a shared store each process keeps recent values for at most
+# LOCAL_TTL seconds, and checks for other processes' invalidations at most
+# every INVALIDATION_POLL_INTERVAL
+LOCAL_TTL = 30
+LOCAL_MAX_ENTRIES = 256
+INVALIDATION_POLL_INTERVAL = 0.5
+# How long invalidations are kept for processes that fall behind; one that
+# falls further behind drops all its local values
+INVALIDATION_RETENTION = 600
+# The shared store is checked for eviction every this many writes
+EVICTION_INTERVAL = 64
+SQLITE_TIMEOUT = 5
+
+# A store that fails makes the cache miss instead of failing the read
+STORE_ERRORS = (sqlite3.Error, OSError) + ((redis.RedisError,) if redis is not None else ())
+
+
+class Cache(ABC):
+    # A value fetched by cached() is stored only if no invalidation touched
+    # its key while the fetch ran; a fetch that read the rows before a write
+    # would otherwise store them after the write's invalidate().
+
+    def __init__(self):
+        # key -> [fetches in flight, generation]; invalidations bump the
+        # generation of the keys they touch
+        self._fetches = {}
+        self._fetches_lock = threading.Lock()
+
+    @abstractmethod
+    def lookup(self, key):
+        # (value, where): where is "local", "shared" or "miss"
+        ...
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        ...
+
+    def get(self, key):
+        return self.lookup(key)[0]
+
+    def cached(self, namespace, ttl=None):
+        # Memoize fn(*args) under (namespace, *args). Exceptions are not
+        # cached, so a failed fetch is retried on the next call.
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args):
+                key = (namespace, *args)
+                value, where = self.lookup(key)
+                record_cache(namespace, where)
+                if value is MISSING:
+                    generation = self._begin_fetch(key)
+                    try:
+                        value = fn(*args)
+                        with self._fetches_lock:
+                            if self._fetches[key][1] == generation:
+                                self.set(key, value, ttl)
+                    finally:
+                        self._end_fetch(key)
+                return value
+            return wrapper
+        return decorator
+
+    def _begin_fetch(self, key):
+        with self._fetches_lock:
+            fetch = self._fetches.setdefault(key, [0, 0])
+            fetch[0] += 1
+            return fetch[1]
+
+    def _end_fetch(self, key):
+        with self._fetches_lock:
+            fetch = self._fetches[key]
+            fetch[0] -= 1
+            if not fetch[0]:
+                del self._fetches[key]
+
+    def _bump(self, namespace=None, key=None):
+        # Called before the entries are dropped, so a fetch either sees the
+        # bump or stores its value before the drop. namespace None means
+        # everything, key None the whole namespace.
+        with self._fetches_lock:
+            for fetched, fetch in self._fetches.items():
+                if namespace is None or (fetched[0] == namespace and (key is None or fetched == key)):
+                    fetch[1] += 1
+
+
+class TTLCache(Cache):
+    # Process-wide LRU cache with a TTL per entry. Keys are tuples whose first
+    # item is a namespace ("tasks", "team_tasks", ...) so writes can drop
+    # exactly the keys they affect.
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, default_ttl=DEFAULT_TTL):
+        super().__init__()
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING, "miss"
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return MISSING, "miss"
+            self._entries.move_to_end(key)
+            return value, "local"
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace, *args):
+        self._bump(namespace, (namespace, *args))
+        with self._lock:
+            self._entries.pop((namespace, *args), None)
+
+    def invalidate_namespace(self, namespace):
+        self._bump(namespace)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def clear(self):
+        self._bump()
+        with self._lock:
+            self._entries.clear()
+
+
+def encode_key(key):
+    return json.dumps(list(key), separators=(",", ":"))
+
+def decode_key(key):
+    return tuple(json.loads(key))
+
+
+class SQLiteStore:
+    # Entries and an invalidation log in one SQLite file, for processes on
+    # the same host. WAL mode lets readers go on while one process writes.
+    # Entries beyond max_bytes are evicted oldest first.
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        # Cached reads include user records. SQLite gives the -wal and -shm
+        # files the database file's mode, so the file is created private
+        # before the first connection opens them.
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        except FileExistsError:
+            pass
+        db = self.connection()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                stored_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_cache_entries_namespace ON cache_entries (namespace);
+            CREATE INDEX IF NOT EXISTS ix_cache_entries_stored_at ON cache_entries (stored_at);
+            CREATE TABLE IF NOT EXISTS cache_invalidations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT,
+                key TEXT,
+                at REAL NOT NULL
+            );
+        """)
+
+    def connection(self):
+        # One connection per thread; sqlite3 connections are not shared
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        row = self.connection().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key, namespace, data, ttl):
+        now = time.time()
+        self.connection().execute(
+            "INSERT OR REPLACE INTO cache_entries (key, namespace, value, size, expires_at, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, data, len(data), now + ttl, now),
+        )
+        self._writes += 1
+        if self._writes % EVICTION_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        db = self.connection()
+        now = time.time()
+        db.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
+        db.execute(
+            "DELETE FROM cache_invalidations WHERE at < ? AND id < (SELECT MAX(id) FROM cache_invalidations)",
+            (now - INVALIDATION_RETENTION,),
+        )
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Down to 90% of the limit, so the next few writes do not evict again
+        excess = total - self.max_bytes * 0.9
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM cache_entries ORDER BY stored_at"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+
+    def delete(self, key):
+        self.connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def delete_namespace(self, namespace):
+        self.connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+    def clear(self):
+        self.connection().execute("DELETE FROM cache_entries")
+
+    def publish(self, namespace, key):
+        # namespace None means everything, key None the whole namespace
+        self.connection().execute(
+            "INSERT INTO cache_invalidations (namespace, key, at) VALUES (?, ?, ?)", (namespace, key, time.time())
+        )
+
+    def invalidations(self, after):
+        # (last id, [(namespace, key), ...]) after id after, or (last id,
+        # None) when some were already pruned
+        db = self.connection()
+        first_id, last_id = db.execute("SELECT MIN(id), MAX(id) FROM cache_invalidations").fetchone()
+        last_id = last_id or 0
+        if after is None or after >= last_id:
+            return last_id, []
+        if after + 1 < first_id:
+            return last_id, None
+        rows = db.execute(
+            "SELECT namespace, key FROM cache_invalidations WHERE id > ? AND id <= ? ORDER BY id", (after, last_id)
+        ).fetchall()
+        return last_id, rows
+
+
+class KVStore:
+    # Entries on a Redis-style key-value server shared by every replica. Only
+    # get, set with px, delete, incr, mget and scan_iter are used, so
+    # MemoryKV can stand in for the server. TTLs ride on each key, and
+    # eviction is the server's: run it with a maxmemory limit and an LRU
+    # policy.
+
+    def __init__(self, client, prefix="task_app:cache"):
+        self.client = client
+        self.prefix = prefix
+
+    def name(self, key, namespace):
+        return f"{self.prefix}:entry:{namespace}:{key}"
+
+    def get(self, key):
+        return self.client.get(self.name(key, decode_key(key)[0]))
+
+    def set(self, key, namespace, data, ttl):
+        self.client.set(self.name(key, namespace), data, px=int(ttl * 1000))
+
+    def delete(self, key):
+        self.client.delete(self.name(key, decode_key(key)[0]))
+
+    def delete_names(self, pattern):
+        names = list(self.client.scan_iter(match=pattern))
+        if names:
+            self.client.delete(*names)
+
+    def delete_namespace(self, namespace):
+        self.delete_names(f"{self.prefix}:entry:{glob_escape(namespace)}:*")
+
+    def clear(self):
+        self.delete_names(f"{self.prefix}:entry:*")
+
+    def publish(self, namespace, key):
+        sequence = self.client.incr(f"{self.prefix}:invalidation")
+        self.client.set(f"{self.prefix}:invalidation:{sequence}", json.dumps([namespace, key]), px=INVALIDATION_RETENTION * 1000)
+
+    def invalidations(self, after):
+        last_id = int(self.client.get(f"{self.prefix}:invalidation") or 0)
+        if after is None or after >= last_id:
+            return last_id, []
+        names = [f"{self.prefix}:invalidation:{sequence}" for sequence in range(after + 1, last_id + 1)]
+        values = self.client.mget(names)
+        if any(value is None for value in values):
+            return last_id, None
+        return last_id, [tuple(json.loads(value)) for value in values]
+
+
+def glob_escape(text):
+    return "".join(f"[{char}]" if char in "*?[]" else char for char in text)
+
+
+class MemoryKV:
+    # In-process stand-in for a Redis client, with just the calls KVStore
+    # makes; for tests and local runs without a server
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES * 16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[name]
+            return None
+        self._entries.move_to_end(name)
+        return value
+
+    def get(self, name):
+        with self._lock:
+            return self._live(name)
+
+    def mget(self, names):
+        with self._lock:
+            return [self._live(name) for name in names]
+
+    def set(self, name, value, px=None):
+        with self._lock:
+            self._entries[name] = (time.monotonic() + px / 1000 if px else None, value)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._entries.pop(name, None) is not None for name in names)
+
+    def incr(self, name):
+        with self._lock:
+            value = int(self._live(name) or 0) + 1
+            self._entries[name] = (None, str(value).encode())
+            return value
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            names = list(self._entries)
+        return [name for name in names if fnmatch.fnmatchcase(name, match)]
+
+
+class SharedCache(Cache):
+    # TTLCache's interface over a store shared between processes. Values go
+    # to the store as JSON, so one process's fetch serves every other, and
+    # the more replicas there are the more of their reads are hits. Hot
+    # values are also kept briefly in this process so a hit does not decode
+    # the value again; invalidations are logged in the store, and each
+    # process drops its own copies of what others invalidated.
+
+    def __init__(self, store, default_ttl=DEFAULT_TTL, local_ttl=LOCAL_TTL, local_max_entries=LOCAL_MAX_ENTRIES):
+        super().__init__()
+        self.store = store
+        self.default_ttl = default_ttl
+        self.local = TTLCache(max_entries=local_max_entries, default_ttl=local_ttl)
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        try:
+            self._seen = store.invalidations(None)[0]
+        except STORE_ERRORS:
+            self._seen = None
+
+    def sync(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < INVALIDATION_POLL_INTERVAL:
+                return
+            self._checked_at = now
+            try:
+                seen, invalidations = self.store.invalidations(self._seen)
+            except STORE_ERRORS:
+                return
+            if self._seen is None:
+                # The store was unreachable until now; anything may have changed
+                invalidations = None
+            self._seen = seen
+        if invalidations is None:
+            self._bump()
+            self.local.clear()
+            return
+        for namespace, key in invalidations:
+            if namespace is None:
+                self._bump()
+                self.local.clear()
+            elif key is None:
+                self._bump(namespace)
+                self.local.invalidate_namespace(namespace)
+            else:
+                self._bump(namespace, decode_key(key))
+                self.local.invalidate(*decode_key(key))
+
+    def lookup(self, key):
+        self.sync()
+        value, where = self.local.lookup(key)
+        if value is not MISSING:
+            return value, where
+        try:
+            data = self.store.get(encode_key(key))
+        except STORE_ERRORS:
+            data = None
+        if data is None:
+            return MISSING, "miss"
+        try:
+            value = json.loads(data)
+        except ValueError:
+            # A corrupt entry is dropped, so the next fetch replaces it
+            try:
+                self.store.delete(encode_key(key))
+            except STORE_ERRORS:
+                pass
+            return MISSING, "miss"
+        self.local.set(key, value)
+        return value, "shared"
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.local.set(key, value, min(ttl, self.local.default_ttl))
+        try:
+            data = json.dumps(value, separators=(",", ":")).encode()
+        except TypeError:
+            # Not JSON; cached in this process only
+            return
+        try:
+            self.store.set(encode_key(key), key[0], data, ttl)
+        except STORE_ERRORS:
+            pass
+
+    def _broadcast(self, drop, namespace, key):
+        try:
+            drop()
+            self.store.publish(namespace, key)
+        except STORE_ERRORS:
+            pass
+
+    def invalidate(self, namespace, *args):
+        key = encode_key((namespace, *args))
+        self._bump(namespace, (namespace, *args))
+        self.local.invalidate(namespace, *args)
+        self._broadcast(lambda: self.store.delete(key), namespace, key)
+
+    def invalidate_namespace(self, namespace):
+        self._bump(namespace)
+        self.local.invalidate_namespace(namespace)
+        self._broadcast(lambda: self.store.delete_namespace(namespace), namespace, None)
+
+    def clear(self):
+        self._bump()
+        self.local.clear()
+        self._broadcast(self.store.clear, None, None)
+
+
+def make_cache(backend=CACHE_BACKEND, default_ttl=DEFAULT_TTL):
+    if backend == "memory":
+        return TTLCache(default_ttl=default_ttl)
+    if backend == "sqlite":
+        return SharedCache(SQLiteStore(CACHE_PATH, CACHE_MAX_BYTES), default_ttl=default_ttl)
+    if backend == "redis":
+        if redis is None:
+            raise ImportError("TASK_APP_CACHE_BACKEND=redis needs the redis package")
+        return SharedCache(KVStore(redis.Redis.from_url(CACHE_URL)), default_ttl=default_ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+board_cache = make_cache()
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from collections import deque
+
+# Task change notifications for live boards. Writes publish one change per
+# task: {"op": "upsert" | "delete" | "bulk", "task_id", "team_id",
+# "user_ids", "statuses", "updated_at"}, where user_ids are the creator and
+# assignees whose personal boards show the task and statuses are the
+# columns it left or entered. Subscribers read them through a long-poll
+# request or a server-sent events stream, each change tagged with the
+# boards of theirs it touches. Changes only say which tasks moved; clients
+# fetch the tasks themselves with a delta board read.
+#
+# The feed lives in the backend process. A backend running several
+# processes needs its changes relayed between them.
+FEED_SIZE = 10000
+LONG_POLL_TIMEOUT = 25
+MAX_LONG_POLL_TIMEOUT = 55
+# Comment lines keep idle streams open through proxies, and let the server
+# notice clients that went away
+HEARTBEAT_INTERVAL = 15
+RECONNECT_DELAY_MS = 3000
+EVENT_STREAM_TYPE = "text/event-stream"
+# Sent when a subscriber has missed changes that already left the feed;
+# it has to reload every board
+RESET = {"op": "reset", "task_id": None, "boards": None}
+
+
+class ChangeFeed:
+    # Bounded, in order, with consecutive ids; readers block in wait until a
+    # change after the id they last saw is published
+
+    def __init__(self, size=FEED_SIZE):
+        self._changes = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self.last_id = 0
+
+    def publish(self, changes):
+        with self._condition:
+            for change in changes:
+                self.last_id += 1
+                self._changes.append(dict(change, id=self.last_id))
+            self._condition.notify_all()
+
+    def _after(self, after):
+        # None when changes after `after` have been dropped, or when after is
+        # from before a restart
+        if after > self.last_id:
+            return None
+        first_id = self._changes[0]["id"] if self._changes else self.last_id + 1
+        if after + 1 < first_id:
+            return None
+        return list(self._changes)[after + 1 - first_id:]
+
+    def wait(self, after, timeout):
+        # The changes after id `after`, waiting up to timeout seconds for one
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.last_id == after:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._after(after)
+
+
+feed = ChangeFeed()
+
+
+def task_change(op, task_id, team_id, user_ids, statuses, updated_at=None):
+    return {
+        "op": op,
+        "task_id": task_id,
+        "team_id": team_id,
+        "user_ids": sorted(user_id for user_id in set(user_ids) if user_id is not None),
+        "statuses": sorted(status for status in set(statuses) if status),
+        "updated_at": updated_at,
+    }
+
+def change_scope(uid, user_id, team_ids):
+    # Whose changes a subscriber gets: their personal board and their teams'
+    return {"uid": uid, "user_id": user_id, "team_ids": set(team_ids)}
+
+def scoped_changes(changes, scope):
+    # The changes that touch the subscriber's boards, with those boards named
+    # the way the client keys them
+    scoped = []
+    for change in changes:
+        boards = []
+        if change["team_id"] is not None and change["team_id"] in scope["team_ids"]:
+            boards.append(["team_tasks", change["team_id"]])
+        if scope["user_id"] in change["user_ids"]:
+            boards.append(["tasks", scope["uid"]])
+        if boards:
+            scoped.append(dict({key: change[key] for key in ("id", "op", "task_id", "statuses", "updated_at")}, boards=boards))
+    return scoped
+
+def poll_changes(scope, after=None, timeout=LONG_POLL_TIMEOUT, changes=feed):
+    # Long poll: returns (status_code, body, headers) with
+    # {"changes": [...], "last_event_id": id} as soon as one of the
+    # subscriber's changes arrives, or empty after timeout. Without after
+    # it only returns the current id to read from.
+    if scope is None:
+        return 404, {"detail": "User not found"}, {}
+    if after is None:
+        return 200, {"changes": [], "last_event_id": changes.last_id}, {}
+    deadline = time.monotonic() + min(timeout, MAX_LONG_POLL_TIMEOUT)
+    while True:
+        published = changes.wait(after, max(deadline - time.monotonic(), 0))
+        if published is None:
+            return 200, {"changes": [dict(RESET, id=changes.last_id)], "last_event_id": changes.last_id}, {}
+        if published:
+            after = published[-1]["id"]
+        matched = scoped_changes(published, scope)
+        if matched or time.monotonic() >= deadline:
+            return 200, {"changes": matched, "last_event_id": after}, {}
+
+def format_event(change):
+    return f"id: {change['id']}\nevent: change\ndata: {json.dumps(change, separators=(',', ':'))}\n\n"
+
+def event_stream(scope, after, changes=feed, heartbeat=HEARTBEAT_INTERVAL):
+    # Server-sent events, forever; the HTTP layer stops iterating when the
+    # client disconnects
+    yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+    while True:
+        published = changes.wait(after, heartbeat)
+        if published is None:
+            after = changes.last_id
+            yield format_event(dict(RESET, id=after))
+        elif not published:
+            yield ": heartbeat\n\n"
+        else:
+            after = published[-1]["id"]
+            for change in scoped_changes(published, scope):
+                yield format_event(change)
+
+def stream_changes(scope, last_event_id=None, changes=feed):
+    # Returns (status_code, body, headers) with body an iterator of event
+    # text. Last-Event-ID resumes a dropped stream where it left off.
+    if scope is None:
+        return 404, {"detail": "User not found"}, {}
+    try:
+        after = int(last_event_id) if last_event_id else changes.last_id
+    except ValueError:
+        return 400, {"detail": "Invalid Last-Event-ID"}, {}
+    headers = {"Content-Type": EVENT_STREAM_TYPE, "Cache-Control": "no-cache"}
+    return 200, event_stream(scope, after, changes), headers
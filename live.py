@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from collections import deque
+import requests
+from api import BackendClient, BackendError, get_client
+from cache import board_cache
+from changes import LONG_POLL_TIMEOUT, RESET
+
+# Pushed board updates. One listener thread per user and process holds the
+# backend's change stream, or long-polls when the backend has none, and
+# hands each change to the inboxes of that user's sessions. Changes drop
+# the process-wide cached copies of the boards they touch as they arrive;
+# each session applies them to its own boards when it drains its inbox.
+
+# A session that has not drained its inbox for this long has gone away
+INBOX_IDLE_TIMEOUT = 120
+# Past this many undrained changes a session reloads its boards instead
+MAX_PENDING_CHANGES = 500
+MAX_RETRY_DELAY = 30
+
+
+def parse_events(lines):
+    # Server-sent events from decoded lines. Yields the decoded data of each
+    # event, and None for each comment line so idle streams can be checked
+    # on between heartbeats.
+    data = []
+    for line in lines:
+        if line.startswith(":"):
+            yield None
+        elif not line:
+            if data:
+                yield json.loads("\n".join(data))
+            data = []
+        else:
+            field, _, value = line.partition(":")
+            if field == "data":
+                data.append(value[1:] if value.startswith(" ") else value)
+
+
+class Inbox:
+    # Changes waiting for one session; drained by its script thread
+
+    def __init__(self, uid):
+        self.uid = uid
+        self._changes = deque()
+        self._overflowed = False
+        self._lock = threading.Lock()
+        self.drained_at = time.monotonic()
+
+    def put(self, changes):
+        with self._lock:
+            if self._overflowed:
+                return
+            self._changes.extend(changes)
+            if len(self._changes) > MAX_PENDING_CHANGES:
+                self._changes.clear()
+                self._overflowed = True
+
+    def drain(self):
+        with self._lock:
+            self.drained_at = time.monotonic()
+            changes = [dict(RESET)] if self._overflowed else list(self._changes)
+            self._changes.clear()
+            self._overflowed = False
+            return changes
+
+    def idle(self):
+        return time.monotonic() - self.drained_at > INBOX_IDLE_TIMEOUT
+
+
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class ChangeListener(threading.Thread):
+    def __init__(self, uid):
+        super().__init__(name=f"changes-{uid}", daemon=True)
+        self.uid = uid
+        self.inboxes = set()
+        self.last_event_id = None
+        self.streaming = True
+
+    def run(self):
+        # Its own connection: a held stream would otherwise sit in the
+        # shared client's pool
+        client = BackendClient(get_client().base_url, pool_size=1)
+        failures = 0
+        try:
+            while self.keep_running():
+                try:
+                    if self.streaming:
+                        self.read_stream(client)
+                    else:
+                        self.read_poll(client)
+                    failures = 0
+                except BackendError as e:
+                    if e.status_code == 404 and self.streaming:
+                        # No event stream on this backend
+                        self.streaming = False
+                        continue
+                    failures += 1
+                except (requests.RequestException, ValueError, KeyError):
+                    failures += 1
+                if failures:
+                    time.sleep(min(2 ** failures, MAX_RETRY_DELAY))
+        finally:
+            client.close()
+
+    def keep_running(self):
+        # Forgets the inboxes of sessions that went away, and stops with the
+        # last one
+        with _listeners_lock:
+            self.inboxes = {inbox for inbox in self.inboxes if not inbox.idle()}
+            if self.inboxes:
+                return True
+            if _listeners.get(self.uid) is self:
+                del _listeners[self.uid]
+            return False
+
+    def read_stream(self, client):
+        response = client.stream_changes(self.uid, self.last_event_id)
+        with response:
+            if response.status_code != 200:
+                raise BackendError(f"Failed to open the change stream. Error {response.status_code}", response.status_code)
+            # One byte at a time, or a small event would wait for a full chunk
+            for change in parse_events(response.iter_lines(chunk_size=1, decode_unicode=True)):
+                if change is not None:
+                    self.dispatch([change])
+                if not self.keep_running():
+                    return
+
+    def read_poll(self, client):
+        response = client.get_changes(self.uid, self.last_event_id, LONG_POLL_TIMEOUT)
+        if response.status_code != 200:
+            raise BackendError(f"Failed to read changes. Error {response.status_code}", response.status_code)
+        body = response.json()
+        self.dispatch(body["changes"])
+        self.last_event_id = body["last_event_id"]
+
+    def dispatch(self, changes):
+        for change in changes:
+            if change["boards"] is None:
+                board_cache.invalidate_namespace("tasks")
+                board_cache.invalidate_namespace("team_tasks")
+            for namespace, key in change["boards"] or []:
+                board_cache.invalidate(namespace, key)
+            self.last_event_id = change.get("id", self.last_event_id)
+        with _listeners_lock:
+            inboxes = list(self.inboxes)
+        for inbox in inboxes:
+            inbox.put(changes)
+
+
+def listen(inbox):
+    # Attaches a session's inbox to its user's listener, starting one if
+    # there is none. Sessions call this on every check, so a listener that
+    # stopped while they were away comes back.
+    with _listeners_lock:
+        listener = _listeners.get(inbox.uid)
+        if listener is None:
+            listener = _listeners[inbox.uid] = ChangeListener(inbox.uid)
+            listener.start()
+        listener.inboxes.add(inbox)
@@ -5,334 +5,982 @@ from streamlit_cookies_manager import EncryptedCookieManager
 import json
 from datetime import datetime
 import re
+from api import get_client, BackendError, parse_board_response, parse_page_response, read_body
+from utils import fan_out
+from cache import board_cache
+from board import BoardStore, GROUP_BYS, STATUSES
+from live import Inbox, listen
+from metrics import Registry, instrumented, record_error, registry, serve_metrics, session_registry, timed
+import time
+import uuid
+from functools import wraps
 
 st.set_page_config(page_title="Tasuko", page_icon="🪨", layout = "wide", initial_sidebar_state="collapsed")
 
-AUTH_ENDPOINT = "http://localhost:8000/auth"
-TASKS_ENDPOINT = "http://localhost:8000/tasks"
-TEAM_TASKS_ENDPOINT = "http://localhost:8000/team-tasks"
-TEAM_ENDPOINT = "http://localhost:8000/teams"
-USER_ENDPOINT = "http://localhost:8000/user"
+# Show the session's timings under every page
+DEBUG_PANEL = os.environ.get("TASK_APP_DEBUG_PANEL", "False") == "True"
+# Serve the process-wide metrics at /metrics on this port for a local scraper
+METRICS_PORT = os.environ.get("TASK_APP_METRICS_PORT")
+if METRICS_PORT:
+    serve_metrics(int(METRICS_PORT))
 
-# Initialize the encrypted cookie manager
-cookies = EncryptedCookieManager(
-    prefix="ktosiek/streamlit-cookies-manager/",
-    password=os.environ.get("COOKIES_PASSWORD", "My secret password"),
-)
+def bind_session_metrics():
+    # Everything this run records also goes to the session's registry.
+    # Streamlit starts a new script thread for every rerun, fragment reruns
+    # included, so each one binds it again.
+    session_registry.set(st.session_state.setdefault('metrics', Registry()))
 
-if not cookies.ready():
+def session_metrics(fn):
+    # For fragments, whose reruns skip the top of the script
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        bind_session_metrics()
+        return fn(*args, **kwargs)
+    return wrapper
+
+bind_session_metrics()
+
+with timed("cookies"):
+    # Initialize the encrypted cookie manager
+    cookies = EncryptedCookieManager(
+        prefix="ktosiek/streamlit-cookies-manager/",
+        password=os.environ.get("COOKIES_PASSWORD", "My secret password"),
+    )
+    cookies_ready = cookies.ready()
+
+if not cookies_ready:
     # Wait for the component to load and send us current cookies.
     st.stop()
 
-@st.cache_data
+TEAM_FETCH_WORKERS = 8
+# Only fetch and render the selected team's board; the others load when picked
+LAZY_TEAM_TABS = os.environ.get("TASK_APP_LAZY_TEAM_TABS", "True") == "True"
+
+# Cache TTLs in seconds; writes invalidate the affected keys right away
+TASKS_CACHE_TTL = 60
+TEAMS_CACHE_TTL = 600
+TEAM_MEMBERS_CACHE_TTL = 600
+TAGS_CACHE_TTL = 600
+AUTH_CACHE_TTL = 600
+# Session boards are patched locally on writes and only reconciled with the
+# backend after this many seconds or when the user hits Refresh
+BOARD_RECONCILE_INTERVAL = 60
+
+# Cards rendered per column before a "Load more" button; render cost is
+# bounded by this rather than by the size of the board
+COLUMN_PAGE_SIZE = 20
+# Columns that only show their count until expanded
+COLLAPSED_COLUMNS = ("Done",)
+# Status columns fetch their own filtered, keyset-paginated pages from the
+# backend instead of splitting a downloaded board
+SERVER_PAGED_COLUMNS = os.environ.get("TASK_APP_SERVER_PAGED_COLUMNS", "True") == "True"
+TASK_SORTS = {"due_date": "Due date", "updated_at": "Recently updated"}
+SEARCH_PAGE_SIZE = 20
+# Apply changes pushed by the backend to open boards, checking for them
+# every LIVE_CHECK_INTERVAL seconds
+LIVE_UPDATES = os.environ.get("TASK_APP_LIVE_UPDATES", "True") == "True"
+LIVE_CHECK_INTERVAL = 2
+# Read boards from a local mirror the backend is synced into in the
+# background, and queue writes there instead of waiting for the backend
+LOCAL_FIRST = os.environ.get("TASK_APP_LOCAL_FIRST", "False") == "True"
+
+# Cookie holding the session token (the user's uid)
+SESSION_COOKIE = "session"
+# Older sessions stored the whole user JSON here
+LEGACY_USER_COOKIE = "user_data"
+
+@board_cache.cached("auth", ttl=AUTH_CACHE_TTL)
+def fetch_login(uid):
+    response = get_client().auth(uid)
+    if response.status_code >= 500:
+        # Not an answer about the uid, so not cached
+        raise BackendError(f"Authentication unavailable. Error {response.status_code}", response.status_code)
+    if response.status_code == 200:
+        user_data = response.json()
+        user_data['uid'] = uid  # Ensure 'uid' is set in user_data
+        return True, user_data
+    return False, None
+
 def login_user(uid):
     try:
-        response = requests.post(AUTH_ENDPOINT, json={"uid": uid})
-        if response.status_code == 200:
-            user_data = response.json()
-            user_data['uid'] = uid  # Ensure 'uid' is set in user_data
-            return True, user_data
-        else:
-            return False, None
+        auth_status, user_data = fetch_login(uid)
+        return auth_status, user_data
+    except BackendError:
+        return False, None
     except requests.RequestException as e:
-        st.error(f"Request error: {e}")
+        show_error(f"Request error: {e}")
         return False, None
 
 def save_user_data(user_data):
-    user_data_str = json.dumps(user_data)
+    # The cookie only carries the uid; the full user lives in the session
     cookies["authenticated"] = "True"
-    cookies["user_data"] = user_data_str
+    cookies[SESSION_COOKIE] = user_data['uid']
+    cookies[LEGACY_USER_COOKIE] = ""
     cookies.save()
+    st.session_state.user_context = user_data
 
 def logout():
     cookies["authenticated"] = ""
-    cookies["user_data"] = ""
+    cookies[SESSION_COOKIE] = ""
+    cookies[LEGACY_USER_COOKIE] = ""
     cookies.save()
+    mirror = st.session_state.pop('mirror', None)
+    if mirror is not None:
+        mirror.close()
+    for key in ('user_context', 'boards', 'team_members', 'bootstrap', 'live_inbox', 'mirror_versions'):
+        st.session_state.pop(key, None)
     st.rerun()
 
 def is_authenticated():
     return cookies.get("authenticated", "False") == "True"
 
-def get_user_data():
-    user_data_str = cookies.get("user_data", None)
+def is_valid_user_data(user_data):
+    return isinstance(user_data, dict) and bool(user_data.get('uid')) and 'username' in user_data
+
+@instrumented("load_user_context")
+def load_user_context():
+    uid = cookies.get(SESSION_COOKIE, None)
+    if uid:
+        auth_status, user_data = login_user(uid)
+        return user_data if auth_status else None
+
+    # Sessions from before the token cookie still carry the whole user as JSON
+    user_data_str = cookies.get(LEGACY_USER_COOKIE, None)
     if user_data_str:
-        return json.loads(user_data_str)
+        try:
+            user_data = json.loads(user_data_str)
+        except ValueError:
+            return None
+        if is_valid_user_data(user_data):
+            save_user_data(user_data)
+            return user_data
     return None
 
-def get_tasks(uid):
-    try:
-        url = f"{TASKS_ENDPOINT}/{uid}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to retrieve tasks. Error {response.status_code}")
+def get_user_data():
+    # Decoded once per session; save_user_data and logout keep it in step
+    # with the cookie
+    if st.session_state.get('user_context') is None:
+        user_data = load_user_context()
+        if not is_valid_user_data(user_data):
             return None
-    except requests.RequestException as e:
-        st.error(f"Request error: {e}")
+        st.session_state.user_context = user_data
+    return st.session_state.user_context
+
+@board_cache.cached("tasks", ttl=TASKS_CACHE_TTL)
+def fetch_tasks(uid):
+    return parse_board_response(get_client().get_tasks(uid), "tasks")
+
+def invalidate_task_caches(uid=None, team_id=None):
+    # Drop only the boards a task write can change. Column pages are small,
+    # so they are refetched rather than patched into the right column.
+    if uid is not None:
+        board_cache.invalidate("tasks", uid)
+        board_cache.invalidate("tags", uid)
+        get_board_store().drop_pages(("tasks", uid))
+    if team_id is not None:
+        board_cache.invalidate("team_tasks", team_id)
+        board_cache.invalidate("team_tags", team_id)
+        get_board_store().drop_pages(("team_tasks", team_id))
+
+def current_uid():
+    user_data = get_user_data()
+    return user_data.get('uid') if user_data else None
+
+def get_board_store():
+    return BoardStore(st.session_state.setdefault('boards', {}))
+
+def fetch_board_update(namespace, key, entry):
+    # Network half of a board sync, safe to run off the script thread. A board
+    # we already hold only asks for changes since its watermark, and a 304
+    # when nothing changed; a new board comes from the shared read cache.
+    if entry is None:
+        return fetch_tasks(key) if namespace == "tasks" else fetch_team_tasks(key)
+    client = get_client()
+    read = client.get_tasks if namespace == "tasks" else client.get_team_tasks
+    response = read(key, since=entry['watermark'], etag=entry['etag'])
+    return parse_board_response(response, "tasks" if namespace == "tasks" else "team tasks")
+
+def apply_board_update(namespace, key, update):
+    store = get_board_store()
+    board_key = (namespace, key)
+    if update['mode'] == "unchanged":
+        return store.touch(board_key, update['etag'])
+    if update['mode'] == "delta":
+        return store.merge(board_key, update['tasks'], update['deleted'], update['watermark'], update['etag'])
+    return store.put(board_key, update['tasks'], update['watermark'], update['etag'])
+
+def load_full_board(board_key):
+    namespace, key = board_key
+    store = get_board_store()
+    mirror = get_mirror()
+    if mirror is not None:
+        # Kept until the mirror's copy moves on; see sync_board_from_mirror
+        entry = store.entry(board_key)
+        if entry is not None:
+            return entry['tasks']
+        try:
+            load_mirrored_board(mirror, board_key)
+        except (BackendError, requests.RequestException) as e:
+            show_error(describe_error(e))
+            return None
+        with timed("mirror_read"):
+            return store.put(board_key, mirror.read_board(board_key))
+    tasks = store.get(board_key, max_age=BOARD_RECONCILE_INTERVAL)
+    if tasks is None:
+        try:
+            update = fetch_board_update(namespace, key, store.entry(board_key))
+        except (BackendError, requests.RequestException) as e:
+            show_error(describe_error(e))
+            return None
+        tasks = apply_board_update(namespace, key, update)
+    return tasks
+
+def server_paging_enabled():
+    return SERVER_PAGED_COLUMNS and get_client().supports_paging
+
+def backend_team_boards():
+    # Whether team pages download whole team boards: not when columns page
+    # on the server, nor when boards come from the mirror
+    return not server_paging_enabled() and get_mirror() is None
+
+def get_mirror():
+    # The session's local-first mirror, or None when boards read from the
+    # backend. It needs the user's id, which not every auth answer carries.
+    if not LOCAL_FIRST:
         return None
-    
-def update_task(task_id, updated_task):
+    user_data = get_user_data()
+    if not user_data or user_data.get('user_id') is None:
+        return None
+    # Only imported when enabled: the mirror brings in SQLAlchemy and the
+    # backend's models, whose session listeners are process-wide
+    from mirror import LocalMirror
+    mirror = st.session_state.get('mirror')
+    if mirror is None or mirror.uid != user_data['uid']:
+        if mirror is not None:
+            mirror.close()
+        mirror = st.session_state.mirror = LocalMirror(user_data['uid'], user_data['user_id'], user_data['username'])
+    mirror.touch()
+    mirror.start()
+    return mirror
+
+def load_mirrored_board(mirror, board_key):
+    # A board's first visit reads it from the backend; from then on the
+    # mirror's worker keeps it in step
+    if not mirror.has_board(board_key):
+        with timed("mirror_pull"):
+            mirror.pull_board(board_key)
+        # Everything read from here on already reflects this pull
+        st.session_state.setdefault('mirror_versions', {})[tuple(board_key)] = mirror.version(board_key)
+
+def read_mirrored_page(mirror, board_key, params):
+    # Shaped like parse_page_response
+    load_mirrored_board(mirror, board_key)
+    with timed("mirror_read"):
+        status_code, page, _ = mirror.read_page(board_key, **params)
+    if status_code != 200:
+        raise BackendError(f"Failed to retrieve tasks: {page['detail']}", status_code)
+    return dict(page, paged=True)
+
+def sync_board_from_mirror(mirror, board_key):
+    # The session's copies of a board are read again once the mirror's has
+    # changed, by a local write or by the worker
+    versions = st.session_state.setdefault('mirror_versions', {})
+    version = mirror.version(board_key)
+    if versions.get(tuple(board_key)) != version:
+        get_board_store().drop(board_key)
+        get_board_store().drop_pages(board_key)
+        versions[tuple(board_key)] = version
+
+def mirror_changed(mirror):
+    versions = st.session_state.get('mirror_versions', {})
+    return any(versions.get(board_key) != mirror.version(board_key) for board_key in st.session_state.get('shown_boards', ()))
+
+def render_sync_status(mirror):
+    for message in mirror.take_rejected():
+        show_error(f"The backend refused a change, so the board was reloaded. {message}")
+    pending, error = mirror.status()
+    if pending and error:
+        st.caption(f"⚠ Backend unavailable: {pending} changes are saved here and will sync when it is back.")
+    elif pending:
+        st.caption(f"⟳ Syncing {pending} changes…")
+
+def column_page_key(board_key, status, filters):
+    return tuple(board_key) + ("column", status, json.dumps(filters, sort_keys=True))
+
+def load_column_page(board_key, page_key, status, filters, cursor=None):
+    namespace, key = board_key
+    client = get_client()
+    read = client.get_task_page if namespace == "tasks" else client.get_team_task_page
+    params = dict(filters, status=status, limit=COLUMN_PAGE_SIZE)
+    if cursor:
+        params['cursor'] = cursor
+    mirror = get_mirror()
     try:
-        url = f"{TASKS_ENDPOINT}/{task_id}"
-        response = requests.put(url, json=updated_task)
-        if response.status_code == 200:
-            st.success("Task updated successfully.")
-            return True
+        if mirror is not None:
+            page = read_mirrored_page(mirror, board_key, params)
         else:
-            st.error(f"Failed to update task. Error {response.status_code}")
-            return False
-    except requests.RequestException as e:
-        st.error(f"Request error: {e}")
+            page = parse_page_response(read(key, **params), "tasks")
+    except (BackendError, requests.RequestException) as e:
+        show_error(describe_error(e))
         return False
 
+    store = get_board_store()
+    if not page['paged']:
+        # The backend sent the whole board; keep it and switch this process
+        # back to full-board columns
+        client.supports_paging = False
+        store.put(board_key, page['tasks'])
+        st.rerun()
+    if cursor:
+        store.extend(page_key, page['tasks'], next_cursor=page['next_cursor'], total=page['total'])
+    else:
+        store.put(page_key, page['tasks'], next_cursor=page['next_cursor'], total=page['total'])
+    return True
+
+def refresh_board(namespace, key):
+    # Full reconciliation on demand: drop both the session copy and the cache
+    get_board_store().drop((namespace, key))
+    get_board_store().drop_pages((namespace, key))
+    board_cache.invalidate(namespace, key)
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.forget_board((namespace, key))
+    if namespace == "team_tasks" and 'bootstrap' in st.session_state:
+        # Members and team names come up to date on the next bootstrap sync
+        st.session_state.bootstrap['loaded_at'] = float("-inf")
+
+def local_task_changes(task, payload, members=None):
+    # Translate a write payload into the shape the board renders
+    changes = {field: payload[field] for field in ("title", "description", "status", "due_date") if field in payload}
+    if 'tags' in payload:
+        known_tags = {tag['name']: tag for tag in task.get('tags', [])}
+        changes['tags'] = [known_tags.get(name, {'name': name}) for name in payload['tags']]
+    if 'assignee' in payload and members is not None:
+        members_by_id = {member['user_id']: member for member in members}
+        changes['assignees'] = [members_by_id[user_id] for user_id in payload['assignee'] if user_id in members_by_id]
+    return changes
+
+def send_task_write(undo, send, expected_status=200):
+    # The board was already patched; roll the patch back if the write fails
+    try:
+        response = send()
+    except requests.RequestException:
+        get_board_store().restore(undo)
+        raise
+    if response.status_code != expected_status:
+        get_board_store().restore(undo)
+    return response
+    
+@instrumented("create_task")
 def create_task(uid):
     user_data = get_user_data()
     if user_data and 'uid' in user_data:  # Ensure 'uid' is present in user_data
-        tasks = get_tasks(user_data['uid'])
-        if tasks:
-
-            # Organize tasks by status
-            todo_tasks = [task for task in tasks if task['status'] == 'Todo']
-            in_progress_tasks = [task for task in tasks if task['status'] == 'In Progress']
-            done_tasks = [task for task in tasks if task['status'] == 'Done']
-            
-            # Display tasks in columns
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.subheader("Todo")
-                for task in todo_tasks:
-                    display_task(task)
-            
-            with col2:
-                st.subheader("In Progress")
-                for task in in_progress_tasks:
-                    display_task(task)
-            
-            with col3:
-                st.subheader("Done")
-                for task in done_tasks:
-                    display_task(task)
-        else:
-            st.warning("No tasks found.")
+        render_board(("tasks", user_data['uid']))
     else:
-        st.error("User data or 'uid' not found.")
-        
-def display_task(task):
-    with st.expander(f"{task['title']}\n\n {task['due_date']}"):
-        st.write(f"{task['description']}")
-        st.write(f"Status: {task['status']}")
-        st.write(f"Due Date: {task['due_date']}")
+        show_error("User data or 'uid' not found.")
         
-        # Display tags
-        if 'tags' in task and task['tags']:
-            tag_names = [tag['name'] for tag in task['tags']]
-            st.write("Tags: " + ", ".join(tag_names))
+def render_board(board_key, team_id=None):
+    # One component for the personal board and every team board. Columns are
+    # fragments, so paging, expanding or opening a card only reruns its column.
+    board_id = "_".join(str(part) for part in board_key)
+    # Live updates only rerun the page for boards it shows
+    st.session_state.setdefault('shown_boards', set()).add(tuple(board_key))
+    mirror = get_mirror()
+    if mirror is not None:
+        sync_board_from_mirror(mirror, board_key)
+        render_sync_status(mirror)
+    query = st.text_input("🔍 Search tasks", key=f"search_{board_id}").strip()
+    if query:
+        # Ranked matches from the backend's full-text index replace the columns
+        render_search_results(board_key, board_id, query, team_id)
+        return
+    # The index already holds every grouping, so switching it is free
+    group_by = st.selectbox("Group by", options=list(GROUP_BYS), format_func=GROUP_BYS.get, key=f"group_by_{board_id}")
+    paged = group_by == "status" and server_paging_enabled()
+    filters = render_board_filters(board_id, team_id) if paged else {}
+    selection = None
+    if st.toggle("Select tasks", key=f"select_mode_{board_id}"):
+        selection = board_id
+        # Runs before the columns so they render the result of a bulk action
+        render_bulk_actions(board_id, team_id)
 
-        edit_button_key = f"edit_button_{task['task_id']}"  # Unique key for each edit button
-        if st.button("Edit Task", key=edit_button_key):
-            st.session_state.selected_task = task  # Store selected task in session state for editing
-            save_edited_task()
+    if paged:
+        # Each column asks the backend for exactly the page it shows
+        for column, status in zip(st.columns(len(STATUSES)), STATUSES):
+            with column:
+                render_paged_column(board_key, board_id, status, filters, team_id, selection)
+        return
 
-@st.experimental_dialog("Edit Task")  
-def save_edited_task():
-    selected_task = st.session_state.selected_task
-    edited_title = st.text_input("Title", value=selected_task['title'])
-    edited_description = st.text_area("Description", value=selected_task['description'])
-    edited_status = st.selectbox("Status", options=["Todo", "In Progress", "Done"], index=["Todo", "In Progress", "Done"].index(selected_task['status']))
-    edited_due_date = st.date_input("Due Date", value=datetime.strptime(selected_task['due_date'], "%Y-%m-%d").date() if selected_task['due_date'] else None)
-    
-    current_tags = ", ".join([tag['name'] for tag in selected_task.get('tags', [])])
-    edited_tags = st.text_input("Edit Tags (comma-separated)", value=current_tags)
-    
-    if st.button("Update"):
-                updated_task = {
-                    "title": edited_title,
-                    "description": edited_description,
-                    "status": edited_status,
-                    "due_date": edited_due_date.strftime("%Y-%m-%d") if edited_due_date else None,
-                    "tags": [tag.strip() for tag in edited_tags.split(",") if tag.strip()]
-                }
-                
-                response = requests.put(f"{TASKS_ENDPOINT}/{selected_task['task_id']}", json=updated_task)
-                if response.status_code == 200:
-                    st.rerun()  # Rerun the app to reflect changes
-                else:
-                    st.error(f"Failed to update task: {response.json().get('detail')}")     
-                    
-    if st.button("Delete"):
-                    response = requests.delete(f"{TASKS_ENDPOINT}/{selected_task['task_id']}")
-                    if response.status_code == 204:
-                        st.rerun()
-                    else:
-                        st.error(f"Failed to delete task: {response.json().get('detail')}")              
+    tasks = load_full_board(board_key)
+    if tasks is None:
+        return
+    if not tasks:
+        st.warning("No tasks found.")
+        return
+    index = get_board_store().index(board_key)
+    columns = index.columns(group_by)
+    for column, (label, cards) in zip(st.columns(len(columns)), columns):
+        with column:
+            render_column(f"{board_id}_{group_by}", label, cards, team_id, selection)
 
-@st.cache_data
-def get_teams(uid):
+def load_search_page(board_key, search_key, query, cursor=None):
+    namespace, key = board_key
+    client = get_client()
+    search = client.search_tasks if namespace == "tasks" else client.search_team_tasks
+    params = {"limit": SEARCH_PAGE_SIZE}
+    if cursor:
+        params['cursor'] = cursor
     try:
-        response = requests.get(f"{TEAM_ENDPOINT}/{uid}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to retrieve teams. Error {response.status_code}")
-            return []
-    except requests.RequestException as e:
-        st.error(f"Request error: {e}")
-        return []
-    
-@st.cache_data
-def get_team_members(team_id):
-    try:
-        response = requests.get(f"{TEAM_ENDPOINT}/{team_id}/members")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to retrieve team members. Error {response.status_code}")
-            return []
-    except requests.RequestException as e:
-        st.error(f"Request error: {e}")
-        return []    
+        page = parse_page_response(search(key, query, **params), "search results")
+    except (BackendError, requests.RequestException) as e:
+        show_error(describe_error(e))
+        return False
 
-def create_team_task(team_id):
-    tasks = get_team_tasks(team_id)
-    if tasks:
-        # Organize tasks by status
-        todo_tasks = [task for task in tasks if task['status'] == 'Todo']
-        in_progress_tasks = [task for task in tasks if task['status'] == 'In Progress']
-        done_tasks = [task for task in tasks if task['status'] == 'Done']
+    store = get_board_store()
+    if cursor:
+        store.extend(search_key, page['tasks'], next_cursor=page['next_cursor'], total=page['total'])
+    else:
+        store.put(search_key, page['tasks'], next_cursor=page['next_cursor'], total=page['total'])
+    return True
 
-        # Display tasks in columns
-        col1, col2, col3 = st.columns(3)
+@st.experimental_fragment
+@session_metrics
+@instrumented("render_search_results")
+def render_search_results(board_key, board_id, query, team_id):
+    store = get_board_store()
+    search_key = tuple(board_key) + ("search", query)
+    if store.get(search_key, max_age=BOARD_RECONCILE_INTERVAL) is None:
+        if not load_search_page(board_key, search_key, query):
+            return
+    entry = store.entry(search_key)
 
-        with col1:
-            st.subheader("Todo")
-            for task in todo_tasks:
-                display_team_task(task)
+    total = entry['total'] if entry['total'] is not None else len(entry['tasks'])
+    st.caption(f"{total} matching tasks")
+    column_key = f"{board_id}_search"
+    for card in store.index(search_key).cards:
+        display_task(card, column_key, team_id)
 
-        with col2:
-            st.subheader("In Progress")
-            for task in in_progress_tasks:
-                display_team_task(task)
+    if entry['next_cursor']:
+        st.button(
+            "More results",
+            key=f"more_results_{board_id}",
+            on_click=load_search_page,
+            args=(board_key, search_key, query, entry['next_cursor']),
+        )
 
+def render_board_filters(board_id, team_id):
+    with st.expander("Filter and sort"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            text = st.text_input("Title or description contains", key=f"filter_text_{board_id}")
+            tag = st.text_input("Tag", key=f"filter_tag_{board_id}")
+        with col2:
+            due_after = st.date_input("Due from", value=None, key=f"filter_due_after_{board_id}")
+            due_before = st.date_input("Due until", value=None, key=f"filter_due_before_{board_id}")
         with col3:
-            st.subheader("Done")
-            for task in done_tasks:
-                display_team_task(task)
+            sort = st.radio("Sort by", options=list(TASK_SORTS), format_func=TASK_SORTS.get, key=f"filter_sort_{board_id}")
+            assignee = None
+            if team_id is not None:
+                team_members = st.session_state.get('team_members', {}).get(team_id) or []
+                member_names = {member['user_id']: member['username'] for member in team_members}
+                assignee = st.selectbox(
+                    "Assignee",
+                    options=[None] + list(member_names),
+                    format_func=lambda user_id: "Anyone" if user_id is None else member_names[user_id],
+                    key=f"filter_assignee_{board_id}",
+                )
+    filters = {
+        "sort": sort,
+        "text": text.strip(),
+        "tag": tag.strip(),
+        "assignee": assignee,
+        "due_after": due_after.isoformat() if due_after else None,
+        "due_before": due_before.isoformat() if due_before else None,
+    }
+    return {name: value for name, value in filters.items() if value}
+
+@st.experimental_fragment
+@session_metrics
+@instrumented("render_paged_column")
+def render_paged_column(board_key, board_id, status, filters, team_id, selection=None):
+    store = get_board_store()
+    page_key = column_page_key(board_key, status, filters)
+    if store.get(page_key, max_age=BOARD_RECONCILE_INTERVAL) is None:
+        if not load_column_page(board_key, page_key, status, filters):
+            return
+    entry = store.entry(page_key)
+
+    st.subheader(f"{status} ({entry['total']})")
+    if status in COLLAPSED_COLUMNS and not st.toggle("Show tasks", key=f"show_column_{board_id}_paged_{status}"):
+        return
+
+    column_key = f"{board_id}_paged_{status}"
+    for card in store.index(page_key).cards:
+        display_task(card, column_key, team_id, selection)
+
+    if entry['next_cursor']:
+        st.button(
+            "Load more",
+            key=f"load_more_{column_key}",
+            on_click=load_column_page,
+            args=(board_key, page_key, status, filters, entry['next_cursor']),
+        )
+
+def selected_task_ids(board_id):
+    return st.session_state.setdefault('selected_tasks', {}).setdefault(board_id, set())
+
+def toggle_task_selection(board_id, task_id):
+    selected = selected_task_ids(board_id)
+    if task_id in selected:
+        selected.remove(task_id)
     else:
-        st.warning("No tasks found.")
-        
-@st.cache_data
-def get_team_tasks(team_id):
-    try:
-        response = requests.get(f"{TEAM_TASKS_ENDPOINT}/{team_id}")
-        if response.status_code == 200:
-            return response.json()
+        selected.add(task_id)
+
+def clear_task_selection(board_id):
+    selected_task_ids(board_id).clear()
+    # New checkbox keys so the cleared selection is not restored from widget state
+    generations = st.session_state.setdefault('selection_generation', {})
+    generations[board_id] = generations.get(board_id, 0) + 1
+
+def render_bulk_actions(board_id, team_id):
+    st.caption(f"{len(selected_task_ids(board_id))} selected")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        status = st.selectbox("Move to", options=["Todo", "In Progress", "Done"], key=f"bulk_status_{board_id}")
+        if st.button("Move selected", key=f"bulk_move_{board_id}"):
+            run_bulk_action(board_id, team_id, {"status": status})
+    with col2:
+        tags = tag_picker("Add tags", current_uid(), team_id, [], key=f"bulk_tags_{board_id}")
+        if st.button("Tag selected", key=f"bulk_add_tag_{board_id}") and tags:
+            run_bulk_action(board_id, team_id, {"add_tags": tags})
+    if team_id is not None:
+        with col3:
+            team_members = st.session_state.get('team_members', {}).get(team_id)
+            if team_members is None:
+                team_members = get_team_members(team_id)
+            member_options = {member['username']: member['user_id'] for member in team_members}
+            username = st.selectbox("Assign to", options=list(member_options.keys()), key=f"bulk_assignee_{board_id}")
+            if st.button("Assign selected", key=f"bulk_assign_{board_id}") and username:
+                run_bulk_action(board_id, team_id, {"add_assignees": [member_options[username]]}, team_members)
+    with col4:
+        if st.button("Delete selected", key=f"bulk_delete_{board_id}"):
+            run_bulk_action(board_id, team_id, None)
+
+def local_bulk_changes(task, changes, members=None):
+    local = {}
+    if 'status' in changes:
+        local['status'] = changes['status']
+    if 'add_tags' in changes:
+        tags = list(task.get('tags') or [])
+        known = {tag['name'] for tag in tags}
+        local['tags'] = tags + [{'name': name} for name in changes['add_tags'] if name not in known]
+    if 'add_assignees' in changes and members is not None:
+        assignees = list(task.get('assignees') or [])
+        known = {assignee['user_id'] for assignee in assignees}
+        local['assignees'] = assignees + [member for member in members if member['user_id'] in changes['add_assignees'] and member['user_id'] not in known]
+    return local
+
+def run_bulk_action(board_id, team_id, changes, members=None):
+    # changes=None deletes the selected tasks. Every selected card is patched
+    # locally, the whole batch goes out as one request, and only the items
+    # the backend rejects are rolled back.
+    selected = selected_task_ids(board_id)
+    if not selected:
+        st.warning("No tasks selected.")
+        return
+
+    store = get_board_store()
+    undo = {}
+    operations = []
+    for task_id in selected:
+        task = store.find(task_id)
+        if task is None:
+            continue
+        if changes is None:
+            undo[task_id] = store.remove(task_id)
+            operations.append({"op": "delete", "task_id": task_id})
         else:
-            st.error(f"Failed to retrieve team tasks. Error {response.status_code}")
-            return []
-    except requests.RequestException as e:
-        st.error(f"Request error: {e}")
-        return []
-    
-def display_team_task(task):
-    with st.expander(f"{task['title']}\n\n {task['due_date']}"):
+            undo[task_id] = store.update(task_id, local_bulk_changes(task, changes, members))
+            operations.append(dict(changes, op="update", task_id=task_id))
+
+    mirror = get_mirror()
+    if mirror is not None:
+        # Queued; items the backend rejects come back when the mirror resyncs
+        mirror.write_batch(operations, members or ())
+        invalidate_task_caches(current_uid(), team_id)
+        clear_task_selection(board_id)
+        st.success(f"Updated {len(operations)} tasks.")
+        return
+
+    try:
+        response = get_client().bulk_tasks(operations)
+        if response.status_code != 200:
+            raise BackendError(f"Failed to update tasks. Error {response.status_code}", response.status_code)
+        results = response.json()['results']
+    except (BackendError, requests.RequestException) as e:
+        for task_undo in undo.values():
+            store.restore(task_undo)
+        show_error(describe_error(e))
+        return
+
+    failed = []
+    for result in results:
+        if not result['ok']:
+            store.restore(undo.get(result['task_id'], []))
+            failed.append(f"#{result['task_id']}: {result.get('detail')}")
+        elif 'task' in result:
+            store.update(result['task_id'], result['task'])
+
+    invalidate_task_caches(current_uid(), team_id)
+    clear_task_selection(board_id)
+    if failed:
+        show_error(f"{len(failed)} of {len(operations)} tasks were not changed: " + "; ".join(failed))
+    else:
+        st.success(f"Updated {len(operations)} tasks.")
+
+def show_more_cards(limit_key):
+    st.session_state[limit_key] = st.session_state.get(limit_key, COLUMN_PAGE_SIZE) + COLUMN_PAGE_SIZE
+
+@st.experimental_fragment
+@session_metrics
+@instrumented("render_column")
+def render_column(column_id, label, cards, team_id, selection=None):
+    st.subheader(f"{label} ({len(cards)})")
+    if label in COLLAPSED_COLUMNS and not st.toggle("Show tasks", key=f"show_column_{column_id}_{label}"):
+        return
+
+    limit_key = f"column_limit_{column_id}_{label}"
+    limit = st.session_state.get(limit_key, COLUMN_PAGE_SIZE)
+    for card in cards[:limit]:
+        # A card can sit in several tag/assignee columns, so keys are per column
+        display_task(card, f"{column_id}_{label}", team_id, selection)
+
+    remaining = len(cards) - limit
+    if remaining > 0:
+        st.button(
+            f"Load {min(remaining, COLUMN_PAGE_SIZE)} more",
+            key=f"load_more_{column_id}_{label}",
+            on_click=show_more_cards,
+            args=(limit_key,),
+        )
+
+def display_task(card, column_key, team_id=None, selection=None):
+    task = card['task']
+    if selection is not None:
+        generation = st.session_state.get('selection_generation', {}).get(selection, 0)
+        st.checkbox(
+            "Select",
+            value=task['task_id'] in selected_task_ids(selection),
+            key=f"select_{generation}_{column_key}_{task['task_id']}",
+            on_change=toggle_task_selection,
+            args=(selection, task['task_id']),
+        )
+    with st.expander(card['heading']):
         st.write(f"{task['description']}")
         st.write(f"Status: {task['status']}")
         st.write(f"Due Date: {task['due_date']}")
-
+        
         # Display tags
-        if 'tags' in task and task['tags']:
-            tag_names = [tag['name'] for tag in task['tags']]
-            st.write("Tags: " + ", ".join(tag_names))
+        if card['tags']:
+            st.write("Tags: " + card['tags'])
 
         # Display assignees
-        if 'assignees' in task and task['assignees']:
-            assignee_names = [assignee['username'] for assignee in task['assignees']]
-            st.write("Assignees: " + ", ".join(assignee_names))
+        if card['assignees']:
+            st.write("Assignees: " + card['assignees'])
 
-        edit_button_key = f"edit_team_task_{task['task_id']}"  # Unique key for each edit button
+        edit_button_key = f"edit_button_{column_key}_{task['task_id']}"  # Unique key for each edit button
         if st.button("Edit Task", key=edit_button_key):
-            st.session_state.selected_team_task = task  # Store selected task in session state for editing
-            save_edited_team_task()
-            
-@st.experimental_dialog("Edit Task")
-def save_edited_team_task():
-    selected_task = st.session_state.selected_team_task
-    team_id = st.session_state.selected_team_id
-    
+            st.session_state.selected_task = task  # Store selected task in session state for editing
+            st.session_state.selected_task_team_id = team_id
+            save_edited_task()
+
+@st.experimental_dialog("Edit Task")  
+def save_edited_task():
+    selected_task = st.session_state.selected_task
+    team_id = st.session_state.get('selected_task_team_id')
+
     edited_title = st.text_input("Title", value=selected_task['title'])
     edited_description = st.text_area("Description", value=selected_task['description'])
     edited_status = st.selectbox("Status", options=["Todo", "In Progress", "Done"], index=["Todo", "In Progress", "Done"].index(selected_task['status']))
     edited_due_date = st.date_input("Due Date", value=datetime.strptime(selected_task['due_date'], "%Y-%m-%d").date() if selected_task['due_date'] else None)
     
-    current_tags = ", ".join([tag['name'] for tag in selected_task.get('tags', [])])
-    edited_tags = st.text_input("Edit Tags (comma-separated)", value=current_tags)
+    current_tags = [tag['name'] for tag in selected_task.get('tags', [])]
+    tag_team_id = team_id if team_id is not None else selected_task.get('team_id')
+    edited_tags = tag_picker("Tags", current_uid(), tag_team_id, current_tags, key=f"edit_task_tags_{selected_task['task_id']}")
 
-    # Get team members
-    team_members = get_team_members(team_id)
-    member_options = {member['username']: member['user_id'] for member in team_members}
+    team_members = None
+    if team_id is not None:
+        # Get team members, prefetched with the team board when available
+        team_members = st.session_state.get('team_members', {}).get(team_id)
+        if team_members is None:
+            team_members = get_team_members(team_id)
+        member_options = {member['username']: member['user_id'] for member in team_members}
 
-    # Get current assignees
-    current_assignees = [assignee['username'] for assignee in selected_task.get('assignees', [])]
+        # Get current assignees
+        current_assignees = [assignee['username'] for assignee in selected_task.get('assignees', [])]
+
+        # Multi-select for assignees with current assignees as default
+        selected_assignees = st.multiselect(
+            "Assignees",
+            options=list(member_options.keys()),
+            default=current_assignees
+        )
 
-    # Multi-select for assignees with current assignees as default
-    selected_assignees = st.multiselect(
-        "Assignees",
-        options=list(member_options.keys()),
-        default=current_assignees
-    )
     if st.button("Update"):
         updated_task = {
             "title": edited_title,
             "description": edited_description,
             "status": edited_status,
             "due_date": edited_due_date.strftime("%Y-%m-%d") if edited_due_date else None,
-            "tags": [tag.strip() for tag in edited_tags.split(",") if tag.strip()],
-            "assignee": [member_options[username] for username in selected_assignees]
+            "tags": edited_tags
         }
-        response = requests.put(f"{TASKS_ENDPOINT}/{selected_task['task_id']}", json=updated_task)
+        if team_id is not None:
+            updated_task["assignee"] = [member_options[username] for username in selected_assignees]
+
+        changes = local_task_changes(selected_task, updated_task, team_members)
+        undo = get_board_store().update(selected_task['task_id'], changes)
+        mirror = get_mirror()
+        if mirror is not None:
+            # Saved locally; the mirror's outbox sends it
+            mirror.write("update", selected_task['task_id'], updated_task, team_members or ())
+            st.success("Task updated successfully")
+            st.rerun()
+        response = send_task_write(undo, lambda: get_client().update_task(selected_task['task_id'], updated_task))
         if response.status_code == 200:
+            invalidate_task_caches(current_uid(), team_id if team_id is not None else selected_task.get('team_id'))
             st.success("Task updated successfully")
             st.rerun()  # Rerun the app to reflect changes
         else:
-            st.error(f"Failed to update task: {response.json().get('detail')}")
-            
+            show_error(f"Failed to update task: {response.json().get('detail')}")
+
+    if st.button("Delete"):
+        undo = get_board_store().remove(selected_task['task_id'])
+        mirror = get_mirror()
+        if mirror is not None:
+            mirror.write("delete", selected_task['task_id'])
+            st.rerun()
+        response = send_task_write(undo, lambda: get_client().delete_task(selected_task['task_id']), expected_status=204)
+        if response.status_code == 204:
+            invalidate_task_caches(current_uid(), team_id if team_id is not None else selected_task.get('team_id'))
+            st.rerun()
+        else:
+            show_error(f"Failed to delete task: {response.json().get('detail')}")
+
+@board_cache.cached("teams", ttl=TEAMS_CACHE_TTL)
+def fetch_teams(uid):
+    response = get_client().get_teams(uid)
+    if response.status_code != 200:
+        raise BackendError(f"Failed to retrieve teams. Error {response.status_code}", response.status_code)
+    return response.json()
+
+def get_teams(uid):
+    try:
+        return fetch_teams(uid)
+    except (BackendError, requests.RequestException) as e:
+        show_error(describe_error(e))
+        return []
+
+@board_cache.cached("team_members", ttl=TEAM_MEMBERS_CACHE_TTL)
+def fetch_team_members(team_id):
+    response = get_client().get_team_members(team_id)
+    if response.status_code != 200:
+        raise BackendError(f"Failed to retrieve team members. Error {response.status_code}", response.status_code)
+    return response.json()
+
+def get_team_members(team_id):
+    try:
+        return fetch_team_members(team_id)
+    except (BackendError, requests.RequestException) as e:
+        show_error(describe_error(e))
+        return []
+
+@board_cache.cached("tags", ttl=TAGS_CACHE_TTL)
+def fetch_tag_names(uid):
+    response = get_client().get_tags(uid)
+    if response.status_code != 200:
+        raise BackendError(f"Failed to retrieve tags. Error {response.status_code}", response.status_code)
+    return response.json()
+
+@board_cache.cached("team_tags", ttl=TAGS_CACHE_TTL)
+def fetch_team_tag_names(team_id):
+    response = get_client().get_team_tags(team_id)
+    if response.status_code != 200:
+        raise BackendError(f"Failed to retrieve team tags. Error {response.status_code}", response.status_code)
+    return response.json()
+
+def get_tag_names(uid, team_id=None):
+    # Suggestions only, so a failed fetch just leaves the picker without them
+    try:
+        return fetch_team_tag_names(team_id) if team_id is not None else fetch_tag_names(uid)
+    except (BackendError, requests.RequestException):
+        return []
+
+def tag_picker(label, uid, team_id, current, key):
+    # Existing tags of the board, filtered as you type, plus free text for
+    # new ones; the backend creates any it does not know
+    options = list(dict.fromkeys(get_tag_names(uid, team_id) + current))
+    picked = st.multiselect(label, options=options, default=current, key=f"{key}_known")
+    new_tags = st.text_input("New tags (comma-separated)", key=f"{key}_new")
+    return list(dict.fromkeys(picked + [tag.strip() for tag in new_tags.split(",") if tag.strip()]))
+
+def show_error(message):
+    # st.error, counted against the phase it happened in
+    record_error()
+    st.error(message)
+
+def describe_error(error):
+    if isinstance(error, requests.RequestException):
+        return f"Request error: {error}"
+    return str(error)
+
+def load_bootstrap(uid):
+    # Teams, members and team boards for the whole team page in one request.
+    # Held for the session and brought up to date with a since request once
+    # the boards are due for a sync. Returns the teams, or None when the
+    # backend cannot bootstrap and the page has to ask per team.
+    client = get_client()
+    if not client.supports_bootstrap:
+        return None
+    with_tasks = backend_team_boards()
+    state = st.session_state.get('bootstrap')
+    if state is not None and state['with_tasks'] != with_tasks:
+        state = None
+    if state is not None and time.monotonic() - state['loaded_at'] <= BOARD_RECONCILE_INTERVAL:
+        return state['teams']
+
+    try:
+        response = client.get_bootstrap(uid, since=state['watermark'] if state else None, with_tasks=with_tasks)
+        if response.status_code == 404:
+            client.supports_bootstrap = False
+            return None
+        if response.status_code != 200:
+            raise BackendError(f"Failed to load team boards. Error {response.status_code}", response.status_code)
+        body = read_body(response)
+    except (BackendError, requests.RequestException) as e:
+        show_error(describe_error(e))
+        return state['teams'] if state else None
+    return apply_bootstrap(body, with_tasks)
+
+def apply_bootstrap(body, with_tasks):
+    store = get_board_store()
+    mirror = get_mirror()
+    team_members = st.session_state.setdefault('team_members', {})
+    teams = []
+    for team in body['teams']:
+        team_id = team['team_id']
+        teams.append({"team_id": team_id, "team_name": team['team_name']})
+        team_members[team_id] = team['members']
+        if mirror is not None:
+            mirror.put_team(team_id, team['team_name'], team['members'])
+        if not with_tasks:
+            continue
+        board_key = ("team_tasks", team_id)
+        if not body['delta']:
+            store.put(board_key, team['tasks'], body['watermark'])
+        elif store.entry(board_key) is not None:
+            store.merge(board_key, team['tasks'], team['deleted'], body['watermark'])
+        # A board we do not hold (a team joined since, or one just refreshed)
+        # only got its recent changes here, so it loads on its own
+    st.session_state.bootstrap = {
+        "teams": teams,
+        "watermark": body['watermark'],
+        "loaded_at": time.monotonic(),
+        "with_tasks": with_tasks,
+    }
+    return teams
+
+def bootstrap_members():
+    # Members delivered by the bootstrap, current as of its last sync
+    if 'bootstrap' not in st.session_state:
+        return {}
+    return st.session_state.get('team_members', {})
+
+def load_team_boards(team_ids, with_tasks=True):
+    # Fetch tasks and members for every team concurrently; the page then
+    # waits for the slowest single request instead of the sum of all of them.
+    # Teams whose session board is still fresh skip the tasks request, and
+    # server-paged boards skip it altogether. After a bootstrap this usually
+    # sends nothing.
+    store = get_board_store()
+    fresh = {team_id: store.get(("team_tasks", team_id), max_age=BOARD_RECONCILE_INTERVAL) for team_id in team_ids}
+    known_members = bootstrap_members()
+    calls = {}
+    for team_id in team_ids:
+        if fresh[team_id] is None and with_tasks:
+            calls[(team_id, "tasks")] = (fetch_board_update, "team_tasks", team_id, store.entry(("team_tasks", team_id)))
+        if known_members.get(team_id) is None:
+            calls[(team_id, "members")] = (fetch_team_members, team_id)
+    outcomes = fan_out(calls, max_workers=TEAM_FETCH_WORKERS)
+
+    boards = {}
+    for team_id in team_ids:
+        tasks, error = fresh[team_id], None
+        if (team_id, "tasks") in calls:
+            update, error = outcomes[(team_id, "tasks")]
+            tasks = apply_board_update("team_tasks", team_id, update) if error is None else []
+        # A failed members fetch leaves None so the edit dialog retries it
+        members = known_members.get(team_id)
+        if (team_id, "members") in calls:
+            members, _ = outcomes[(team_id, "members")]
+        boards[team_id] = {"tasks": tasks, "members": members, "error": error}
+    return boards
+
+@board_cache.cached("team_tasks", ttl=TASKS_CACHE_TTL)
+def fetch_team_tasks(team_id):
+    return parse_board_response(get_client().get_team_tasks(team_id), "team tasks")
+
 @st.experimental_dialog("New task")
 def create_new_task(uid):
     title = st.text_input("Title")
     description = st.text_area("Description")
     status = st.selectbox("Status", options=["Todo", "In Progress", "Done"])
     due_date = st.date_input("Due Date")
-    tags = st.text_input("Tags (comma-separated)")
+    tags = tag_picker("Tags", uid, None, [], key="new_task_tags")
     if st.button("Update"):
         new_task = {
             "title": title,
             "description": description,
             "status": status,
             "due_date": due_date.strftime("%Y-%m-%d") if due_date else None,
-            "tags": [tag.strip() for tag in tags.split(",") if tag.strip()],
+            "tags": tags,
             "uid": get_user_data()['uid']
         }
-        response = requests.post(f"{TASKS_ENDPOINT}/", json=new_task)
-        
+        mirror = get_mirror()
+        if mirror is not None:
+            # Shown from the mirror under a local id until the backend has it
+            mirror.write("create", payload=new_task)
+            st.success("Task created successfully")
+            st.rerun()
+        # Show the card right away under a temporary id until the backend answers
+        pending_task = local_task_changes({}, new_task)
+        pending_task['task_id'] = f"pending-{uuid.uuid4().hex}"
+        undo = get_board_store().add(("tasks", new_task['uid']), pending_task)
+        response = send_task_write(undo, lambda: get_client().create_task(new_task))
+
         if response.status_code == 200:
+            invalidate_task_caches(new_task['uid'])
+            created_task = response.json()
+            if isinstance(created_task, dict) and 'task_id' in created_task:
+                get_board_store().update(pending_task['task_id'], created_task)
+            else:
+                # No task in the response, so reconcile this board on the next run
+                get_board_store().drop(("tasks", new_task['uid']))
             st.success("Task created successfully")
             st.rerun()  # Rerun the app to reflect changes
         else:
-            st.error(f"Failed to update task: {response.status_code}")
+            show_error(f"Failed to update task: {response.status_code}")
     
 def create_user(username, email):
     try:
-        response = requests.post(f"{USER_ENDPOINT}", json={"username": username, "email": email})
+        response = get_client().create_user(username, email)
         if response.status_code == 200:
             uid = response.json()['uid']
             st.write(f"This is your uid:\n {uid}")
         else:
-            st.error(f"Failed to create user. Error {response.status_code}")
+            show_error(f"Failed to create user. Error {response.status_code}")
             return []
     except requests.RequestException as e:
-        st.error(f"Request error: {e}")
+        show_error(f"Request error: {e}")
         return []    
     
 @st.experimental_dialog("Enter details to create an account")
@@ -342,7 +990,7 @@ def create_user_dialog():
     email_regex = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
     
     if(email != "" and not re.fullmatch(email_regex, email)):
-        st.error("Enter valid email")
+        show_error("Enter valid email")
     
     if st.button("Register"):
         create_user(username, email)
@@ -361,12 +1009,39 @@ def login_page():
                 save_user_data(user_data)
                 st.rerun()  # Rerun the app to load the welcome page
             else:
-                st.error("Authentication failed. Please check your User ID.")
+                show_error("Authentication failed. Please check your User ID.")
         else:
             st.warning("Please enter your User ID.")      
     if st.button("Create an account"):
         create_user_dialog()
         
+IMPORT_KINDS = {"users": "Users", "teams": "Teams", "memberships": "Team memberships", "tasks": "Tasks"}
+
+def bulk_import():
+    # Files go to the backend as one streamed upload per kind; import users
+    # and teams before the memberships and tasks that refer to them
+    kind = st.selectbox("Records", options=list(IMPORT_KINDS), format_func=IMPORT_KINDS.get, key="import_kind")
+    upload = st.file_uploader("CSV or JSON Lines file", type=["csv", "jsonl"], key="import_file")
+    if upload is None or not st.button("Import", key="import_run"):
+        return
+    fmt = upload.name.rsplit(".", 1)[-1].lower()
+    try:
+        response = get_client().import_records(kind, upload, fmt)
+        if response.status_code != 200:
+            raise BackendError(f"Failed to import {IMPORT_KINDS[kind].lower()}. Error {response.status_code}", response.status_code)
+        report = response.json()
+    except (BackendError, requests.RequestException) as e:
+        show_error(describe_error(e))
+        return
+
+    # Imported tasks can land on any board
+    board_cache.clear()
+    st.session_state.pop('boards', None)
+    st.success(f"Imported {report['inserted']} records, skipped {report['skipped']}.")
+    for error in report['errors']:
+        st.warning(error)
+
+@instrumented("welcome_page")
 def welcome_page():
     user_data = get_user_data()
     if user_data and 'uid' in user_data:
@@ -383,37 +1058,165 @@ def welcome_page():
             st.session_state.page = "team_board"
             st.rerun()
 
+        with st.expander("📦 Bulk import"):
+            bulk_import()
+
     else:
-        st.error("User data or 'uid' not found.")
+        show_error("User data or 'uid' not found.")
 
+@instrumented("personal_board_page")
 def personal_board_page():
     if st.button("↩"):
         st.session_state.page = None
         st.rerun()
         
     st.title("📝 Personal Board")
-    
+
+    if st.button("⟳ Refresh"):
+        refresh_board("tasks", get_user_data()['uid'])
+
     if st.button("✎ New Task"):
         create_new_task(get_user_data()['uid'])
         
     create_task(get_user_data()['uid'])
     
+@instrumented("render_team_board")
+def render_team_board(team_id, board):
+    if board['members'] is not None:
+        st.session_state.setdefault('team_members', {})[team_id] = board['members']
+    if board['error']:
+        # Only this team's board shows the failure
+        show_error(describe_error(board['error']))
+        return
+    render_board(("team_tasks", team_id), team_id)
+
+def render_all_team_boards(teams):
+    if st.button("⟳ Refresh"):
+        for team in teams:
+            refresh_board("team_tasks", team['team_id'])
+    boards = load_team_boards([team['team_id'] for team in teams], with_tasks=backend_team_boards())
+    team_tabs = st.tabs([team['team_name'] for team in teams])
+    for idx, team in enumerate(teams):
+        with team_tabs[idx]:
+            render_team_board(team['team_id'], boards[team['team_id']])
+
+def render_active_team_board(teams):
+    # st.tabs renders every panel on each rerun, so pick the team with a
+    # selector instead and only fetch and render that one
+    team_names = {team['team_id']: team['team_name'] for team in teams}
+    team_ids = list(team_names)
+    selected_team_id = st.session_state.get('selected_team_id')
+    active_team_id = st.radio(
+        "Team",
+        options=team_ids,
+        index=team_ids.index(selected_team_id) if selected_team_id in team_ids else 0,
+        format_func=team_names.get,
+        horizontal=True,
+        label_visibility="collapsed",
+        key="active_team_tab",
+    )
+    st.session_state.selected_team_id = active_team_id
+    if st.button("⟳ Refresh"):
+        refresh_board("team_tasks", active_team_id)
+    boards = load_team_boards([active_team_id], with_tasks=backend_team_boards())
+    render_team_board(active_team_id, boards[active_team_id])
+
+@instrumented("team_board_page")
 def team_board_page():
     st.title("Team Board")
     user_data = get_user_data()
     if user_data and 'uid' in user_data:
-        teams = get_teams(user_data['uid'])
+        teams = load_bootstrap(user_data['uid'])
+        if teams is None:
+            teams = get_teams(user_data['uid'])
         if teams:
-            team_tabs = st.tabs([team['team_name'] for team in teams])
-            for idx, team in enumerate(teams):
-                with team_tabs[idx]:
-                    st.session_state.selected_team_id = team['team_id']
-                    create_team_task(team['team_id'])
+            if LAZY_TEAM_TABS:
+                render_active_team_board(teams)
+            else:
+                render_all_team_boards(teams)
         else:
             st.warning("No teams found.")
     else:
-        st.error("User data or 'uid' not found.")
+        show_error("User data or 'uid' not found.")
         
+def live_inbox(uid):
+    inbox = st.session_state.get('live_inbox')
+    if inbox is None or inbox.uid != uid:
+        inbox = st.session_state.live_inbox = Inbox(uid)
+    listen(inbox)
+    return inbox
+
+def change_is_new(store, board_key, change):
+    # Changes this session already holds, such as its own writes coming
+    # back, need nothing
+    if change['op'] in ("bulk", "reset"):
+        return True
+    task = store.find_on(board_key, change['task_id'])
+    if change['op'] == "delete":
+        return task is not None
+    return task is None or task.get('updated_at') != change['updated_at']
+
+def apply_live_changes(changes):
+    # Marks what the changes touched as stale: a full board is synced on its
+    # next read with a delta request, and only the column pages and search
+    # results that can hold the changed tasks are dropped. Returns whether a
+    # board on screen changed.
+    store = get_board_store()
+    touched = {}
+    for change in changes:
+        boards = store.board_keys() if change['boards'] is None else [tuple(board) for board in change['boards']]
+        for board_key in boards:
+            touched.setdefault(board_key, []).append(change)
+
+    shown = st.session_state.get('shown_boards', set())
+    changed = False
+    for board_key, board_changes in touched.items():
+        board_changes = [change for change in board_changes if change_is_new(store, board_key, change)]
+        if not board_changes:
+            continue
+        store.expire(board_key)
+        if any(change['op'] in ("bulk", "reset") for change in board_changes):
+            store.drop_pages(board_key)
+        else:
+            statuses = {status for change in board_changes for status in change['statuses']}
+            store.drop_stale_pages(board_key, statuses, {change['task_id'] for change in board_changes})
+        changed = changed or board_key in shown
+    return changed
+
+@st.experimental_fragment(run_every=LIVE_CHECK_INTERVAL)
+@session_metrics
+def live_updates(uid):
+    # Teammates' changes arrive without anyone rerunning the page. The rerun
+    # they trigger reads only the stale parts from the backend; everything
+    # else comes from the board store.
+    changes = live_inbox(uid).drain() if LIVE_UPDATES else []
+    mirror = get_mirror()
+    if mirror is not None:
+        # The mirror pulls the changes itself; the page reruns once a board
+        # it shows has moved on
+        if changes:
+            mirror.request_sync()
+        if mirror_changed(mirror):
+            st.rerun()
+        return
+    if changes and apply_live_changes(changes):
+        st.rerun()
+
+def debug_panel():
+    # Timings of this session, and of the whole process for comparison
+    session_metrics = st.session_state.metrics
+    with st.expander("⏱ Performance"):
+        for label, source in (("This session", session_metrics), ("All sessions", registry)):
+            st.caption(label)
+            rows = source.summary() + source.counter_rows()
+            if rows:
+                st.table(rows)
+        st.caption("Recent backend calls")
+        st.table(session_metrics.recent_calls())
+        if st.button("Reset session timings"):
+            st.session_state.metrics = Registry()
+            session_registry.set(st.session_state.metrics)
+
 def main():
     st.markdown(
         """
@@ -426,6 +1229,7 @@ def main():
         unsafe_allow_html=True,
     )
 
+    st.session_state.shown_boards = set()
     if st.session_state.get("page") == "personal_board":
         personal_board_page()
     elif st.session_state.get("page") == "team_board":
@@ -435,5 +1239,11 @@ def main():
     else:
         login_page()
 
+    if (LIVE_UPDATES or LOCAL_FIRST) and st.session_state.get("page") in ("personal_board", "team_board") and current_uid():
+        live_updates(current_uid())
+
+    if DEBUG_PANEL:
+        debug_panel()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,244 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timings and sizes of backend calls and render phases, kept in fixed-bucket
+# histograms. Everything is recorded into the process-wide registry and, when
+# a session has set one as current, into that session's registry too. An
+# observation is a perf_counter, a lock and a bisect, so this stays on in
+# production.
+PREFIX = "task_app"
+# Upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds in bytes
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+# Backend calls kept per registry for the debug panel
+RECENT_CALLS = 50
+
+HELP = {
+    "backend_request_seconds": ("Backend call latency", LATENCY_BUCKETS),
+    "backend_response_bytes": ("Backend response body size", SIZE_BUCKETS),
+    "phase_seconds": ("Time spent in a page, board render or decode phase", LATENCY_BUCKETS),
+}
+COUNTER_HELP = {
+    "backend_errors_total": "Backend calls that failed without a response",
+    "app_errors_total": "Errors shown to the user, by the phase they happened in",
+    "cache_lookups_total": "Cached reads by namespace and where they were answered: local, shared or miss",
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation; None past
+        # the last bucket
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) -> Histogram, labels a sorted tuple of pairs
+        self.histograms = {}
+        self.counters = {}
+        self.recent = deque(maxlen=RECENT_CALLS)
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(HELP[name][1])
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def note(self, entry):
+        with self._lock:
+            self.recent.append(entry)
+
+    def summary(self):
+        # One row per histogram, for the debug panel
+        with self._lock:
+            items = sorted(self.histograms.items())
+        rows = []
+        for (name, labels), histogram in items:
+            scale = 1000 if name.endswith("_seconds") else 1
+            unit = "ms" if scale == 1000 else "bytes"
+            rows.append({
+                "metric": name,
+                **dict(labels),
+                "count": histogram.count,
+                f"mean {unit}": round(histogram.sum / histogram.count * scale, 1),
+                f"p50 {unit} ≤": bucket_label(histogram.quantile(0.5), scale),
+                f"p95 {unit} ≤": bucket_label(histogram.quantile(0.95), scale),
+                f"total {unit}": round(histogram.sum * scale, 1),
+            })
+        return rows
+
+    def counter_rows(self):
+        with self._lock:
+            items = sorted(self.counters.items())
+        return [{"metric": name, **dict(labels), "count": value} for (name, labels), value in items]
+
+    def recent_calls(self):
+        with self._lock:
+            return list(reversed(self.recent))
+
+    def prometheus_text(self):
+        # Text exposition format, version 0.0.4
+        with self._lock:
+            histograms = sorted((key, list(h.counts), h.count, h.sum, h.buckets) for key, h in self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        declared = set()
+        for (name, labels), counts, count, total, buckets in histograms:
+            metric = f"{PREFIX}_{name}"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {metric} {HELP[name][0]}")
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {total}")
+            lines.append(f"{metric}_count{format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {metric} {COUNTER_HELP[name]}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def label_key(labels):
+    # Values as strings, so a status of 200 and one of "error" still sort
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def bucket_label(bound, scale):
+    return "∞" if bound is None else round(bound * scale, 1)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+# The registry of the Streamlit session being served by this thread, if any.
+# utils.fan_out copies the context into its workers, so their calls are
+# counted against the session too.
+session_registry = contextvars.ContextVar("session_registry", default=None)
+# The innermost timed phase, so errors can say where they happened
+current_phase = contextvars.ContextVar("current_phase", default="none")
+
+
+def registries():
+    session = session_registry.get()
+    return (registry,) if session is None else (registry, session)
+
+def record_request(endpoint, method, status, seconds, size):
+    # status is the HTTP status, or "error" when no response came back
+    for target in registries():
+        target.observe("backend_request_seconds", seconds, endpoint=endpoint, method=method, status=status)
+        if status == "error":
+            target.increment("backend_errors_total", endpoint=endpoint)
+        else:
+            target.observe("backend_response_bytes", size, endpoint=endpoint)
+        target.note({"endpoint": endpoint, "method": method, "status": status, "ms": round(seconds * 1000, 1), "bytes": size})
+
+def record_phase(phase, seconds):
+    for target in registries():
+        target.observe("phase_seconds", seconds, phase=phase)
+
+def record_error():
+    phase = current_phase.get()
+    for target in registries():
+        target.increment("app_errors_total", phase=phase)
+
+def record_cache(namespace, where):
+    for target in registries():
+        target.increment("cache_lookups_total", namespace=namespace, where=where)
+
+@contextmanager
+def timed(phase):
+    token = current_phase.set(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+        current_phase.reset(token)
+
+def instrumented(phase):
+    # Decorator form of timed. st.rerun and st.stop leave by exception; the
+    # time up to that point still counts.
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = registry.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve_metrics(port, host="127.0.0.1"):
+    # Process-wide /metrics endpoint for a local scraper; started once, however
+    # many sessions ask
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,81 @@
+import os
+import sys
+from sqlalchemy import create_engine, select
+from models import Base, Task, TaskAssignee, TaskTag, TeamMember
+from search import create_search_index
+from tasks import team_board_filter, user_board_filter
+
+# Indexes added for the board access patterns. create_all only creates
+# indexes together with their tables, so existing databases get them here.
+BOARD_INDEXES = (
+    "ix_team_members_user_team",
+    "ix_tasks_team_status",
+    "ix_tasks_team_due_date",
+    "ix_tasks_creator_due_date",
+    "ix_tasks_team_updated_at",
+    "ix_tasks_creator_updated_at",
+    "ix_task_assignees_user_task",
+    "ix_task_tags_tag_task",
+    "ix_task_tombstones_team_deleted_at",
+    "ix_task_tombstones_creator_deleted_at",
+)
+
+def board_indexes():
+    indexes = {index.name: index for table in Base.metadata.sorted_tables for index in table.indexes}
+    return [indexes[name] for name in BOARD_INDEXES]
+
+def upgrade(engine):
+    # Safe to run repeatedly; also creates the tombstone table on databases
+    # that predate it
+    Base.metadata.tables["task_tombstones"].create(engine, checkfirst=True)
+    for index in board_indexes():
+        index.create(engine, checkfirst=True)
+    if engine.dialect.name == "sqlite":
+        create_search_index(engine)
+
+def downgrade(engine):
+    for index in reversed(board_indexes()):
+        index.drop(engine, checkfirst=True)
+
+def board_queries():
+    # One statement per board access pattern, named for the plan report
+    return {
+        "tasks by team and status": select(Task.task_id).where(Task.team_id == 1, Task.status == "Todo"),
+        "team tasks by due date": select(Task.task_id).where(team_board_filter(1)).order_by(Task.due_date, Task.task_id),
+        "tasks by creator": select(Task.task_id).where(Task.created_by == 1).order_by(Task.due_date, Task.task_id),
+        "tasks assigned to a user": select(TaskAssignee.task_id).where(TaskAssignee.user_id == 1),
+        "user board": select(Task.task_id).where(user_board_filter(1)),
+        "teams of a user": select(TeamMember.team_id).where(TeamMember.user_id == 1),
+        "tasks with a tag": select(TaskTag.task_id).where(TaskTag.tag_id == 1),
+    }
+
+def query_plans(engine):
+    # EXPLAIN QUERY PLAN output per access pattern (SQLite only)
+    plans = {}
+    with engine.connect() as connection:
+        for name, statement in board_queries().items():
+            sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+            plans[name] = [row[-1] for row in rows]
+    return plans
+
+def check_query_plans(engine):
+    # Returns the access patterns whose plan scans a table or index or sorts in
+    # a temporary B-tree; an empty dict means every board query is indexed
+    problems = {}
+    for name, plan in query_plans(engine).items():
+        bad = [step for step in plan if step.startswith("SCAN") or "TEMP B-TREE" in step]
+        if bad:
+            problems[name] = bad
+    return problems
+
+if __name__ == "__main__":
+    # python migrations.py [upgrade|downgrade], against DATABASE_URL
+    engine = create_engine(os.environ.get("DATABASE_URL", "sqlite:///tasks.db"))
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade(engine)
+    else:
+        upgrade(engine)
+    if engine.dialect.name == "sqlite":
+        for name, steps in check_query_plans(engine).items():
+            print(f"{name}: {'; '.join(steps)}")
@@ -0,0 +1,541 @@
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+import requests
+from sqlalchemy import Column, DateTime, Integer, String, Text, create_engine, delete, func, or_, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from api import BackendError, get_client, parse_board_response
+from models import Base, Tag, Task, TaskAssignee, TaskTag, Team, TeamMember, User
+from tags import scope_filter
+from tasks import load_board_tasks, read_task_page, team_board_filter, user_board_filter
+
+# Local-first boards. Each session keeps its boards in an in-memory SQLite
+# database built from models.py and reads them with the backend's own board
+# and page queries. Writes change the mirror at once and wait in an outbox
+# that a worker thread sends in batches; the same thread pulls the boards'
+# changes with delta reads. A task changed on both sides keeps whichever
+# change has the later updated_at, so this assumes clocks roughly in step.
+#
+# Tasks and tags the backend has not created yet have negative ids until it
+# answers.
+SYNC_INTERVAL = 10
+OUTBOX_BATCH_SIZE = 100
+MAX_RETRY_DELAY = 60
+# A mirror whose session has not run for this long stops syncing once its
+# outbox is empty
+MIRROR_IDLE_TIMEOUT = 600
+# Ids per IN list, well under SQLite's bound parameter limit
+CHUNK_SIZE = 500
+TASK_COLUMNS = ("title", "description", "status", "due_date", "created_at", "updated_at", "created_by", "team_id")
+# Team column pages sort within a status, which the backend's indexes stop
+# at; these are raw SQL so they stay out of models.py's metadata
+COLUMN_INDEXES = (
+    "CREATE INDEX ix_mirror_tasks_column_due_date ON tasks (team_id, status, due_date IS NULL, due_date, task_id)",
+    "CREATE INDEX ix_mirror_tasks_column_updated_at ON tasks (team_id, status, updated_at, task_id)",
+)
+# Answers worth sending the same batch again for
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+OutboxBase = declarative_base()
+
+
+class OutboxEntry(OutboxBase):
+    # A write waiting for the backend. payload is a bulk operation's fields,
+    # or for op "create" the POST /tasks/ body.
+    __tablename__ = "outbox"
+
+    entry_id = Column(Integer, primary_key=True)
+    op = Column(String(10), nullable=False)
+    task_id = Column(Integer, nullable=False, index=True)
+    payload = Column(Text)
+    # Sent with a create, so one sent again after its answer was lost does
+    # not create the task twice
+    idempotency_key = Column(String(32))
+    queued_at = Column(DateTime, default=datetime.utcnow)
+
+
+def chunked(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+def parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+def task_row(task):
+    return {
+        "task_id": task["task_id"],
+        "title": task["title"],
+        "description": task.get("description"),
+        "status": task["status"],
+        "due_date": parse_date(task.get("due_date")),
+        "created_at": parse_datetime(task.get("created_at")),
+        "updated_at": parse_datetime(task.get("updated_at")),
+        "created_by": task.get("created_by"),
+        "team_id": task.get("team_id"),
+    }
+
+def user_row(user_id, username, email=None):
+    # Task payloads carry no email or uid, and both are unique and required
+    return {"user_id": user_id, "username": username, "email": email or f"{user_id}@mirror.invalid", "uid": f"~{user_id}"}
+
+def upsert(session, table, rows, keys=None, columns=()):
+    # INSERT ... ON CONFLICT, executed once for all rows: rows matching keys
+    # get columns updated, and without keys rows that clash are skipped
+    if not rows:
+        return
+    statement = insert(table)
+    if keys:
+        statement = statement.on_conflict_do_update(
+            index_elements=keys, set_={column: statement.excluded[column] for column in columns}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing()
+    session.execute(statement, rows)
+
+
+class LocalMirror:
+    # The script thread reads and writes while the worker syncs; one lock
+    # serializes both on the single in-memory connection.
+
+    def __init__(self, uid, user_id, username):
+        self.uid = uid
+        self.user_id = user_id
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        OutboxBase.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            for statement in COLUMN_INDEXES:
+                connection.execute(text(statement))
+        self._lock = threading.RLock()
+        # board key -> {"watermark", "etag"} of its last pull
+        self._boards = {}
+        # board key -> counter bumped whenever rows the board shows change
+        self._versions = {}
+        self._next_local_id = -1
+        self._wake = threading.Event()
+        self._closing = False
+        self._thread = None
+        self.seen_at = time.monotonic()
+        self.error = None
+        self.rejected = []
+        with self.transaction() as session:
+            session.execute(insert(User.__table__).values(user_id=user_id, username=username, email=f"{user_id}@mirror.invalid", uid=uid))
+
+    @contextmanager
+    def transaction(self):
+        with self._lock, Session(self.engine) as session:
+            yield session
+            session.commit()
+
+    def _local_id(self):
+        with self._lock:
+            local_id = self._next_local_id
+            self._next_local_id -= 1
+            return local_id
+
+    def version(self, board_key):
+        return self._versions.get(tuple(board_key), 0)
+
+    def has_board(self, board_key):
+        return tuple(board_key) in self._boards
+
+    def forget_board(self, board_key):
+        # Read in full again on its next visit
+        with self._lock:
+            self._boards.pop(tuple(board_key), None)
+
+    def _bump(self, board_keys):
+        with self._lock:
+            for board_key in board_keys:
+                self._versions[board_key] = self._versions.get(board_key, 0) + 1
+
+    def _task_boards(self, team_ids):
+        # The personal board holds tasks of every team, so it always counts
+        return {("tasks", self.uid)} | {("team_tasks", team_id) for team_id in team_ids if team_id is not None}
+
+    def board_filter(self, board_key):
+        namespace, key = board_key
+        return user_board_filter(self.user_id) if namespace == "tasks" else team_board_filter(key)
+
+    def touch(self):
+        # The session is still there; called on each of its runs
+        self.seen_at = time.monotonic()
+
+    def read_board(self, board_key):
+        with self._lock, Session(self.engine) as session:
+            return load_board_tasks(session, self.board_filter(board_key))
+
+    def read_page(self, board_key, **params):
+        # (status_code, {"tasks", "next_cursor", "total"}, headers), as the
+        # backend answers a page read
+        with self._lock, Session(self.engine) as session:
+            return read_task_page(session, self.board_filter(board_key), **params)
+
+    def status(self):
+        # (writes waiting for the backend, the last sync error or None)
+        with self._lock, Session(self.engine) as session:
+            pending = session.execute(select(func.count(OutboxEntry.entry_id))).scalar()
+        return pending, self.error
+
+    def take_rejected(self):
+        # Messages for writes the backend refused since the last call
+        with self._lock:
+            rejected, self.rejected = self.rejected, []
+        return rejected
+
+    def _pending_ids(self, session):
+        return set(session.execute(select(OutboxEntry.task_id).distinct()).scalars())
+
+    # Remote changes
+
+    def pull_board(self, board_key, client=None):
+        # A delta read since the board's last pull, or a full read the first time
+        board_key = tuple(board_key)
+        namespace, key = board_key
+        client = client or get_client()
+        sync = self._boards.get(board_key, {"watermark": None, "etag": None})
+        read = client.get_tasks if namespace == "tasks" else client.get_team_tasks
+        response = read(key, since=sync['watermark'], etag=sync['etag'])
+        self.apply_remote(board_key, parse_board_response(response, "tasks" if namespace == "tasks" else "team tasks"))
+
+    def apply_remote(self, board_key, update):
+        changed = False
+        if update['mode'] != "unchanged":
+            with self.transaction() as session:
+                changed = self._merge(session, update['tasks'])
+                changed = self._delete(session, update['deleted']) or changed
+                if update['mode'] == "full":
+                    changed = self._delete(session, self._missing(session, board_key, update['tasks'])) or changed
+        with self._lock:
+            previous = self._boards.get(board_key, {})
+            self._boards[board_key] = {"watermark": update['watermark'] or previous.get('watermark'), "etag": update['etag']}
+        if changed:
+            self._bump({board_key, ("tasks", self.uid)})
+
+    def _missing(self, session, board_key, tasks):
+        # Held tasks a full read left out were deleted or left the board.
+        # Tasks of team boards pulled on their own stay until those drop them.
+        criteria = [self.board_filter(board_key), Task.task_id > 0]
+        if board_key[0] == "tasks":
+            team_ids = [key for namespace, key in self._boards if namespace == "team_tasks"]
+            criteria.append(or_(Task.team_id.is_(None), Task.team_id.notin_(team_ids)))
+        held = set(session.execute(select(Task.task_id).where(*criteria)).scalars())
+        return held - {task['task_id'] for task in tasks} - self._pending_ids(session)
+
+    def _merge(self, session, tasks):
+        # Last writer wins: a task with queued writes keeps the local copy
+        # while it is the newer one, otherwise the remote copy replaces it
+        # and the queued writes are dropped
+        if not tasks:
+            return False
+        remote = {task['task_id']: task for task in tasks}
+        local = {}
+        for task_ids in chunked(remote):
+            local.update(session.execute(select(Task.task_id, Task.updated_at).where(Task.task_id.in_(task_ids))).all())
+        pending = self._pending_ids(session)
+        accepted = []
+        overridden = []
+        for task_id, task in remote.items():
+            remote_at = parse_datetime(task.get('updated_at'))
+            if task_id in pending:
+                if local.get(task_id) is not None and remote_at is not None and local[task_id] >= remote_at:
+                    continue
+                overridden.append(task_id)
+            elif task_id in local and local[task_id] == remote_at:
+                # Already held, such as our own write coming back
+                continue
+            accepted.append(task)
+        for task_ids in chunked(overridden):
+            session.execute(delete(OutboxEntry).where(OutboxEntry.task_id.in_(task_ids)))
+        self._write_tasks(session, accepted)
+        return bool(accepted)
+
+    def _write_tasks(self, session, tasks):
+        # Task payloads into rows, replacing their tags and assignees
+        if not tasks:
+            return
+        users = {}
+        tags = {}
+        for task in tasks:
+            for assignee in task.get('assignees') or []:
+                users[assignee['user_id']] = user_row(assignee['user_id'], assignee['username'])
+            # Team tasks share the team's tags; personal tasks use the creator's
+            user_id, team_id = (None, task['team_id']) if task.get('team_id') is not None else (task.get('created_by'), None)
+            for tag in task.get('tags') or []:
+                tags[tag['tag_id']] = {"tag_id": tag['tag_id'], "name": tag['name'], "user_id": user_id, "team_id": team_id}
+        upsert(session, User.__table__, list(users.values()))
+        upsert(session, Tag.__table__, list(tags.values()))
+        upsert(session, Task.__table__, [task_row(task) for task in tasks], ["task_id"], TASK_COLUMNS)
+        for task_ids in chunked(task['task_id'] for task in tasks):
+            session.execute(delete(TaskTag).where(TaskTag.task_id.in_(task_ids)))
+            session.execute(delete(TaskAssignee).where(TaskAssignee.task_id.in_(task_ids)))
+        upsert(session, TaskTag.__table__, [
+            {"task_id": task['task_id'], "tag_id": tag['tag_id']} for task in tasks for tag in task.get('tags') or []
+        ])
+        upsert(session, TaskAssignee.__table__, [
+            {"task_id": task['task_id'], "user_id": assignee['user_id']} for task in tasks for assignee in task.get('assignees') or []
+        ])
+
+    def _delete(self, session, task_ids):
+        # Queued writes to a task deleted on the backend go with it
+        deleted = 0
+        for chunk in chunked(task_ids):
+            for table in (TaskTag, TaskAssignee, OutboxEntry):
+                session.execute(delete(table).where(table.task_id.in_(chunk)))
+            deleted += session.execute(delete(Task).where(Task.task_id.in_(chunk))).rowcount
+        return deleted > 0
+
+    def put_team(self, team_id, team_name, members):
+        with self.transaction() as session:
+            upsert(session, Team.__table__, [{"team_id": team_id, "team_name": team_name}], ["team_id"], ["team_name"])
+            self._put_users(session, members)
+            session.execute(delete(TeamMember).where(TeamMember.team_id == team_id))
+            upsert(session, TeamMember.__table__, [{"team_id": team_id, "user_id": member['user_id']} for member in members])
+
+    def _put_users(self, session, members):
+        rows = [user_row(member['user_id'], member['username'], member.get('email')) for member in members]
+        upsert(session, User.__table__, rows, ["user_id"], ["username", "email"])
+
+    # Local writes
+
+    def write(self, op, task_id=None, payload=None, members=()):
+        # Returns the task's id, negative for a task still being created
+        return self.write_batch([dict(payload or {}, op=op, task_id=task_id)], members)[0]
+
+    def write_batch(self, operations, members=()):
+        # Operations as for the bulk endpoint, plus op "create" with the
+        # POST /tasks/ body. members are the users assignments may refer to.
+        now = datetime.utcnow()
+        task_ids = []
+        team_ids = set()
+        with self.transaction() as session:
+            self._put_users(session, members)
+            for operation in operations:
+                operation = dict(operation)
+                op = operation.pop("op", "update")
+                task_id = operation.pop("task_id", None)
+                if op == "create":
+                    task_id = self._local_id()
+                    session.execute(insert(Task.__table__).values(
+                        task_id=task_id, title="", status="Todo", created_at=now, updated_at=now,
+                        created_by=self.user_id, team_id=operation.get('team_id'),
+                    ))
+                row = session.execute(select(Task.team_id, Task.created_by).where(Task.task_id == task_id)).first()
+                if row is None:
+                    # Deleted meanwhile, here or on the backend
+                    task_ids.append(None)
+                    continue
+                team_ids.add(row.team_id)
+                task_ids.append(task_id)
+                if op == "delete":
+                    self._delete(session, [task_id])
+                    if task_id > 0:
+                        session.add(OutboxEntry(op="delete", task_id=task_id))
+                    continue
+                self._apply(session, task_id, row, operation, now)
+                self._queue(session, op, task_id, operation)
+        self._bump(self._task_boards(team_ids))
+        self._wake.set()
+        return task_ids
+
+    def _apply(self, session, task_id, row, operation, now):
+        values = {field: operation[field] for field in ("title", "description", "status", "due_date") if field in operation}
+        if 'due_date' in values:
+            values['due_date'] = parse_date(values['due_date'])
+        session.execute(update(Task).where(Task.task_id == task_id).values(updated_at=now, **values))
+        if "tags" in operation or "add_tags" in operation:
+            if "tags" in operation:
+                session.execute(delete(TaskTag).where(TaskTag.task_id == task_id))
+            tag_ids = self._resolve_tags(session, operation.get("tags", []) + operation.get("add_tags", []), row)
+            upsert(session, TaskTag.__table__, [{"task_id": task_id, "tag_id": tag_id} for tag_id in tag_ids])
+        if "assignee" in operation:
+            session.execute(delete(TaskAssignee).where(TaskAssignee.task_id == task_id))
+        user_ids = operation.get("assignee", []) + operation.get("add_assignees", [])
+        upsert(session, TaskAssignee.__table__, [{"task_id": task_id, "user_id": user_id} for user_id in user_ids])
+
+    def _resolve_tags(self, session, names, row):
+        # Ids for tag names in the task's scope. A name the mirror has not
+        # seen gets a local id; the backend's answer brings the real tag.
+        names = list(dict.fromkeys(name for name in names if name))
+        if not names:
+            return []
+        user_id, team_id = (None, row.team_id) if row.team_id is not None else (row.created_by, None)
+        known = dict(session.execute(
+            select(Tag.name, func.max(Tag.tag_id))
+            .where(Tag.name.in_(names), scope_filter(Tag.user_id, user_id), scope_filter(Tag.team_id, team_id))
+            .group_by(Tag.name)
+        ).all())
+        missing = [name for name in names if name not in known]
+        for name in missing:
+            known[name] = self._local_id()
+        upsert(session, Tag.__table__, [{"tag_id": known[name], "name": name, "user_id": user_id, "team_id": team_id} for name in missing])
+        return [known[name] for name in names]
+
+    def _queue(self, session, op, task_id, operation):
+        # A task the backend has not created yet is sent as one create with
+        # its current fields, however often it was edited
+        create = session.execute(
+            select(OutboxEntry).where(OutboxEntry.task_id == task_id, OutboxEntry.op == "create")
+        ).scalar_one_or_none()
+        if op == "create" or create is not None:
+            base = json.loads(create.payload) if create is not None else {key: operation[key] for key in ("uid", "team_id") if key in operation}
+            payload = json.dumps(self._create_payload(session, task_id, base))
+            if create is None:
+                session.add(OutboxEntry(op="create", task_id=task_id, payload=payload, idempotency_key=uuid.uuid4().hex))
+            else:
+                create.payload = payload
+            return
+        session.add(OutboxEntry(op=op, task_id=task_id, payload=json.dumps(operation)))
+
+    def _create_payload(self, session, task_id, base):
+        task = load_board_tasks(session, Task.task_id == task_id)[0]
+        payload = dict(base, **{field: task[field] for field in ("title", "description", "status", "due_date")})
+        payload['tags'] = [tag['name'] for tag in task['tags']]
+        if task['assignees']:
+            payload['assignee'] = [assignee['user_id'] for assignee in task['assignees']]
+        return payload
+
+    # Sending the outbox
+
+    def flush(self, client):
+        # Sends the outbox until it is empty. Network errors and answers worth
+        # retrying raise with the entries still queued.
+        while True:
+            with self._lock, Session(self.engine) as session:
+                entries = session.execute(
+                    select(OutboxEntry.entry_id, OutboxEntry.op, OutboxEntry.task_id, OutboxEntry.payload, OutboxEntry.idempotency_key)
+                    .order_by(OutboxEntry.entry_id)
+                    .limit(OUTBOX_BATCH_SIZE)
+                ).all()
+            if not entries:
+                return
+            for entry in entries:
+                if entry.op == "create":
+                    self._send_create(client, entry)
+            batch = [entry for entry in entries if entry.op != "create"]
+            if batch:
+                self._send_batch(client, batch)
+
+    def _send_create(self, client, entry):
+        response = client.create_task(json.loads(entry.payload), idempotency_key=entry.idempotency_key)
+        if response.status_code in RETRY_STATUSES:
+            raise BackendError(f"Failed to create task. Error {response.status_code}", response.status_code)
+        created = response.json() if response.status_code == 200 else None
+        with self.transaction() as session:
+            current = session.get(OutboxEntry, entry.entry_id)
+            if response.status_code != 200:
+                self._reject(session, [entry.task_id], f"A new task could not be created. Error {response.status_code}")
+                return
+            if not isinstance(created, dict) or 'task_id' not in created:
+                # No task in the answer; the next full pull brings it in
+                self._delete(session, [entry.task_id])
+                self._resync()
+                return
+            task_id = created['task_id']
+            if current is None:
+                # Deleted here while it was being created
+                session.add(OutboxEntry(op="delete", task_id=task_id))
+                return
+            self._delete(session, [task_id])
+            for table in (Task, TaskTag, TaskAssignee, OutboxEntry):
+                session.execute(update(table).where(table.task_id == entry.task_id).values(task_id=task_id))
+            if current.payload == entry.payload and response.headers.get("Idempotent-Replayed") != "true":
+                session.delete(current)
+                self._write_tasks(session, [created])
+            else:
+                # Edited while it was being created, or the answer is the
+                # first send's, which may predate edits; the task's current
+                # fields go out as an update
+                current.op = "update"
+        self._bump(self._task_boards([created.get('team_id')]))
+
+    def _send_batch(self, client, entries):
+        operations = [dict(json.loads(entry.payload or "{}"), op=entry.op, task_id=entry.task_id) for entry in entries]
+        response = client.bulk_tasks(operations)
+        if response.status_code in RETRY_STATUSES:
+            raise BackendError(f"Failed to update tasks. Error {response.status_code}", response.status_code)
+        results = response.json()['results'] if response.status_code == 200 else None
+        with self.transaction() as session:
+            if results is None:
+                self._reject(session, [entry.task_id for entry in entries], f"Changes to {len(entries)} tasks were rejected. Error {response.status_code}")
+                return
+            session.execute(delete(OutboxEntry).where(OutboxEntry.entry_id.in_([entry.entry_id for entry in entries])))
+            # Tasks written again since this batch left keep their local copy
+            pending = self._pending_ids(session)
+            for result in results:
+                if result['ok']:
+                    if 'task' in result and result['task_id'] not in pending:
+                        self._write_tasks(session, [result['task']])
+                elif result['status'] == 404:
+                    self._delete(session, [result['task_id']])
+                else:
+                    self._reject(session, [result['task_id']], f"#{result['task_id']}: {result.get('detail')}")
+        self._bump(set(self._boards) | {("tasks", self.uid)})
+
+    def _reject(self, session, task_ids, message):
+        # The refused writes are dropped and every board is read in full
+        # again, which restores the backend's copy of the tasks
+        for chunk in chunked(task_ids):
+            session.execute(delete(OutboxEntry).where(OutboxEntry.task_id.in_(chunk)))
+        self._delete(session, [task_id for task_id in task_ids if task_id < 0])
+        self.rejected.append(message)
+        self._resync()
+
+    def _resync(self):
+        with self._lock:
+            for sync in self._boards.values():
+                sync.update(watermark=None, etag=None)
+
+    # Worker
+
+    def start(self):
+        # Also brings back a worker that stopped while the session was away
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closing = False
+                self._thread = threading.Thread(target=self._run, name=f"mirror-{self.uid}", daemon=True)
+                self._thread.start()
+
+    def request_sync(self):
+        self._wake.set()
+
+    def close(self):
+        # Sends what is still queued, then stops
+        self._closing = True
+        self._wake.set()
+
+    def idle(self):
+        return time.monotonic() - self.seen_at > MIRROR_IDLE_TIMEOUT
+
+    def _run(self):
+        # Queued writes are never given up on, so the worker outlives its
+        # session until they are sent
+        client = get_client()
+        failures = 0
+        while True:
+            try:
+                self.flush(client)
+                if not self._closing:
+                    for board_key in list(self._boards):
+                        self.pull_board(board_key, client)
+                failures = 0
+                self.error = None
+            except (BackendError, requests.RequestException, ValueError, KeyError) as e:
+                failures += 1
+                self.error = str(e)
+            if (self._closing or self.idle()) and self.status()[0] == 0:
+                if self._closing:
+                    self.engine.dispose()
+                return
+            self._wake.wait(SYNC_INTERVAL if not failures else min(2 ** failures, MAX_RETRY_DELAY))
+            self._wake.clear()
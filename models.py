@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, UniqueConstraint, Index, event, inspect
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 import hashlib
@@ -29,8 +29,10 @@ class User(Base):
         b64_encoded = base64.b64encode(bytes.fromhex(hex_dig)).decode()
         return b64_encoded[:10]
     
-    def __init__(self):
-        self.uid = self.generate_uid(self.email, self.username)
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.uid is None:
+            self.uid = self.generate_uid(self.email, self.username)
 
 class Team(Base):
     __tablename__ = "teams"
@@ -49,6 +51,9 @@ class TeamMember(Base):
     team_id = Column(Integer, ForeignKey("teams.team_id"), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
 
+    # The primary key only serves lookups by team; this one serves "teams of a user"
+    __table_args__ = (Index('ix_team_members_user_team', 'user_id', 'team_id'),)
+
 class Task(Base):
     __tablename__ = "tasks"
 
@@ -60,19 +65,34 @@ class Task(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = Column(Integer, ForeignKey("users.user_id"))
-    team_id = Column(Integer, ForeignKey("teams.team_id"))
+    # Keeps the old team when changed on an unloaded task, for its tombstone
+    team_id = column_property(Column(Integer, ForeignKey("teams.team_id")), active_history=True)
 
     creator = relationship("User", back_populates="created_tasks")
     team = relationship("Team", back_populates="tasks")
     assignees = relationship("User", secondary="task_assignees", back_populates="assigned_tasks")
     tags = relationship("Tag", secondary="task_tags", back_populates="tasks")
 
+    __table_args__ = (
+        # Team board columns, and team boards in due-date order
+        Index('ix_tasks_team_status', 'team_id', 'status'),
+        Index('ix_tasks_team_due_date', 'team_id', 'due_date', 'task_id'),
+        # Tasks by creator, in due-date order
+        Index('ix_tasks_creator_due_date', 'created_by', 'due_date', 'task_id'),
+        # Delta sync and board ETags: changes since a watermark, per board
+        Index('ix_tasks_team_updated_at', 'team_id', 'updated_at'),
+        Index('ix_tasks_creator_updated_at', 'created_by', 'updated_at'),
+    )
+
 class TaskAssignee(Base):
     __tablename__ = "task_assignees"
 
     task_id = Column(Integer, ForeignKey("tasks.task_id"), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
 
+    # Tasks assigned to a user
+    __table_args__ = (Index('ix_task_assignees_user_task', 'user_id', 'task_id'),)
+
 class Tag(Base):
     __tablename__ = "tags"
 
@@ -92,3 +112,63 @@ class TaskTag(Base):
 
     task_id = Column(Integer, ForeignKey("tasks.task_id"), primary_key=True)
     tag_id = Column(Integer, ForeignKey("tags.tag_id"), primary_key=True)
+
+    # Tasks carrying a tag
+    __table_args__ = (Index('ix_task_tags_tag_task', 'tag_id', 'task_id'),)
+
+class TaskTombstone(Base):
+    # A task that left a board. Deletions name its team and creator; a task
+    # that only left one board names that board: team_id for a team it moved
+    # away from, created_by for a user it was unassigned from.
+    __tablename__ = "task_tombstones"
+
+    tombstone_id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, nullable=False)
+    team_id = Column(Integer)
+    created_by = Column(Integer)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_task_tombstones_team_deleted_at', 'team_id', 'deleted_at'),
+        Index('ix_task_tombstones_creator_deleted_at', 'created_by', 'deleted_at'),
+    )
+
+@event.listens_for(Task, "after_delete")
+def record_task_tombstone(mapper, connection, target):
+    # Delta sync clients learn about deletions from these rows
+    connection.execute(TaskTombstone.__table__.insert().values(
+        task_id=target.task_id,
+        team_id=target.team_id,
+        created_by=target.created_by,
+        deleted_at=datetime.utcnow(),
+    ))
+
+def persisted_id(instance):
+    # The primary key from the identity map, which never loads anything
+    identity = inspect(instance).identity
+    return identity[0] if identity else None
+
+@event.listens_for(Task, "after_update")
+def record_task_scope_exits(mapper, connection, target):
+    # Delta reads only return tasks still on a board, so a task that leaves
+    # one without being deleted needs a tombstone for that board. Only
+    # attribute history is read: a lazy load here would run mid-flush.
+    state = inspect(target)
+    team = state.attrs.team_id.history
+    exits = [
+        {"team_id": team_id, "created_by": None}
+        for team_id in team.deleted
+        if team_id is not None and team_id not in team.added
+    ]
+    if "assignees" not in state.unloaded:
+        assignees = state.attrs.assignees.history
+        current = {persisted_id(user) for user in [*assignees.added, *assignees.unchanged]}
+        creator = state.attrs.created_by.loaded_value
+        exits.extend(
+            {"team_id": None, "created_by": user_id}
+            for user_id in map(persisted_id, assignees.deleted)
+            if user_id is not None and user_id not in current and user_id != creator
+        )
+    if exits:
+        now = datetime.utcnow()
+        connection.execute(TaskTombstone.__table__.insert(), [dict(exit, task_id=target.task_id, deleted_at=now) for exit in exits])
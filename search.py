@@ -0,0 +1,123 @@
+import re
+from sqlalchemy import column, func, literal_column, select, table
+from models import Task
+from tasks import (
+    DEFAULT_PAGE_SIZE, TaskOperationError, decode_cursor, encode_cursor, get_user,
+    load_board_tasks, page_limit, team_board_filter, user_board_filter,
+)
+
+# SQLite FTS5 index over task titles, descriptions and tag names. rowid is
+# the task_id; triggers keep it in step with tasks, task_tags and tags.
+SEARCH_TABLE = "task_search"
+# bm25 column weights: title, description, tags
+RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+SEARCH_SCHEMA = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        title, description, tags,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, description, tags)
+        VALUES (new.task_id, new.title, coalesce(new.description, ''), '');
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_update AFTER UPDATE OF title, description ON tasks BEGIN
+        UPDATE {SEARCH_TABLE} SET title = new.title, description = coalesce(new.description, '')
+        WHERE rowid = new.task_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_delete AFTER DELETE ON tasks BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.task_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_tag_insert AFTER INSERT ON task_tags BEGIN
+        UPDATE {SEARCH_TABLE} SET tags = (
+            SELECT coalesce(group_concat(tags.name, ' '), '') FROM task_tags
+            JOIN tags ON tags.tag_id = task_tags.tag_id WHERE task_tags.task_id = new.task_id
+        ) WHERE rowid = new.task_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_tag_delete AFTER DELETE ON task_tags BEGIN
+        UPDATE {SEARCH_TABLE} SET tags = (
+            SELECT coalesce(group_concat(tags.name, ' '), '') FROM task_tags
+            JOIN tags ON tags.tag_id = task_tags.tag_id WHERE task_tags.task_id = old.task_id
+        ) WHERE rowid = old.task_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_search_tag_rename AFTER UPDATE OF name ON tags BEGIN
+        UPDATE {SEARCH_TABLE} SET tags = (
+            SELECT coalesce(group_concat(t.name, ' '), '') FROM task_tags tt
+            JOIN tags t ON t.tag_id = tt.tag_id WHERE tt.task_id = {SEARCH_TABLE}.rowid
+        ) WHERE rowid IN (SELECT task_id FROM task_tags WHERE tag_id = new.tag_id);
+    END""",
+)
+
+REBUILD_SEARCH_INDEX = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, title, description, tags)
+    SELECT tasks.task_id, tasks.title, coalesce(tasks.description, ''),
+           coalesce((SELECT group_concat(tags.name, ' ') FROM task_tags
+                     JOIN tags ON tags.tag_id = task_tags.tag_id
+                     WHERE task_tags.task_id = tasks.task_id), '')
+    FROM tasks
+"""
+
+def create_search_index(engine):
+    # Creates the index and its triggers, filling it from existing tasks the
+    # first time
+    with engine.begin() as connection:
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+        ).first()
+        for statement in SEARCH_SCHEMA:
+            connection.exec_driver_sql(statement)
+        if not exists:
+            connection.exec_driver_sql(REBUILD_SEARCH_INDEX)
+
+def rebuild_search_index(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DELETE FROM {SEARCH_TABLE}")
+        connection.exec_driver_sql(REBUILD_SEARCH_INDEX)
+
+def match_expression(query):
+    # Every word must match, each as a prefix; quoting keeps FTS5 syntax
+    # characters in user input from being parsed as operators
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+def search_board(session, board_filter, query, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    # Returns (status_code, {"tasks", "next_cursor", "total"}, headers), best
+    # matches first. Rank order has no stable keyset, so the cursor carries
+    # an offset.
+    expression = match_expression(query)
+    if not expression:
+        return 200, {"tasks": [], "next_cursor": None, "total": 0}, {}
+    try:
+        limit = page_limit(limit)
+        offset = decode_cursor(cursor, size=1)[0] if cursor else 0
+        if offset < 0:
+            raise TaskOperationError(400, "Invalid cursor")
+    except TaskOperationError as e:
+        return e.status_code, {"detail": e.detail}, {}
+
+    index = table(SEARCH_TABLE, column("rowid"))
+    search = literal_column(SEARCH_TABLE)
+    matches = (
+        select(index.c.rowid.label("task_id"))
+        .join(Task, Task.task_id == index.c.rowid)
+        .where(search.op("MATCH")(expression), board_filter)
+    )
+    total = session.execute(select(func.count()).select_from(matches.subquery())).scalar()
+    ranked = session.execute(
+        matches.order_by(func.bm25(search, *RANK_WEIGHTS)).limit(limit).offset(offset)
+    ).scalars().all()
+
+    by_id = {task["task_id"]: task for task in load_board_tasks(session, Task.task_id.in_(ranked), limit=len(ranked))}
+    tasks = [by_id[task_id] for task_id in ranked if task_id in by_id]
+    next_cursor = encode_cursor([offset + limit]) if offset + limit < total else None
+    return 200, {"tasks": tasks, "next_cursor": next_cursor, "total": total}, {}
+
+def search_user_tasks(session, uid, query, **params):
+    user = get_user(session, uid)
+    if user is None:
+        return 404, {"detail": "User not found"}, {}
+    return search_board(session, user_board_filter(user.user_id), query, **params)
+
+def search_team_tasks(session, team_id, query, **params):
+    return search_board(session, team_board_filter(team_id), query, **params)
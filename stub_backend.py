@@ -0,0 +1,412 @@
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from wire import SHAPE_HEADER, encode_response
+from changes import EVENT_STREAM_TYPE, LONG_POLL_TIMEOUT, ChangeFeed, change_scope, poll_changes, stream_changes, task_change
+
+# In-memory stand-in for the backend, for benchmarks and local runs. It
+# serves the routes the frontend calls from synthetic data, with a fixed
+# latency added to every request, and counts requests and bytes sent.
+STATUSES = ("Todo", "In Progress", "Done")
+BENCHMARK_USER_ID = 1
+
+
+class StubData:
+    def __init__(self, tasks=1000, teams=10, users=50, tags_per_scope=20, seed=0):
+        rng = random.Random(seed)
+        now = datetime.utcnow()
+        self.users = {
+            user_id: {"user_id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com", "uid": f"U{user_id:09d}"}
+            for user_id in range(1, users + 1)
+        }
+        self.uids = {user["uid"]: user_id for user_id, user in self.users.items()}
+        self.teams = {team_id: {"team_id": team_id, "team_name": f"Team {team_id:02d}"} for team_id in range(1, teams + 1)}
+        # The benchmark user is in every team
+        self.members = {
+            team_id: sorted({BENCHMARK_USER_ID} | set(rng.sample(list(self.users), min(users, 8))))
+            for team_id in self.teams
+        }
+        self.tags = {}
+        self.scope_tags = {}
+        for scope in [(BENCHMARK_USER_ID, None)] + [(None, team_id) for team_id in self.teams]:
+            self.scope_tags[scope] = [self.add_tag(f"tag{n}", *scope) for n in range(tags_per_scope)]
+
+        self.tasks = {}
+        self.deleted = []
+        self.version = 0
+        for task_id in range(1, tasks + 1):
+            # Most tasks live on team boards, the rest on the benchmark user's
+            team_id = rng.choice(list(self.teams)) if self.teams and rng.random() < 0.8 else None
+            people = self.members[team_id] if team_id else [BENCHMARK_USER_ID]
+            scope = (None, team_id) if team_id else (BENCHMARK_USER_ID, None)
+            due = now.date() + timedelta(days=rng.randint(-30, 60)) if rng.random() < 0.8 else None
+            updated = now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+            self.tasks[task_id] = {
+                "task_id": task_id,
+                "title": f"Task {task_id}: {rng.choice(['Fix', 'Write', 'Review', 'Plan', 'Ship'])} {rng.choice(['login', 'report', 'board', 'search', 'export'])}",
+                "description": f"Synthetic task {task_id} for benchmarking.",
+                "status": rng.choice(STATUSES),
+                "due_date": due.isoformat() if due else None,
+                "created_at": updated.isoformat(),
+                "updated_at": updated.isoformat(),
+                "created_by": rng.choice(people),
+                "team_id": team_id,
+                "tags": [self.tag_payload(tag_id) for tag_id in rng.sample(self.scope_tags[scope], rng.randint(0, 3))],
+                "assignees": [self.user_payload(user_id) for user_id in rng.sample(people, rng.randint(0, min(2, len(people))))],
+            }
+        self.next_task_id = tasks + 1
+        # Idempotency-Key of a POST /tasks -> its first answer
+        self.created = {}
+        self.lock = threading.Lock()
+        # Writes are announced here for /changes and /events
+        self.feed = ChangeFeed()
+
+    def add_tag(self, name, user_id, team_id):
+        tag_id = len(self.tags) + 1
+        self.tags[tag_id] = {"tag_id": tag_id, "name": name, "user_id": user_id, "team_id": team_id}
+        return tag_id
+
+    def tag_payload(self, tag_id):
+        return {"tag_id": tag_id, "name": self.tags[tag_id]["name"]}
+
+    def user_payload(self, user_id):
+        return {"user_id": user_id, "username": self.users[user_id]["username"]}
+
+    def resolve_tags(self, names, user_id, team_id):
+        known = {self.tags[tag_id]["name"]: tag_id for tag_id in self.scope_tags.setdefault((user_id, team_id), [])}
+        for name in names:
+            if name not in known:
+                known[name] = self.add_tag(name, user_id, team_id)
+                self.scope_tags[(user_id, team_id)].append(known[name])
+        return [self.tag_payload(known[name]) for name in dict.fromkeys(names)]
+
+    def user_board(self, user_id):
+        return [
+            task for task in self.tasks.values()
+            if task["created_by"] == user_id or any(assignee["user_id"] == user_id for assignee in task["assignees"])
+        ]
+
+    def team_board(self, team_id):
+        return [task for task in self.tasks.values() if task["team_id"] == team_id]
+
+    def update(self, task_id, changes):
+        # Applies a write payload the way the backend does
+        task = self.tasks[task_id]
+        before = (task["status"], [assignee["user_id"] for assignee in task["assignees"]])
+        for field in ("title", "description", "status", "due_date"):
+            if field in changes:
+                task[field] = changes[field]
+        scope = (None, task["team_id"]) if task["team_id"] else (task["created_by"], None)
+        if "tags" in changes or "add_tags" in changes:
+            names = changes["tags"] if "tags" in changes else [tag["name"] for tag in task["tags"]]
+            task["tags"] = self.resolve_tags(names + changes.get("add_tags", []), *scope)
+        if "assignee" in changes:
+            task["assignees"] = [self.user_payload(user_id) for user_id in changes["assignee"] if user_id in self.users]
+        if changes.get("add_assignees"):
+            current = {assignee["user_id"] for assignee in task["assignees"]}
+            task["assignees"] += [self.user_payload(user_id) for user_id in changes["add_assignees"] if user_id not in current]
+        task["updated_at"] = datetime.utcnow().isoformat()
+        self.version += 1
+        self.feed.publish([self.change("upsert", task, *before)])
+        return task
+
+    def delete(self, task_id):
+        task = self.tasks.pop(task_id)
+        self.deleted.append((datetime.utcnow().isoformat(), task_id))
+        self.version += 1
+        self.feed.publish([self.change("delete", task, task["status"], [])])
+
+    def change(self, op, task, old_status, old_assignee_ids):
+        user_ids = [task["created_by"]] + old_assignee_ids + [assignee["user_id"] for assignee in task["assignees"]]
+        return task_change(op, task["task_id"], task["team_id"], user_ids, [old_status, task["status"]], task["updated_at"])
+
+    def change_scope(self, uid):
+        user_id = self.uids.get(uid)
+        if user_id is None:
+            return None
+        return change_scope(uid, user_id, [team_id for team_id, members in self.members.items() if user_id in members])
+
+
+def page_of(tasks, params):
+    # Filtered, sorted and paged like read_task_page; the cursor is an offset
+    status, tag, text = params.get("status"), params.get("tag"), (params.get("text") or "").lower()
+    assignee = int(params["assignee"]) if params.get("assignee") else None
+    selected = [
+        task for task in tasks
+        if (not status or task["status"] == status)
+        and (not tag or any(item["name"] == tag for item in task["tags"]))
+        and (assignee is None or any(item["user_id"] == assignee for item in task["assignees"]))
+        and (not params.get("due_after") or (task["due_date"] or "") >= params["due_after"])
+        and (not params.get("due_before") or (task["due_date"] or "9999") <= params["due_before"])
+        and (not text or text in task["title"].lower() or text in (task["description"] or "").lower())
+    ]
+    if params.get("sort") == "updated_at":
+        selected.sort(key=lambda task: (task["updated_at"], task["task_id"]), reverse=True)
+    else:
+        selected.sort(key=lambda task: (task["due_date"] or "9999-12-31", task["task_id"]))
+    limit = min(int(params.get("limit", 50)), 200)
+    offset = json.loads(base64.urlsafe_b64decode(params["cursor"]))[0] if params.get("cursor") else 0
+    next_offset = offset + limit
+    next_cursor = base64.urlsafe_b64encode(json.dumps([next_offset]).encode()).decode() if next_offset < len(selected) else None
+    return {"tasks": selected[offset:next_offset], "next_cursor": next_cursor, "total": len(selected)}
+
+def search_of(tasks, params):
+    terms = (params.get("q") or "").lower().split()
+    matches = [
+        task for task in tasks
+        if all(any(term in text for text in (task["title"].lower(), (task["description"] or "").lower(), *(tag["name"] for tag in task["tags"]))) for term in terms)
+    ]
+    return page_of(matches, {"limit": params.get("limit", 50), "cursor": params.get("cursor")})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        stub = self.server.stub
+        time.sleep(stub.latency)
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length)) if length else None
+        if method == "GET" and parts[:1] in (["changes"], ["events"]) and len(parts) == 2:
+            # These wait for writes, so they must not hold the data lock
+            status_code, body, headers = watch(stub.data, parts[0], parts[1], params, self.headers)
+            if headers.get("Content-Type") == EVENT_STREAM_TYPE:
+                self.send_events(body, headers)
+                return
+        else:
+            with stub.data.lock:
+                status_code, body, headers = route(stub.data, method, parts, params, payload, self.headers)
+        status_code, data, headers = encode_response(
+            status_code, body, headers,
+            accept=self.headers.get("Accept", ""),
+            accept_encoding=self.headers.get("Accept-Encoding", ""),
+            shape=self.headers.get(SHAPE_HEADER),
+        )
+        self.send_response(status_code)
+        headers.setdefault("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        stub.count(len(data))
+
+    def send_events(self, events, headers):
+        # No Content-Length, so the stream ends with the connection
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        try:
+            for text in events:
+                data = text.encode()
+                self.wfile.write(data)
+                self.wfile.flush()
+                sent += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.server.stub.count(sent)
+
+
+def board_response(data, tasks, params, request_headers):
+    # Full list, delta or 304, like read_board
+    etag = f'W/"{data.version}"'
+    watermark = datetime.utcnow().isoformat()
+    headers = {"ETag": etag, "X-Sync-Watermark": watermark}
+    if request_headers.get("If-None-Match") == etag:
+        return 304, None, headers
+    since = params.get("since")
+    if since is None:
+        return 200, tasks, headers
+    changed = [task for task in tasks if task["updated_at"] > since]
+    deleted = [task_id for deleted_at, task_id in data.deleted if deleted_at > since]
+    return 200, {"tasks": changed, "deleted": deleted, "watermark": watermark}, headers
+
+def watch(data, kind, uid, params, request_headers):
+    with data.lock:
+        scope = data.change_scope(uid)
+    if kind == "changes":
+        after = int(params["after"]) if params.get("after") else None
+        return poll_changes(scope, after, float(params.get("timeout", LONG_POLL_TIMEOUT)), data.feed)
+    return stream_changes(scope, request_headers.get("Last-Event-ID"), data.feed)
+
+def route(data, method, parts, params, payload, request_headers):
+    not_found = (404, {"detail": "Not found"}, {})
+    if method == "POST" and parts == ["auth"]:
+        user_id = data.uids.get((payload or {}).get("uid"))
+        return (200, dict(data.users[user_id]), {}) if user_id else (401, {"detail": "Unknown user"}, {})
+    if method == "POST" and parts == ["user"]:
+        user_id = len(data.users) + 1
+        data.users[user_id] = dict(payload, user_id=user_id, uid=f"U{user_id:09d}")
+        data.uids[data.users[user_id]["uid"]] = user_id
+        return 200, {"uid": data.users[user_id]["uid"]}, {}
+
+    if method == "GET" and parts[:1] == ["tasks"] and len(parts) >= 2:
+        user_id = data.uids.get(parts[1])
+        if user_id is None:
+            return not_found
+        tasks = data.user_board(user_id)
+        if parts[2:] == ["search"]:
+            return 200, search_of(tasks, params), {}
+        if "limit" in params:
+            return 200, page_of(tasks, params), {}
+        return board_response(data, tasks, params, request_headers)
+    if method == "GET" and parts[:1] == ["team-tasks"] and len(parts) >= 2:
+        team_id = int(parts[1])
+        if team_id not in data.teams:
+            return not_found
+        tasks = data.team_board(team_id)
+        if parts[2:] == ["search"]:
+            return 200, search_of(tasks, params), {}
+        if "limit" in params:
+            return 200, page_of(tasks, params), {}
+        return board_response(data, tasks, params, request_headers)
+    if method == "GET" and parts[:1] == ["teams"] and len(parts) == 2:
+        user_id = data.uids.get(parts[1])
+        return 200, [data.teams[team_id] for team_id, members in data.members.items() if user_id in members], {}
+    if method == "GET" and parts[:1] == ["teams"] and parts[2:] == ["members"]:
+        members = data.members.get(int(parts[1]), [])
+        return 200, [{key: data.users[user_id][key] for key in ("user_id", "username", "email")} for user_id in members], {}
+    if method == "GET" and parts[:1] == ["bootstrap"] and len(parts) == 2:
+        user_id = data.uids.get(parts[1])
+        if user_id is None:
+            return not_found
+        since = params.get("since")
+        teams = []
+        for team_id, members in data.members.items():
+            if user_id not in members:
+                continue
+            tasks = [] if params.get("tasks") == "false" else data.team_board(team_id)
+            if since:
+                tasks = [task for task in tasks if task["updated_at"] > since]
+            teams.append(dict(
+                data.teams[team_id],
+                members=[{key: data.users[member][key] for key in ("user_id", "username", "email")} for member in members],
+                tasks=tasks,
+                deleted=[task_id for deleted_at, task_id in data.deleted if since and deleted_at > since],
+            ))
+        return 200, {"teams": teams, "watermark": datetime.utcnow().isoformat(), "delta": since is not None}, {}
+    if method == "GET" and parts[:1] in (["tags"], ["team-tags"]) and len(parts) == 2:
+        scope = (data.uids.get(parts[1]), None) if parts[0] == "tags" else (None, int(parts[1]))
+        return 200, sorted(data.tags[tag_id]["name"] for tag_id in data.scope_tags.get(scope, [])), {}
+
+    if method == "POST" and parts == ["tasks"]:
+        key = request_headers.get("Idempotency-Key")
+        if key in data.created:
+            # A retry of a create whose answer was lost
+            return 200, data.created[key], {"Idempotent-Replayed": "true"}
+        user_id = data.uids.get(payload.get("uid"))
+        task_id = data.next_task_id
+        data.next_task_id += 1
+        now = datetime.utcnow().isoformat()
+        data.tasks[task_id] = {
+            "task_id": task_id, "title": "", "description": None, "status": "Todo", "due_date": None,
+            "created_at": now, "updated_at": now, "created_by": user_id, "team_id": payload.get("team_id"),
+            "tags": [], "assignees": [],
+        }
+        task = data.update(task_id, payload)
+        if key is not None:
+            data.created[key] = json.loads(json.dumps(task))
+        return 200, task, {}
+    if method == "POST" and parts == ["tasks", "bulk"]:
+        results = []
+        for operation in payload["operations"]:
+            task_id = operation.get("task_id")
+            if task_id not in data.tasks:
+                results.append({"task_id": task_id, "ok": False, "status": 404, "detail": "Task not found"})
+            elif operation.get("status", "Todo") not in STATUSES:
+                results.append({"task_id": task_id, "ok": False, "status": 422, "detail": f"Invalid status: {operation['status']}"})
+            elif operation.get("op") == "delete":
+                data.delete(task_id)
+                results.append({"task_id": task_id, "ok": True, "status": 204})
+            else:
+                results.append({"task_id": task_id, "ok": True, "status": 200, "task": data.update(task_id, operation)})
+        return 200, {"results": results}, {}
+    if method in ("PUT", "DELETE") and parts[:1] == ["tasks"] and len(parts) == 2:
+        task_id = int(parts[1])
+        if task_id not in data.tasks:
+            return 404, {"detail": "Task not found"}, {}
+        if method == "DELETE":
+            data.delete(task_id)
+            return 204, None, {}
+        return 200, data.update(task_id, payload), {}
+    return not_found
+
+
+class StubBackend:
+    def __init__(self, data, latency=0.0, host="127.0.0.1", port=0):
+        self.data = data
+        self.latency = latency
+        self.server = ThreadingHTTPServer((host, port), StubHandler)
+        self.server.stub = self
+        self.thread = None
+        self._lock = threading.Lock()
+        self.reset_metrics()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, size):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def reset_metrics(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+    def metrics(self):
+        with self._lock:
+            return {"requests": self.requests, "bytes": self.bytes_sent}
+
+
+if __name__ == "__main__":
+    # Serve synthetic data for running the app by hand:
+    # TASK_APP_BACKEND_URL=http://127.0.0.1:8000 streamlit run login.py
+    parser = argparse.ArgumentParser(description="In-memory stub of the task backend")
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--teams", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    stub = StubBackend(StubData(tasks=args.tasks, teams=args.teams), latency=args.latency, port=args.port)
+    print(f"Serving {args.tasks} tasks in {args.teams} teams on {stub.url}; log in as {stub.data.users[BENCHMARK_USER_ID]['uid']}")
+    stub.server.serve_forever()
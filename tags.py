@@ -0,0 +1,104 @@
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from cache import MISSING, TTLCache
+from models import Tag
+
+# name -> tag_id per tag scope: ("tags", user_id, None) for personal tags and
+# ("tags", None, team_id) for a team's. Tags are only ever added by writes,
+# so a name missing from the cache is looked up before it is inserted; the
+# TTL bounds how long another process's renames or deletions go unseen.
+TAG_CACHE_TTL = 300
+tag_cache = TTLCache(default_ttl=TAG_CACHE_TTL)
+
+
+def scope_filter(column, value):
+    return column.is_(None) if value is None else column == value
+
+def scope_tags(session, user_id, team_id):
+    # Every tag of a scope, one query on a cache miss
+    tag_ids = tag_cache.get(("tags", user_id, team_id))
+    if tag_ids is MISSING:
+        rows = session.execute(
+            select(Tag.name, Tag.tag_id).where(scope_filter(Tag.user_id, user_id), scope_filter(Tag.team_id, team_id))
+        )
+        tag_ids = dict(rows.all())
+        tag_cache.set(("tags", user_id, team_id), tag_ids)
+    return tag_ids
+
+def cached_tag(session, tag_id, name, user_id, team_id):
+    # A persistent Tag for a known row, without a SELECT
+    tag = Tag(tag_id=tag_id, name=name, user_id=user_id, team_id=team_id)
+    make_transient_to_detached(tag)
+    return session.merge(tag, load=False)
+
+def resolve_tags(session, names, user_id, team_id):
+    # Tag objects for names, in order. Known names come from the cache; the
+    # rest take one query, and whatever is still missing is inserted in a
+    # single flush. New tags reach the cache only once their transaction
+    # commits.
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return []
+    known = scope_tags(session, user_id, team_id)
+    tags = {name: cached_tag(session, known[name], name, user_id, team_id) for name in names if name in known}
+
+    missing = [name for name in names if name not in tags]
+    if missing:
+        # Created since the scope was cached, maybe by another process
+        for tag in session.execute(
+            select(Tag).where(Tag.name.in_(missing), scope_filter(Tag.user_id, user_id), scope_filter(Tag.team_id, team_id))
+        ).scalars():
+            tags[tag.name] = tag
+        created = [Tag(name=name, user_id=user_id, team_id=team_id) for name in missing if name not in tags]
+        session.add_all(created)
+        session.flush()
+        tags.update((tag.name, tag) for tag in created)
+        pending = session.info.setdefault("pending_tags", [])
+        pending.extend((tags[name], user_id, team_id, name, tags[name].tag_id) for name in missing)
+    return [tags[name] for name in names]
+
+def tag_names(session, user_id, team_id, prefix="", limit=None):
+    # Autocomplete suggestions, served from the cache
+    names = sorted(name for name in scope_tags(session, user_id, team_id) if name.lower().startswith(prefix.lower()))
+    return names[:limit] if limit else names
+
+def invalidate_tag_scope(user_id, team_id):
+    tag_cache.invalidate("tags", user_id, team_id)
+
+@event.listens_for(Session, "after_commit")
+def cache_committed_tags(session):
+    if session.in_nested_transaction():
+        # A savepoint was released; the outer transaction can still roll back
+        return
+    for tag, user_id, team_id, name, tag_id in session.info.pop("pending_tags", []):
+        if not inspect(tag).persistent:
+            continue
+        tag_ids = tag_cache.get(("tags", user_id, team_id))
+        if tag_ids is not MISSING and name not in tag_ids:
+            # Copy so readers never see the dict change under them
+            tag_cache.set(("tags", user_id, team_id), dict(tag_ids, **{name: tag_id}))
+
+@event.listens_for(Session, "after_rollback")
+def drop_pending_tags(session):
+    # Tags inserted by a rolled-back transaction or savepoint are no longer
+    # persistent, so they never reach the cache
+    pending = session.info.get("pending_tags")
+    if pending:
+        session.info["pending_tags"] = [entry for entry in pending if inspect(entry[0]).persistent]
+
+@event.listens_for(Tag, "after_update")
+def invalidate_changed_tag(mapper, connection, target):
+    # Renamed or moved tags drop their scope, before and after. after_update
+    # also fires when only a tag's task collection changed, which leaves the
+    # cache valid.
+    state = inspect(target)
+    history = {attribute: state.attrs[attribute].history for attribute in ("name", "user_id", "team_id")}
+    if not any(change.has_changes() for change in history.values()):
+        return
+    for user_id in [target.user_id] + list(history["user_id"].deleted):
+        for team_id in [target.team_id] + list(history["team_id"].deleted):
+            invalidate_tag_scope(user_id, team_id)
+
+@event.listens_for(Tag, "after_delete")
+def invalidate_deleted_tag(mapper, connection, target):
+    invalidate_tag_scope(target.user_id, target.team_id)
@@ -0,0 +1,539 @@
+import base64
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+from sqlalchemy import and_, event, func, inspect, or_, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, selectinload
+from models import Tag, Task, TaskAssignee, TaskTag, TaskTombstone, Team, TeamMember, User
+from tags import resolve_tags, scope_filter, tag_cache, tag_names
+from changes import change_scope, feed, task_change
+
+WATERMARK_HEADER = "X-Sync-Watermark"
+# Re-send changes this close to the watermark so writes committed while a
+# sync was running are not missed; clients merge by task_id, so repeats are harmless
+SYNC_OVERLAP = timedelta(seconds=5)
+
+TASK_STATUSES = ("Todo", "In Progress", "Done")
+TASK_FIELDS = ("title", "description", "status", "due_date")
+
+# SQL statements a board read may issue, whatever the board size: two for
+# the ETag aggregates, one each for tasks, tags and assignees, plus the
+# tombstones of a delta read
+BOARD_QUERY_BUDGET = 6
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Keyset sort orders: due date ascending (undated tasks last) or most
+# recently updated first, both tie-broken on task_id
+TASK_SORTS = ("due_date", "updated_at")
+
+
+class TaskOperationError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def task_payload(task, tags, assignees):
+    # task is a Task or a row of Task columns
+    return {
+        "task_id": task.task_id,
+        "title": task.title,
+        "description": task.description,
+        "status": task.status,
+        "due_date": task.due_date.isoformat() if task.due_date else None,
+        "created_at": task.created_at.isoformat() if task.created_at else None,
+        "updated_at": task.updated_at.isoformat() if task.updated_at else None,
+        "created_by": task.created_by,
+        "team_id": task.team_id,
+        "tags": tags,
+        "assignees": assignees,
+    }
+
+def serialize_task(task):
+    return task_payload(
+        task,
+        [{"tag_id": tag.tag_id, "name": tag.name} for tag in task.tags],
+        [{"user_id": user.user_id, "username": user.username} for user in task.assignees],
+    )
+
+def load_board_tasks(session, *criteria, order_by=(Task.task_id,), limit=None):
+    # Three statements however large the board is: the task rows, then all
+    # their tags and all their assignees, each selected through a subquery
+    # on the same criteria. The lazy relationships would cost two queries per
+    # task, and selectinload still grows with the board in IN-list chunks.
+    rows = session.execute(select(*Task.__table__.c).where(*criteria).order_by(*order_by).limit(limit))
+    tasks = {row.task_id: task_payload(row, [], []) for row in rows}
+    # A page is small, so its ids go in directly instead of a limited subquery
+    task_ids = list(tasks) if limit is not None else select(Task.task_id).where(*criteria)
+    tag_rows = session.execute(
+        select(TaskTag.task_id, Tag.tag_id, Tag.name)
+        .join(Tag, Tag.tag_id == TaskTag.tag_id)
+        .where(TaskTag.task_id.in_(task_ids))
+    )
+    for task_id, tag_id, name in tag_rows:
+        tasks[task_id]["tags"].append({"tag_id": tag_id, "name": name})
+    assignee_rows = session.execute(
+        select(TaskAssignee.task_id, User.user_id, User.username)
+        .join(User, User.user_id == TaskAssignee.user_id)
+        .where(TaskAssignee.task_id.in_(task_ids))
+    )
+    for task_id, user_id, username in assignee_rows:
+        tasks[task_id]["assignees"].append({"user_id": user_id, "username": username})
+    return list(tasks.values())
+
+@contextmanager
+def count_statements(session):
+    # Counts SQL statements issued inside the block, for checking reads
+    # against BOARD_QUERY_BUDGET
+    counter = {"count": 0}
+    engine = session.get_bind()
+
+    def before_cursor_execute(*args):
+        counter["count"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+def get_user(session, uid):
+    return session.execute(select(User).where(User.uid == uid)).scalar_one_or_none()
+
+def user_board_filter(user_id):
+    # Tasks the user created or is assigned to
+    assigned = select(TaskAssignee.task_id).where(TaskAssignee.user_id == user_id)
+    return or_(Task.created_by == user_id, Task.task_id.in_(assigned))
+
+def user_tombstone_filter(user_id):
+    team_ids = select(TeamMember.team_id).where(TeamMember.user_id == user_id)
+    return or_(TaskTombstone.created_by == user_id, TaskTombstone.team_id.in_(team_ids))
+
+def team_board_filter(team_id):
+    return Task.team_id == team_id
+
+def team_tombstone_filter(team_id):
+    return TaskTombstone.team_id == team_id
+
+def board_etag(session, board_filter, tombstone_filter):
+    # Derived from aggregates so an unchanged board is detected without
+    # loading or serializing a single task
+    count, last_update = session.execute(
+        select(func.count(Task.task_id), func.max(Task.updated_at)).where(board_filter)
+    ).one()
+    last_delete = session.execute(
+        select(func.max(TaskTombstone.tombstone_id)).where(tombstone_filter)
+    ).scalar()
+    digest = hashlib.sha1(f"{count}|{last_update}|{last_delete}".encode()).hexdigest()
+    return f'W/"{digest}"'
+
+def sync_cutoff(since):
+    # Changes after this are re-sent to a client that synced at since
+    try:
+        return datetime.fromisoformat(since) - SYNC_OVERLAP
+    except (TypeError, ValueError):
+        raise TaskOperationError(400, f"Invalid since: {since}")
+
+def read_board(session, board_filter, tombstone_filter, since=None, if_none_match=None):
+    # Returns (status_code, body, headers) for a board read. Without since
+    # the body is the full task list; with since it is
+    # {"tasks": changed, "deleted": task ids, "watermark": ...}.
+    etag = board_etag(session, board_filter, tombstone_filter)
+    watermark = datetime.utcnow()
+    headers = {"ETag": etag, WATERMARK_HEADER: watermark.isoformat()}
+    if if_none_match == etag:
+        return 304, None, headers
+
+    if since is None:
+        return 200, load_board_tasks(session, board_filter), headers
+
+    try:
+        cutoff = sync_cutoff(since)
+    except TaskOperationError as e:
+        return e.status_code, {"detail": e.detail}, {}
+    changed = load_board_tasks(session, board_filter, Task.updated_at > cutoff)
+    deleted = session.execute(
+        select(TaskTombstone.task_id).where(tombstone_filter, TaskTombstone.deleted_at > cutoff)
+    ).scalars().all()
+    # A task that left the board and came back is still on it
+    changed_ids = {task["task_id"] for task in changed}
+    body = {
+        "tasks": changed,
+        "deleted": list(dict.fromkeys(task_id for task_id in deleted if task_id not in changed_ids)),
+        "watermark": watermark.isoformat(),
+    }
+    return 200, body, headers
+
+def read_user_board(session, uid, since=None, if_none_match=None):
+    user = get_user(session, uid)
+    if user is None:
+        return 404, {"detail": "User not found"}, {}
+    return read_board(session, user_board_filter(user.user_id), user_tombstone_filter(user.user_id), since, if_none_match)
+
+def read_team_board(session, team_id, since=None, if_none_match=None):
+    return read_board(session, team_board_filter(team_id), team_tombstone_filter(team_id), since, if_none_match)
+
+def read_user_teams(session, uid):
+    rows = session.execute(
+        select(Team.team_id, Team.team_name)
+        .join(TeamMember, TeamMember.team_id == Team.team_id)
+        .join(User, User.user_id == TeamMember.user_id)
+        .where(User.uid == uid)
+        .order_by(Team.team_name)
+    )
+    return [{"team_id": team_id, "team_name": team_name} for team_id, team_name in rows]
+
+def read_team_members(session, team_id):
+    # uid is the login credential, so it never leaves the backend here
+    rows = session.execute(
+        select(User.user_id, User.username, User.email)
+        .join(TeamMember, TeamMember.user_id == User.user_id)
+        .where(TeamMember.team_id == team_id)
+        .order_by(User.username)
+    )
+    return [{"user_id": user_id, "username": username, "email": email} for user_id, username, email in rows]
+
+def read_bootstrap(session, uid, since=None, with_tasks=True):
+    # Everything the team board needs in one response: the user's teams, each
+    # with its members and tasks. With since, each team carries only the
+    # tasks changed and deleted since then. A fixed number of statements,
+    # however many teams the user is in.
+    user = get_user(session, uid)
+    if user is None:
+        return 404, {"detail": "User not found"}, {}
+    try:
+        cutoff = sync_cutoff(since) if since is not None else None
+    except TaskOperationError as e:
+        return e.status_code, {"detail": e.detail}, {}
+    watermark = datetime.utcnow()
+    teams = {
+        team_id: {"team_id": team_id, "team_name": team_name, "members": [], "tasks": [], "deleted": []}
+        for team_id, team_name in session.execute(
+            select(Team.team_id, Team.team_name)
+            .join(TeamMember, TeamMember.team_id == Team.team_id)
+            .where(TeamMember.user_id == user.user_id)
+            .order_by(Team.team_name)
+        )
+    }
+    body = {"teams": list(teams.values()), "watermark": watermark.isoformat(), "delta": since is not None}
+    if not teams:
+        return 200, body, {WATERMARK_HEADER: body["watermark"]}
+
+    member_rows = session.execute(
+        select(TeamMember.team_id, User.user_id, User.username, User.email)
+        .join(User, User.user_id == TeamMember.user_id)
+        .where(TeamMember.team_id.in_(list(teams)))
+        .order_by(User.username)
+    )
+    for team_id, user_id, username, email in member_rows:
+        teams[team_id]["members"].append({"user_id": user_id, "username": username, "email": email})
+
+    if with_tasks:
+        criteria = [Task.team_id.in_(list(teams))]
+        if cutoff is not None:
+            criteria.append(Task.updated_at > cutoff)
+            deleted = session.execute(
+                select(TaskTombstone.team_id, TaskTombstone.task_id)
+                .where(TaskTombstone.team_id.in_(list(teams)), TaskTombstone.deleted_at > cutoff)
+            )
+            for team_id, task_id in deleted:
+                teams[team_id]["deleted"].append(task_id)
+        for task in load_board_tasks(session, *criteria):
+            teams[task["team_id"]]["tasks"].append(task)
+        for team in teams.values():
+            changed_ids = {task["task_id"] for task in team["tasks"]}
+            team["deleted"] = [task_id for task_id in team["deleted"] if task_id not in changed_ids]
+    return 200, body, {WATERMARK_HEADER: body["watermark"]}
+
+def read_user_tags(session, uid, prefix=""):
+    # Tag names for autocomplete, from the tag cache
+    user = get_user(session, uid)
+    return tag_names(session, user.user_id, None, prefix) if user is not None else []
+
+def read_team_tags(session, team_id, prefix=""):
+    return tag_names(session, None, team_id, prefix)
+
+def tag_scope(task):
+    # Team tasks share the team's tags; personal tasks use the creator's
+    if task.team_id is not None:
+        return None, task.team_id
+    return task.created_by, None
+
+def load_users(session, user_ids):
+    if not user_ids:
+        return []
+    return session.execute(select(User).where(User.user_id.in_(user_ids))).scalars().all()
+
+def is_list_of(value, kind):
+    return isinstance(value, list) and all(isinstance(item, kind) and not isinstance(item, bool) for item in value)
+
+def check_operation(operation):
+    # A bulk item's shape, checked before any of it is applied, so a
+    # malformed item fails alone instead of the whole request
+    if not isinstance(operation, dict):
+        raise TaskOperationError(422, "Operation must be an object")
+    task_id = operation.get("task_id")
+    if not isinstance(task_id, int) or isinstance(task_id, bool):
+        raise TaskOperationError(422, f"Invalid task_id: {task_id!r}")
+    for field in ("tags", "add_tags"):
+        if field in operation and not is_list_of(operation[field], str):
+            raise TaskOperationError(422, f"{field} must be a list of names")
+    for field in ("assignee", "add_assignees"):
+        if field in operation and not is_list_of(operation[field], int):
+            raise TaskOperationError(422, f"{field} must be a list of user ids")
+    if operation.get("due_date") is not None and not isinstance(operation["due_date"], str):
+        raise TaskOperationError(422, "due_date must be an ISO date string")
+
+def apply_task_operation(session, operation):
+    check_operation(operation)
+    task_id = operation["task_id"]
+    task = session.get(Task, task_id, options=[selectinload(Task.tags), selectinload(Task.assignees)])
+    if task is None:
+        raise TaskOperationError(404, "Task not found")
+
+    op = operation.get("op", "update")
+    if op == "delete":
+        session.delete(task)
+        session.flush()
+        return {"task_id": task_id, "ok": True, "status": 204}
+    if op != "update":
+        raise TaskOperationError(400, f"Unknown operation: {op}")
+
+    for field in TASK_FIELDS:
+        if field not in operation:
+            continue
+        value = operation[field]
+        if field == "status" and value not in TASK_STATUSES:
+            raise TaskOperationError(422, f"Invalid status: {value}")
+        if field == "due_date" and value:
+            value = date.fromisoformat(value)
+        setattr(task, field, value)
+
+    if "tags" in operation or "add_tags" in operation:
+        names = operation["tags"] if "tags" in operation else [tag.name for tag in task.tags]
+        task.tags = resolve_tags(session, names + operation.get("add_tags", []), *tag_scope(task))
+
+    if "assignee" in operation:
+        task.assignees = load_users(session, operation["assignee"])
+    if operation.get("add_assignees"):
+        current = {user.user_id for user in task.assignees}
+        task.assignees.extend(user for user in load_users(session, operation["add_assignees"]) if user.user_id not in current)
+
+    # Tag and assignee changes do not touch the tasks row, so bump it here
+    # for delta sync
+    task.updated_at = datetime.utcnow()
+    session.flush()
+    return {"task_id": task_id, "ok": True, "status": 200, "task": serialize_task(task)}
+
+def apply_task_batch(session, operations):
+    # All operations share one transaction; each runs in its own savepoint so
+    # a failing item is reported without undoing the others
+    results = []
+    for operation in operations:
+        task_id = operation.get("task_id") if isinstance(operation, dict) else None
+        try:
+            with session.begin_nested():
+                results.append(apply_task_operation(session, operation))
+        except TaskOperationError as e:
+            results.append({"task_id": task_id, "ok": False, "status": e.status_code, "detail": e.detail})
+        except ValueError as e:
+            results.append({"task_id": task_id, "ok": False, "status": 422, "detail": str(e)})
+        except SQLAlchemyError as e:
+            # Rejected by the database, such as a NOT NULL field set to null
+            # or a tag id another process has since deleted; the savepoint
+            # has undone just this item
+            if isinstance(e, IntegrityError):
+                tag_cache.clear()
+            detail = str(e.orig) if getattr(e, "orig", None) is not None else str(e)
+            results.append({"task_id": task_id, "ok": False, "status": 422, "detail": detail})
+    session.commit()
+    return {"results": results}
+
+def page_limit(limit):
+    # A page size from a query parameter, clamped to MAX_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise TaskOperationError(400, f"Invalid limit: {limit}")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, size=2):
+    # A cursor is a list of size values ending in an int: [sort value,
+    # task_id] for keyset pages, [offset] for search pages
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise TaskOperationError(400, "Invalid cursor")
+    if not (isinstance(values, list) and len(values) == size and type(values[-1]) is int):
+        raise TaskOperationError(400, "Invalid cursor")
+    return values
+
+def task_filters(status=None, tag=None, assignee=None, due_after=None, due_before=None, text=None):
+    criteria = []
+    if status:
+        criteria.append(Task.status == status)
+    if tag:
+        tagged = select(TaskTag.task_id).join(Tag, Tag.tag_id == TaskTag.tag_id).where(Tag.name == tag)
+        criteria.append(Task.task_id.in_(tagged))
+    if assignee:
+        assigned = select(TaskAssignee.task_id).where(TaskAssignee.user_id == int(assignee))
+        criteria.append(Task.task_id.in_(assigned))
+    if due_after:
+        criteria.append(Task.due_date >= date.fromisoformat(due_after))
+    if due_before:
+        criteria.append(Task.due_date <= date.fromisoformat(due_before))
+    if text:
+        pattern = f"%{text}%"
+        criteria.append(or_(Task.title.ilike(pattern), Task.description.ilike(pattern)))
+    return criteria
+
+def sort_order(sort):
+    if sort == "updated_at":
+        return (Task.updated_at.desc(), Task.task_id.desc())
+    return (Task.due_date.is_(None), Task.due_date, Task.task_id)
+
+def cursor_values(sort, task):
+    return [task[sort], task["task_id"]]
+
+def after_cursor(sort, cursor):
+    # Keyset condition for the rows that follow the cursor in sort order
+    value, task_id = decode_cursor(cursor)
+    if not isinstance(value, str) and (sort == "updated_at" or value is not None):
+        raise TaskOperationError(400, "Invalid cursor")
+    if sort == "updated_at":
+        updated_at = datetime.fromisoformat(value)
+        return or_(Task.updated_at < updated_at, and_(Task.updated_at == updated_at, Task.task_id < task_id))
+    if value is None:
+        return and_(Task.due_date.is_(None), Task.task_id > task_id)
+    due_date = date.fromisoformat(value)
+    return or_(
+        Task.due_date > due_date,
+        and_(Task.due_date == due_date, Task.task_id > task_id),
+        Task.due_date.is_(None),
+    )
+
+def read_task_page(session, board_filter, sort="due_date", limit=DEFAULT_PAGE_SIZE, cursor=None, **filters):
+    # Returns (status_code, {"tasks", "next_cursor", "total"}, headers) for
+    # one filtered, sorted page of a board
+    if sort not in TASK_SORTS:
+        return 422, {"detail": f"Invalid sort: {sort}"}, {}
+    try:
+        limit = page_limit(limit)
+        criteria = [board_filter, *task_filters(**filters)]
+        total = session.execute(select(func.count(Task.task_id)).where(*criteria)).scalar()
+        if cursor:
+            criteria.append(after_cursor(sort, cursor))
+    except TaskOperationError as e:
+        return e.status_code, {"detail": e.detail}, {}
+    except ValueError as e:
+        return 422, {"detail": str(e)}, {}
+
+    # One extra row tells us whether another page follows
+    tasks = load_board_tasks(session, *criteria, order_by=sort_order(sort), limit=limit + 1)
+    next_cursor = encode_cursor(cursor_values(sort, tasks[limit - 1])) if len(tasks) > limit else None
+    return 200, {"tasks": tasks[:limit], "next_cursor": next_cursor, "total": total}, {}
+
+def read_user_task_page(session, uid, **params):
+    user = get_user(session, uid)
+    if user is None:
+        return 404, {"detail": "User not found"}, {}
+    return read_task_page(session, user_board_filter(user.user_id), **params)
+
+def read_team_task_page(session, team_id, **params):
+    return read_task_page(session, team_board_filter(team_id), **params)
+
+def read_change_scope(session, uid):
+    # Resolved before a long poll or event stream starts, so the session is
+    # not held while it waits. Team memberships are read once per request;
+    # a stream picks up new teams when it reconnects.
+    user = get_user(session, uid)
+    if user is None:
+        return None
+    team_ids = session.execute(select(TeamMember.team_id).where(TeamMember.user_id == user.user_id)).scalars().all()
+    return change_scope(uid, user.user_id, team_ids)
+
+def snapshot_change(task, op):
+    # Taken at flush time, while the old and new status and assignees are
+    # still in the attribute history; nothing is loaded to take it
+    state = inspect(task)
+    updated_at = state.dict.get("updated_at")
+    return task_change(
+        op,
+        task.task_id,
+        state.dict.get("team_id"),
+        [state.dict.get("created_by")] + [user.user_id for user in state.attrs.assignees.history.sum()],
+        state.attrs.status.history.sum(),
+        updated_at.isoformat() if updated_at else None,
+    )
+
+@event.listens_for(Session, "after_flush")
+def collect_task_changes(session, flush_context):
+    # Writes to tasks, task_assignees and task_tags become change
+    # notifications, published once the transaction commits. Tag and
+    # assignee changes made through a task's collections mark the task
+    # itself dirty; rows of the association tables written directly are
+    # traced back to their tasks.
+    pending = session.info.setdefault("pending_changes", [])
+    seen = set()
+    for task in session.new | session.dirty:
+        if isinstance(task, Task):
+            pending.append((task, snapshot_change(task, "upsert")))
+            seen.add(task.task_id)
+    for task in session.deleted:
+        if isinstance(task, Task):
+            pending.append((task, snapshot_change(task, "delete")))
+            seen.add(task.task_id)
+    linked = {
+        row.task_id for row in session.new | session.dirty | session.deleted
+        if isinstance(row, (TaskTag, TaskAssignee)) and row.task_id not in seen
+    }
+    if linked:
+        # On the flush's connection; a session query would autoflush
+        rows = session.connection().execute(
+            select(Task.task_id, Task.team_id, Task.created_by, Task.status, Task.updated_at).where(Task.task_id.in_(linked))
+        )
+        for task_id, team_id, created_by, status, updated_at in rows:
+            pending.append((None, task_change("upsert", task_id, team_id, [created_by], [status], updated_at.isoformat() if updated_at else None)))
+
+def committed_change(task, change):
+    if task is None:
+        return True
+    state = inspect(task)
+    return state.was_deleted if change["op"] == "delete" else state.persistent
+
+@event.listens_for(Session, "after_commit")
+def publish_task_changes(session):
+    if session.in_nested_transaction():
+        # A savepoint was released; the outer transaction can still roll back
+        return
+    merged = {}
+    for task, change in session.info.pop("pending_changes", []):
+        if not committed_change(task, change):
+            continue
+        previous = merged.get(change["task_id"])
+        if previous is not None:
+            # Flushed more than once; the last write wins, but the task left
+            # every column and board it passed through
+            change = dict(
+                change,
+                user_ids=sorted(set(previous["user_ids"]) | set(change["user_ids"])),
+                statuses=sorted(set(previous["statuses"]) | set(change["statuses"])),
+            )
+        merged[change["task_id"]] = change
+    if merged:
+        feed.publish(merged.values())
+
+@event.listens_for(Session, "after_transaction_end")
+def drop_rolled_back_changes(session, transaction):
+    # Whatever is still pending when the outermost transaction ends was
+    # rolled back. Savepoints need nothing here: at commit, tasks a
+    # rolled-back savepoint inserted are transient again and the ones it
+    # deleted are persistent again, so committed_change skips them.
+    if transaction.parent is None:
+        session.info.pop("pending_changes", None)
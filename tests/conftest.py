@@ -0,0 +1,42 @@
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, Task, Team, TeamMember, User
+from tags import tag_cache
+
+
+@pytest.fixture
+def engine():
+    # One in-memory database shared by every connection of the test
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    tag_cache.clear()
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
+
+@pytest.fixture
+def board(session):
+    # Two users in one team; alice created every task, bob is assigned to the first
+    alice = User(username="alice", email="alice@example.com")
+    bob = User(username="bob", email="bob@example.com")
+    team = Team(team_name="Team")
+    session.add_all([alice, bob, team])
+    session.flush()
+    session.add_all([TeamMember(team_id=team.team_id, user_id=alice.user_id), TeamMember(team_id=team.team_id, user_id=bob.user_id)])
+    tasks = [Task(title=f"Task {n}", status="Todo", created_by=alice.user_id, team_id=team.team_id) for n in range(10)]
+    session.add_all(tasks)
+    session.flush()
+    tasks[0].assignees.append(bob)
+    session.commit()
+    return {"alice": alice, "bob": bob, "team": team, "tasks": tasks}
@@ -0,0 +1,88 @@
+from board import NO_DUE_DATE, NO_TAG, UNASSIGNED, BoardIndex, BoardStore
+
+
+def task(task_id, status="Todo", tags=(), assignees=(), due_date=None):
+    return {
+        "task_id": task_id, "title": f"Task {task_id}", "status": status, "due_date": due_date,
+        "tags": [{"tag_id": n, "name": name} for n, name in enumerate(tags)],
+        "assignees": [{"user_id": n, "username": name} for n, name in enumerate(assignees)],
+    }
+
+TASKS = [
+    task(1, "Todo", ["b", "a"], ["bob"], "2026-03-04"),
+    task(2, "Done", ["a"], [], "2026-03-08"),
+    task(3, "Todo", [], ["alice", "bob"], "2026-02-27"),
+    task(4, "Blocked", [], [], None),
+]
+
+def ids(columns):
+    return [(label, [card["task"]["task_id"] for card in cards]) for label, cards in columns]
+
+def test_index_groups_by_status():
+    index = BoardIndex(TASKS)
+    assert len(index) == 4
+    # The three statuses always show, in Kanban order; unknown ones follow
+    assert ids(index.columns()) == [("Todo", [1, 3]), ("In Progress", []), ("Done", [2]), ("Blocked", [4])]
+
+def test_index_groups_by_tag_and_assignee():
+    index = BoardIndex(TASKS)
+    assert ids(index.columns("tag")) == [("a", [1, 2]), ("b", [1]), (NO_TAG, [3, 4])]
+    assert ids(index.columns("assignee")) == [("alice", [3]), ("bob", [1, 3]), (UNASSIGNED, [2, 4])]
+
+def test_index_groups_by_due_week_in_calendar_order():
+    index = BoardIndex(TASKS)
+    # 2026-03-04 is a Wednesday and 2026-03-08 a Sunday of the same week
+    assert ids(index.columns("due_week")) == [
+        ("Week of 2026-02-23", [3]),
+        ("Week of 2026-03-02", [1, 2]),
+        (NO_DUE_DATE, [4]),
+    ]
+
+def test_index_shares_one_card_per_task():
+    index = BoardIndex(TASKS)
+    card = index.cards[0]
+    assert card["tags"] == "b, a" and card["assignees"] == "bob"
+    assert all(any(c is card for c in cards) for label, cards in index.columns("tag") if label in ("a", "b"))
+
+def make_store():
+    store = BoardStore({})
+    store.put(("tasks", "uid"), TASKS)
+    store.put(("team_tasks", 1), [TASKS[0], TASKS[1]])
+    return store
+
+def test_put_copies_and_index_is_rebuilt_after_changes():
+    store = make_store()
+    index = store.index(("tasks", "uid"))
+    assert store.index(("tasks", "uid")) is index
+    store.update(1, {"status": "Done"})
+    assert TASKS[0]["status"] == "Todo"
+    rebuilt = store.index(("tasks", "uid"))
+    assert rebuilt is not index
+    assert ids(rebuilt.columns())[2] == ("Done", [1, 2])
+
+def test_update_patches_every_board_and_restore_undoes_it():
+    store = make_store()
+    before = {key: [dict(t) for t in store.entry(key)["tasks"]] for key in (("tasks", "uid"), ("team_tasks", 1))}
+    undo = store.update(1, {"title": "Renamed"})
+    assert len(undo) == 2
+    assert all(store.find_on(key, 1)["title"] == "Renamed" for key in before)
+    store.restore(undo)
+    assert {key: store.entry(key)["tasks"] for key in before} == before
+
+def test_remove_and_add_are_undone_in_place():
+    store = make_store()
+    before = [t["task_id"] for t in store.entry(("tasks", "uid"))["tasks"]]
+    undo = store.remove(2) + store.add(("tasks", "uid"), task(5))
+    assert [t["task_id"] for t in store.entry(("tasks", "uid"))["tasks"]] == [1, 3, 4, 5]
+    assert store.find(2) is None
+    store.restore(undo)
+    assert [t["task_id"] for t in store.entry(("tasks", "uid"))["tasks"]] == before
+    assert [t["task_id"] for t in store.entry(("team_tasks", 1))["tasks"]] == [1, 2]
+
+def test_later_write_survives_undo_of_an_earlier_one():
+    store = make_store()
+    first = store.update(1, {"title": "First"})
+    store.update(3, {"title": "Other"})
+    store.restore(first)
+    assert store.find(1)["title"] == "Task 1"
+    assert store.find(3)["title"] == "Other"
@@ -0,0 +1,90 @@
+import os
+import stat
+
+import pytest
+
+from cache import MISSING, Cache, KVStore, MemoryKV, SharedCache, SQLiteStore, TTLCache, encode_key
+
+
+@pytest.fixture(params=["memory", "shared"])
+def cache(request):
+    if request.param == "memory":
+        return TTLCache()
+    return SharedCache(KVStore(MemoryKV()))
+
+
+@pytest.mark.parametrize("invalidate", [
+    lambda cache: cache.invalidate("tasks", 1),
+    lambda cache: cache.invalidate_namespace("tasks"),
+    lambda cache: cache.clear(),
+])
+def test_fetch_overlapping_an_invalidation_is_not_stored(cache, invalidate):
+    rows = {"title": "Old"}
+    fetches = []
+
+    @cache.cached("tasks")
+    def read_task(task_id):
+        fetches.append(task_id)
+        value = dict(rows)
+        if len(fetches) == 1:
+            # A write lands and invalidates while this fetch holds old rows
+            rows["title"] = "New"
+            invalidate(cache)
+        return value
+
+    assert read_task(1) == {"title": "Old"}
+    assert read_task(1) == {"title": "New"}
+    assert read_task(1) == {"title": "New"}
+    assert fetches == [1, 1]
+
+
+def test_invalidation_of_another_key_keeps_the_fetch(cache):
+    fetches = []
+
+    @cache.cached("tasks")
+    def read_task(task_id):
+        fetches.append(task_id)
+        cache.invalidate("tasks", 2)
+        return task_id
+
+    assert read_task(1) == 1
+    assert read_task(1) == 1
+    assert fetches == [1]
+
+
+def test_cache_base_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        Cache()
+
+
+def test_sqlite_store_files_are_private(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    umask = os.umask(0o022)
+    try:
+        cache = SharedCache(SQLiteStore(path))
+        cache.set(("tasks", 1), {"title": "Task"})
+    finally:
+        os.umask(umask)
+    for name in (path, path + "-wal", path + "-shm"):
+        assert stat.S_IMODE(os.stat(name).st_mode) == 0o600
+
+
+@pytest.mark.parametrize("data", [b"{not json", b"\xff\xfe"])
+def test_corrupt_shared_entry_is_a_miss_and_dropped(data):
+    store = KVStore(MemoryKV())
+    cache = SharedCache(store)
+    key = ("tasks", 1)
+    store.set(encode_key(key), "tasks", data, 60)
+    fetches = []
+
+    @cache.cached("tasks")
+    def read_task(task_id):
+        fetches.append(task_id)
+        return {"title": "Task"}
+
+    assert cache.lookup(key) == (MISSING, "miss")
+    assert store.get(encode_key(key)) is None
+    assert read_task(1) == {"title": "Task"}
+    assert fetches == [1]
+    # Another process reads the fresh value from the store
+    assert SharedCache(store).lookup(key) == ({"title": "Task"}, "shared")
@@ -0,0 +1,70 @@
+import json
+from changes import RESET, ChangeFeed, change_scope, event_stream, format_event, poll_changes, scoped_changes, stream_changes, task_change
+
+
+def scope():
+    # alice (user 1) is in team 10 but not team 20
+    return change_scope("alice-uid", 1, [10])
+
+def test_changes_are_scoped_to_the_subscribers_boards():
+    changes = [
+        dict(task_change("upsert", 1, 10, [2], ["Todo"]), id=1),
+        dict(task_change("upsert", 2, None, [1], ["Done", "Todo"]), id=2),
+        dict(task_change("delete", 3, 10, [1, 2], ["Todo"]), id=3),
+        dict(task_change("upsert", 4, 20, [2], ["Todo"]), id=4),
+        dict(task_change("upsert", 5, None, [3], ["Todo"]), id=5),
+    ]
+    scoped = scoped_changes(changes, scope())
+    assert [(change["task_id"], change["boards"]) for change in scoped] == [
+        (1, [["team_tasks", 10]]),
+        (2, [["tasks", "alice-uid"]]),
+        (3, [["team_tasks", 10], ["tasks", "alice-uid"]]),
+    ]
+    # Other users and teams stay out of what the subscriber is sent
+    assert all("user_ids" not in change and "team_id" not in change for change in scoped)
+
+def test_long_poll_returns_only_scoped_changes():
+    feed = ChangeFeed()
+    _, body, _ = poll_changes(scope(), changes=feed)
+    assert body == {"changes": [], "last_event_id": 0}
+    feed.publish([task_change("upsert", 4, 20, [2], ["Todo"]), task_change("upsert", 1, 10, [2], ["Todo"])])
+    _, body, _ = poll_changes(scope(), after=0, timeout=0, changes=feed)
+    assert [change["task_id"] for change in body["changes"]] == [1]
+    assert body["last_event_id"] == 2
+
+def test_long_poll_times_out_empty():
+    feed = ChangeFeed()
+    feed.publish([task_change("upsert", 4, 20, [2], ["Todo"])])
+    _, body, _ = poll_changes(scope(), after=1, timeout=0.01, changes=feed)
+    assert body == {"changes": [], "last_event_id": 1}
+
+def test_subscriber_behind_the_feed_is_reset():
+    feed = ChangeFeed(size=2)
+    feed.publish([task_change("upsert", n, 10, [], ["Todo"]) for n in range(5)])
+    _, body, _ = poll_changes(scope(), after=1, timeout=0, changes=feed)
+    assert body == {"changes": [dict(RESET, id=5)], "last_event_id": 5}
+    # An id from before a restart is past the feed's end
+    _, body, _ = poll_changes(scope(), after=99, timeout=0, changes=ChangeFeed())
+    assert body["changes"] == [dict(RESET, id=0)]
+
+def test_event_stream_sends_reset_then_resumes():
+    feed = ChangeFeed(size=2)
+    feed.publish([task_change("upsert", n, 10, [], ["Todo"]) for n in range(5)])
+    events = event_stream(scope(), 1, feed, heartbeat=0)
+    assert next(events).startswith("retry: ")
+    assert next(events) == format_event(dict(RESET, id=5))
+    assert next(events) == ": heartbeat\n\n"
+    feed.publish([task_change("upsert", 6, 10, [], ["Todo"])])
+    event = next(events)
+    assert event.startswith("id: 6\nevent: change\n")
+    assert json.loads(event.split("data: ", 1)[1])["task_id"] == 6
+
+def test_stream_resumes_from_last_event_id():
+    feed = ChangeFeed()
+    feed.publish([task_change("upsert", 1, 10, [], ["Todo"]), task_change("upsert", 2, 10, [], ["Todo"])])
+    status, events, headers = stream_changes(scope(), "1", feed)
+    assert status == 200 and headers["Content-Type"] == "text/event-stream"
+    next(events)
+    assert next(events).startswith("id: 2\n")
+    assert stream_changes(scope(), "x", feed)[0] == 400
+    assert stream_changes(None, None, feed)[0] == 404
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from changes import RESET, format_event, task_change
+from live import MAX_PENDING_CHANGES, Inbox, parse_events
+
+
+def test_parse_events_reads_what_the_backend_formats():
+    changes = [dict(task_change("upsert", n, 10, [1], ["Todo"]), id=n, boards=[["team_tasks", 10]]) for n in (1, 2)]
+    text = "retry: 3000\n\n: heartbeat\n\n" + "".join(format_event(change) for change in changes)
+    events = list(parse_events(text.split("\n")))
+    assert events == [None] + changes
+
+def test_parse_events_joins_data_lines():
+    lines = ["event: change", "data: [1,", "data:2]", "", "data: {}", ""]
+    assert list(parse_events(lines)) == [[1, 2], {}]
+
+def test_inbox_drains_in_order():
+    inbox = Inbox("alice-uid")
+    inbox.put([{"id": 1}, {"id": 2}])
+    assert inbox.drain() == [{"id": 1}, {"id": 2}]
+    assert inbox.drain() == []
+
+def test_overflowing_inbox_drains_one_reset():
+    inbox = Inbox("alice-uid")
+    inbox.put([{"id": n} for n in range(MAX_PENDING_CHANGES + 1)])
+    inbox.put([{"id": "late"}])
+    assert inbox.drain() == [RESET]
+    inbox.put([{"id": 1}])
+    assert inbox.drain() == [{"id": 1}]
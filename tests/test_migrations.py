@@ -0,0 +1,10 @@
+from migrations import check_query_plans, downgrade, upgrade
+
+
+def test_upgrade_indexes_every_board_query(engine):
+    # From a database that predates the board indexes
+    downgrade(engine)
+    assert check_query_plans(engine) != {}
+    upgrade(engine)
+    upgrade(engine)
+    assert check_query_plans(engine) == {}
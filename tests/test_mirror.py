@@ -0,0 +1,116 @@
+import json
+import time
+import pytest
+
+pytest.importorskip("requests")
+
+from sqlalchemy import select
+from api import BackendClient
+from mirror import LocalMirror, OutboxEntry
+from stub_backend import BENCHMARK_USER_ID, StubBackend, StubData
+
+
+@pytest.fixture
+def stub():
+    stub = StubBackend(StubData(tasks=20, teams=2, users=5)).start()
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def client(stub):
+    return BackendClient(stub.url, max_retries=0)
+
+@pytest.fixture
+def user(stub):
+    return stub.data.users[BENCHMARK_USER_ID]
+
+@pytest.fixture
+def mirror(client, user):
+    # Synced by hand with flush and pull_board; no worker thread
+    mirror = LocalMirror(user["uid"], BENCHMARK_USER_ID, user["username"])
+    mirror.pull_board(("tasks", user["uid"]), client)
+    yield mirror
+    mirror.engine.dispose()
+
+def board(mirror, user):
+    return {task["task_id"]: task for task in mirror.read_board(("tasks", user["uid"]))}
+
+def personal_task(stub):
+    return next(task_id for task_id, task in stub.data.tasks.items() if task["team_id"] is None and task["created_by"] == BENCHMARK_USER_ID)
+
+def new_task(user, title):
+    return {"uid": user["uid"], "title": title, "description": "", "status": "Todo", "due_date": None, "tags": ["new"]}
+
+def test_flush_sends_queued_writes(stub, client, mirror, user):
+    task_id = personal_task(stub)
+    mirror.write("update", task_id, {"title": "Local"})
+    assert board(mirror, user)[task_id]["title"] == "Local"
+    assert mirror.status() == (1, None)
+    mirror.flush(client)
+    assert mirror.status() == (0, None)
+    assert stub.data.tasks[task_id]["title"] == "Local"
+
+def test_create_takes_the_backends_id(stub, client, mirror, user):
+    local_id = mirror.write("create", payload=new_task(user, "Created"))
+    assert local_id < 0
+    # Edited before it was sent: still one create, with the latest fields
+    mirror.write("update", local_id, {"status": "Done"})
+    mirror.flush(client)
+    tasks = board(mirror, user)
+    assert all(task_id > 0 for task_id in tasks)
+    created = next(task for task in tasks.values() if task["title"] == "Created")
+    assert stub.data.tasks[created["task_id"]]["status"] == "Done"
+    assert [tag["name"] for tag in created["tags"]] == ["new"]
+    assert mirror.status() == (0, None)
+
+def test_create_replayed_after_a_lost_answer_is_not_duplicated(stub, client, mirror, user):
+    local_id = mirror.write("create", payload=new_task(user, "Lost"))
+    with mirror.transaction() as session:
+        entry = session.execute(select(OutboxEntry.payload, OutboxEntry.idempotency_key)).one()
+    # The first send reached the backend, but its answer never came back
+    first = client.create_task(json.loads(entry.payload), idempotency_key=entry.idempotency_key).json()
+    count = len(stub.data.tasks)
+    mirror.write("update", local_id, {"title": "Edited"})
+    mirror.flush(client)
+    assert len(stub.data.tasks) == count
+    assert stub.data.tasks[first["task_id"]]["title"] == "Edited"
+    assert board(mirror, user)[first["task_id"]]["title"] == "Edited"
+    assert mirror.status() == (0, None)
+
+def test_newer_remote_change_wins_over_a_queued_write(stub, client, mirror, user):
+    task_id = personal_task(stub)
+    mirror.write("update", task_id, {"title": "Mine"})
+    time.sleep(0.01)
+    stub.data.update(task_id, {"title": "Theirs"})
+    mirror.pull_board(("tasks", user["uid"]), client)
+    assert board(mirror, user)[task_id]["title"] == "Theirs"
+    assert mirror.status() == (0, None)
+
+def test_newer_queued_write_wins_over_a_remote_change(stub, client, mirror, user):
+    task_id = personal_task(stub)
+    stub.data.update(task_id, {"title": "Theirs"})
+    time.sleep(0.01)
+    mirror.write("update", task_id, {"title": "Mine"})
+    mirror.pull_board(("tasks", user["uid"]), client)
+    assert board(mirror, user)[task_id]["title"] == "Mine"
+    mirror.flush(client)
+    assert stub.data.tasks[task_id]["title"] == "Mine"
+
+def test_rejected_write_is_dropped_and_the_board_resynced(stub, client, mirror, user):
+    task_id = personal_task(stub)
+    status = stub.data.tasks[task_id]["status"]
+    mirror.write("update", task_id, {"status": "Bad"})
+    mirror.flush(client)
+    assert mirror.take_rejected() == [f"#{task_id}: Invalid status: Bad"]
+    assert mirror.status() == (0, None)
+    # The next pull is a full read, which restores the backend's copy
+    mirror.pull_board(("tasks", user["uid"]), client)
+    assert board(mirror, user)[task_id]["status"] == status
+
+def test_write_to_a_task_deleted_on_the_backend_drops_it(stub, client, mirror, user):
+    task_id = personal_task(stub)
+    stub.data.delete(task_id)
+    mirror.write("update", task_id, {"title": "Gone"})
+    mirror.flush(client)
+    assert task_id not in board(mirror, user)
+    assert mirror.take_rejected() == []
@@ -0,0 +1,28 @@
+import pytest
+
+from search import create_search_index, search_team_tasks
+from tasks import encode_cursor
+
+
+def test_search_rejects_invalid_limit(engine, session, board):
+    create_search_index(engine)
+    team_id = board["team"].team_id
+    status, _, _ = search_team_tasks(session, team_id, "task", limit="abc")
+    assert status == 400
+    status, body, _ = search_team_tasks(session, team_id, "task", limit=3)
+    assert status == 200 and len(body["tasks"]) == 3 and body["total"] == 10
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor(1), encode_cursor([]), encode_cursor({"a": 1}), encode_cursor([-1]), encode_cursor(["3"]), encode_cursor([1, 2])])
+def test_search_rejects_invalid_cursor(engine, session, board, cursor):
+    create_search_index(engine)
+    status, body, _ = search_team_tasks(session, board["team"].team_id, "task", cursor=cursor)
+    assert status == 400 and body["detail"] == "Invalid cursor"
+
+def test_search_pages_with_its_cursor(engine, session, board):
+    create_search_index(engine)
+    team_id = board["team"].team_id
+    _, first, _ = search_team_tasks(session, team_id, "task", limit=6)
+    _, second, _ = search_team_tasks(session, team_id, "task", limit=6, cursor=first["next_cursor"])
+    assert len(second["tasks"]) == 4 and second["next_cursor"] is None
+    assert {t["task_id"] for t in first["tasks"]} & {t["task_id"] for t in second["tasks"]} == set()
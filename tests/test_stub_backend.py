@@ -0,0 +1,19 @@
+from stub_backend import StubData, route
+
+
+def test_create_replayed_with_its_idempotency_key_is_not_duplicated():
+    data = StubData(tasks=5, teams=1, users=3)
+    uid = next(iter(data.uids))
+    payload = {"uid": uid, "title": "Lost answer", "status": "Todo"}
+
+    status, first, headers = route(data, "POST", ["tasks"], {}, payload, {"Idempotency-Key": "k1"})
+    assert status == 200 and "Idempotent-Replayed" not in headers
+    status, again, headers = route(data, "POST", ["tasks"], {}, payload, {"Idempotency-Key": "k1"})
+    assert status == 200 and headers["Idempotent-Replayed"] == "true"
+    assert again["task_id"] == first["task_id"]
+    assert len(data.tasks) == 6
+
+    status, other, _ = route(data, "POST", ["tasks"], {}, payload, {"Idempotency-Key": "k2"})
+    assert other["task_id"] != first["task_id"]
+    route(data, "POST", ["tasks"], {}, payload, {})
+    assert len(data.tasks) == 8
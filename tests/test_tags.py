@@ -0,0 +1,50 @@
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from models import Tag, TaskTag
+from tags import resolve_tags, tag_cache
+from tasks import apply_task_batch, count_statements
+
+
+def test_new_names_take_one_lookup(session, board):
+    team_id = board["team"].team_id
+    resolve_tags(session, ["a"], None, team_id)
+    session.commit()
+    with count_statements(session) as counter:
+        tags = resolve_tags(session, ["a", "b", "c"], None, team_id)
+    # The scope is cached, so b and c take one lookup, then their inserts
+    # (one statement each on SQLite, whose RETURNING order is not guaranteed)
+    assert counter["count"] == 1 + 2
+    assert [tag.name for tag in tags] == ["a", "b", "c"]
+
+def test_cached_names_reuse_their_ids_without_queries(session, board):
+    team_id = board["team"].team_id
+    first = [tag.tag_id for tag in resolve_tags(session, ["a", "b"], None, team_id)]
+    session.commit()
+    with count_statements(session) as counter:
+        again = [tag.tag_id for tag in resolve_tags(session, ["b", "a", "b"], None, team_id)]
+    assert counter["count"] == 0
+    assert again == first[::-1]
+    # Another scope keeps its own tags
+    other = resolve_tags(session, ["a"], board["alice"].user_id, None)
+    assert other[0].tag_id not in first
+
+def test_write_recovers_after_a_cached_tag_is_deleted(engine, session, board):
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+    task = board["tasks"][1]
+    team_id = board["team"].team_id
+    apply_task_batch(session, [{"op": "update", "task_id": task.task_id, "tags": ["a"]}])
+    # Deleted behind the ORM's back, as another process would
+    session.execute(delete(TaskTag))
+    session.execute(delete(Tag))
+    session.commit()
+    assert tag_cache.get(("tags", None, team_id)) != {}
+
+    failed, = apply_task_batch(session, [{"op": "update", "task_id": task.task_id, "tags": ["a"]}])["results"]
+    assert failed["ok"] is False and failed["status"] == 422
+    # The failure cleared the tag cache, so the next request recreates the tag
+    with Session(engine) as retry:
+        applied, = apply_task_batch(retry, [{"op": "update", "task_id": task.task_id, "tags": ["a"]}])["results"]
+        assert applied["ok"] is True
+        assert [tag["name"] for tag in applied["task"]["tags"]] == ["a"]
+        assert retry.execute(select(Tag.name)).scalars().all() == ["a"]
@@ -0,0 +1,149 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import inspect
+from models import Task, Team
+from tasks import BOARD_QUERY_BUDGET, apply_task_batch, count_statements, encode_cursor, read_team_board, read_bootstrap, read_team_task_page, read_user_board
+
+
+def test_delta_read_drops_unassigned_task(session, board):
+    bob, task = board["bob"], board["tasks"][0]
+    _, tasks, headers = read_user_board(session, bob.uid)
+    assert [t["task_id"] for t in tasks] == [task.task_id]
+
+    since = datetime.utcnow().isoformat()
+    apply_task_batch(session, [{"op": "update", "task_id": task.task_id, "assignee": []}])
+
+    status, body, delta_headers = read_user_board(session, bob.uid, since=since)
+    assert status == 200
+    assert body["tasks"] == []
+    assert body["deleted"] == [task.task_id]
+    assert delta_headers["ETag"] != headers["ETag"]
+
+def test_delta_read_drops_task_moved_to_another_team(session, board):
+    team, task = board["team"], board["tasks"][1]
+    other = Team(team_name="Other")
+    session.add(other)
+    session.commit()
+
+    since = datetime.utcnow().isoformat()
+    task.team_id = other.team_id
+    session.commit()
+
+    _, body, _ = read_team_board(session, team.team_id, since=since)
+    assert body["deleted"] == [task.task_id]
+    _, body, _ = read_team_board(session, other.team_id, since=since)
+    assert [t["task_id"] for t in body["tasks"]] == [task.task_id]
+    assert body["deleted"] == []
+
+def test_team_move_does_not_load_assignees(session, board):
+    task = board["tasks"][1]
+    other = Team(team_name="Other")
+    session.add(other)
+    session.flush()
+    assert "assignees" in inspect(task).unloaded
+    task.team_id = other.team_id
+    session.flush()
+    assert "assignees" in inspect(task).unloaded
+
+def test_delta_read_keeps_task_that_came_back(session, board):
+    bob, task = board["bob"], board["tasks"][0]
+    since = datetime.utcnow().isoformat()
+    apply_task_batch(session, [{"op": "update", "task_id": task.task_id, "assignee": []}])
+    apply_task_batch(session, [{"op": "update", "task_id": task.task_id, "assignee": [bob.user_id]}])
+
+    _, body, _ = read_user_board(session, bob.uid, since=since)
+    assert [t["task_id"] for t in body["tasks"]] == [task.task_id]
+    assert body["deleted"] == []
+
+def test_delta_read_rejects_invalid_since(session, board):
+    status, body, _ = read_team_board(session, board["team"].team_id, since="x")
+    assert status == 400 and body["detail"] == "Invalid since: x"
+
+def test_bootstrap_rejects_invalid_since(session, board):
+    status, body, _ = read_bootstrap(session, board["alice"].uid, since="x")
+    assert status == 400 and body["detail"] == "Invalid since: x"
+    status, body, _ = read_bootstrap(session, board["alice"].uid, since=datetime.utcnow().isoformat())
+    assert status == 200 and body["delta"] is True
+
+def test_batch_reports_database_errors_per_item(session, board):
+    first, second = board["tasks"][:2]
+    result = apply_task_batch(session, [
+        {"op": "update", "task_id": first.task_id, "title": None},
+        {"op": "update", "task_id": second.task_id, "title": "Renamed"},
+    ])
+    failed, applied = result["results"]
+    assert failed["ok"] is False and failed["status"] == 422
+    assert applied["ok"] is True
+    session.expire_all()
+    assert first.title == "Task 0"
+    assert second.title == "Renamed"
+
+def test_batch_reports_malformed_operations_per_item(session, board):
+    task = board["tasks"][0]
+    result = apply_task_batch(session, [
+        "x",
+        {"op": "update", "task_id": "1", "title": "Renamed"},
+        {"op": "update", "task_id": task.task_id, "due_date": 5},
+        {"op": "update", "task_id": task.task_id, "tags": "ab"},
+        {"op": "update", "task_id": task.task_id, "add_tags": [1]},
+        {"op": "update", "task_id": task.task_id, "assignee": "bob"},
+        {"op": "update", "task_id": task.task_id, "title": "Renamed", "tags": ["a"]},
+    ])
+    *failed, applied = result["results"]
+    assert [item["status"] for item in failed] == [422] * 6
+    assert not any(item["ok"] for item in failed)
+    assert failed[0]["task_id"] is None
+    assert applied["ok"] is True
+    assert [tag["name"] for tag in applied["task"]["tags"]] == ["a"]
+
+def board_read_counts(session, board, tasks):
+    # Tags and assignees on every task, then statements for a full read and
+    # for a delta read that returns all of them
+    alice, bob, team = board["alice"], board["bob"], board["team"]
+    since = datetime.utcnow().isoformat()
+    apply_task_batch(session, [
+        {"op": "update", "task_id": task.task_id, "tags": ["a", f"tag {n % 7}"], "assignee": [alice.user_id, bob.user_id]}
+        for n, task in enumerate(tasks)
+    ])
+    with count_statements(session) as full:
+        _, read, _ = read_team_board(session, team.team_id)
+    with count_statements(session) as delta:
+        _, body, _ = read_team_board(session, team.team_id, since=since)
+    assert len(read) == len(body["tasks"]) == len(tasks)
+    assert all(len(task["tags"]) == 2 and len(task["assignees"]) == 2 for task in read)
+    return full["count"], delta["count"]
+
+def test_board_reads_stay_within_query_budget(session, board):
+    small = board_read_counts(session, board, board["tasks"])
+    session.add_all(
+        Task(title=f"Task {n}", status="Todo", created_by=board["alice"].user_id, team_id=board["team"].team_id)
+        for n in range(10, 200)
+    )
+    session.commit()
+    large = board_read_counts(session, board, session.query(Task).all())
+    assert large == small
+    assert 0 < small[0] <= BOARD_QUERY_BUDGET and small[1] <= BOARD_QUERY_BUDGET
+
+def test_page_read_rejects_invalid_limit(session, board):
+    status, body, _ = read_team_task_page(session, board["team"].team_id, limit="abc")
+    assert status == 400
+    status, body, _ = read_team_task_page(session, board["team"].team_id, limit="500")
+    assert status == 200 and len(body["tasks"]) == 10
+
+@pytest.mark.parametrize("sort, cursor", [
+    ("due_date", "MQ=="),
+    ("due_date", encode_cursor([None])),
+    ("due_date", encode_cursor([None, "1"])),
+    ("due_date", encode_cursor({"a": 1})),
+    ("updated_at", encode_cursor([None, 1])),
+])
+def test_page_read_rejects_invalid_cursor(session, board, sort, cursor):
+    status, body, _ = read_team_task_page(session, board["team"].team_id, sort=sort, cursor=cursor)
+    assert status == 400 and body["detail"] == "Invalid cursor"
+
+@pytest.mark.parametrize("sort", ["due_date", "updated_at"])
+def test_page_read_follows_its_cursor(session, board, sort):
+    team_id = board["team"].team_id
+    _, first, _ = read_team_task_page(session, team_id, sort=sort, limit=6)
+    status, second, _ = read_team_task_page(session, team_id, sort=sort, limit=6, cursor=first["next_cursor"])
+    assert status == 200 and len(second["tasks"]) == 4 and second["next_cursor"] is None
@@ -0,0 +1,39 @@
+import io
+from sqlalchemy import select
+from models import Tag, Task, User
+from transfer import import_upload
+
+
+def jsonl(*lines):
+    return io.StringIO("".join(line + "\n" for line in lines))
+
+def test_import_rejects_malformed_records(engine):
+    status, report, _ = import_upload(engine, "users", jsonl('{"username": "alice", "email": "alice@example.com"}'), "jsonl")
+    assert status == 200 and report["inserted"] == 1
+
+    status, report, _ = import_upload(engine, "tasks", jsonl(
+        '{"title": "Tagged", "created_by": "alice", "tags": "abc"}',
+        '{"title": "Assigned", "created_by": "alice", "assignees": "alice"}',
+        '[1]',
+        '{"title": ["not", "a", "title"]}',
+        '{"title": "Fine", "created_by": "alice", "tags": ["a"], "assignees": ["alice"]}',
+    ), "jsonl")
+    assert status == 200
+    assert report["inserted"] == 1 and report["skipped"] == 4
+    assert [error.split(":")[0] for error in report["errors"]] == ["Record 1", "Record 2", "Record 3", "Record 4"]
+    with engine.connect() as connection:
+        assert connection.execute(select(Task.title)).scalars().all() == ["Fine"]
+        assert connection.execute(select(Tag.name)).scalars().all() == ["a"]
+
+
+def test_import_goes_on_past_unreadable_lines(engine):
+    status, report, _ = import_upload(engine, "users", jsonl(
+        '{"username": "alice", "email": "alice@example.com"}',
+        '{"username": "bob", "email"',
+        '{"username": "carol", "email": "carol@example.com"}',
+    ), "jsonl")
+    assert status == 200
+    assert report["inserted"] == 2 and report["skipped"] == 1
+    assert report["errors"][0].startswith("Record 2: unreadable JSON")
+    with engine.connect() as connection:
+        assert connection.execute(select(User.username).order_by(User.username)).scalars().all() == ["alice", "carol"]
@@ -0,0 +1,78 @@
+import gzip
+import pytest
+import wire
+from wire import GZIP_MIN_SIZE, JSON_TYPE, MSGPACK_TYPE, SHAPE_HEADER, decode_body, encode_response, pack_body, unpack_body
+
+
+def make_tasks(count, team_id=None):
+    tags = [{"tag_id": n, "name": f"tag {n}"} for n in range(1, 4)]
+    users = [{"user_id": n, "username": f"user {n}"} for n in range(1, 3)]
+    return [
+        {
+            "task_id": n, "title": f"Task {n}", "description": None, "status": "Todo",
+            "due_date": "2026-01-02" if n % 2 else None, "created_at": "2026-01-01T00:00:00",
+            "updated_at": "2026-01-01T00:00:00", "created_by": 1, "team_id": team_id,
+            "tags": tags[:n % 4], "assignees": users[:n % 3],
+        }
+        for n in range(1, count + 1)
+    ]
+
+BODIES = {
+    "board": make_tasks(30),
+    "delta": {"tasks": make_tasks(3), "deleted": [7, 8], "watermark": "2026-01-01T00:00:00"},
+    "bootstrap": {"teams": [{"team_id": 1, "tasks": make_tasks(4, 1), "deleted": []}, {"team_id": 2, "tasks": [], "deleted": [9]}]},
+    "no tasks": {"detail": "Task not found"},
+}
+
+@pytest.mark.parametrize("shape", ["normalized", "columnar"])
+@pytest.mark.parametrize("name", list(BODIES))
+def test_pack_body_round_trips(shape, name):
+    body = BODIES[name]
+    packed = pack_body(body, shape)
+    assert packed["wire"] == wire.WIRE_VERSION
+    assert unpack_body(packed) == body
+
+def test_packed_tags_and_users_appear_once():
+    packed = pack_body(BODIES["board"])
+    assert packed["tags"] == [[1, 2, 3], ["tag 1", "tag 2", "tag 3"]]
+    assert packed["users"] == [[1, 2], ["user 1", "user 2"]]
+
+def test_columnar_shape_stores_columns():
+    packed = pack_body(BODIES["board"], "columnar")["body"]
+    assert "rows" not in packed
+    assert packed["columns"][0] == list(range(1, 31))
+
+def test_bodies_without_an_envelope_pass_through():
+    assert unpack_body([1, 2]) == [1, 2]
+    assert unpack_body({"detail": "x"}) == {"detail": "x"}
+
+ACCEPTS = [JSON_TYPE, pytest.param(MSGPACK_TYPE, marks=pytest.mark.skipif(wire.msgpack is None, reason="msgpack is not installed"))]
+
+@pytest.mark.parametrize("accept", ACCEPTS)
+@pytest.mark.parametrize("accept_encoding", ["", "gzip"])
+@pytest.mark.parametrize("shape", [None, "normalized", "columnar"])
+@pytest.mark.parametrize("name", list(BODIES))
+def test_response_round_trips(accept, accept_encoding, shape, name):
+    body = BODIES[name]
+    status, data, headers = encode_response(200, body, {}, accept=accept, accept_encoding=accept_encoding, shape=shape)
+    assert status == 200 and headers["Content-Type"] == accept
+    assert headers["Content-Length"] == str(len(data))
+    assert headers.get(SHAPE_HEADER) == shape
+    if headers.get("Content-Encoding") == "gzip":
+        data = gzip.decompress(data)
+    else:
+        assert not accept_encoding or len(data) < GZIP_MIN_SIZE
+    assert decode_body(headers["Content-Type"], data) == body
+
+def test_large_bodies_are_gzipped_on_request():
+    _, data, headers = encode_response(200, BODIES["board"], {}, accept_encoding="gzip")
+    assert headers["Content-Encoding"] == "gzip"
+    _, plain, headers = encode_response(200, BODIES["board"], {})
+    assert "Content-Encoding" not in headers and len(data) < len(plain)
+
+def test_msgpack_body_without_msgpack_is_an_error(monkeypatch):
+    monkeypatch.setattr(wire, "msgpack", None)
+    with pytest.raises(ValueError):
+        decode_body(MSGPACK_TYPE, b"\x90")
+    _, _, headers = encode_response(200, BODIES["delta"], {}, accept=MSGPACK_TYPE)
+    assert headers["Content-Type"] == JSON_TYPE
@@ -0,0 +1,426 @@
+import csv
+import io
+import json
+import os
+import sys
+from datetime import date
+from itertools import islice
+from sqlalchemy import create_engine, func, insert, or_, select
+from models import Tag, Task, TaskAssignee, TaskTag, Team, TeamMember, User
+from tags import invalidate_tag_scope
+from tasks import TASK_STATUSES
+from changes import feed, task_change
+
+# Rows are read, checked and inserted this many at a time, so memory stays
+# flat however large the file is
+CHUNK_SIZE = 1000
+# Only the first errors are kept in an import report
+MAX_REPORTED_ERRORS = 100
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# Columns per record kind, in file order. Records refer to users by username
+# and to teams by team_name, so an export from one database imports into
+# another; teams with the same name are treated as one team.
+KINDS = {
+    "users": ("username", "email", "uid"),
+    "teams": ("team_name",),
+    "memberships": ("team_name", "username"),
+    "tasks": ("title", "description", "status", "due_date", "created_by", "team_name", "tags", "assignees"),
+}
+# Task columns holding several names; joined with LIST_SEPARATOR in CSV
+LIST_FIELDS = ("tags", "assignees")
+LIST_SEPARATOR = ";"
+
+
+def detect_format(path):
+    fmt = os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported file type: {path}")
+    return fmt
+
+def text_stream(stream):
+    # Uploads and request bodies arrive as bytes
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+class UnreadableRecord:
+    # Stands in for a JSON Lines line that does not parse, so it is reported
+    # as that row's error and the rest of the file is still imported
+    def __init__(self, error):
+        self.error = error
+
+def read_records(stream, fmt):
+    # One dict per row, parsed lazily
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield {
+                field: [name for name in (value or "").split(LIST_SEPARATOR) if name]
+                if field in LIST_FIELDS else (value or None)
+                for field, value in row.items()
+            }
+    elif fmt == "jsonl":
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield UnreadableRecord(e)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+def chunks(records, size=CHUNK_SIZE):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+def new_report():
+    return {"inserted": 0, "skipped": 0, "errors": []}
+
+def report_error(report, line, message):
+    report["skipped"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append(f"Record {line}: {message}")
+
+def user_ids(connection, usernames):
+    usernames = {name for name in usernames if name}
+    if not usernames:
+        return {}
+    return dict(connection.execute(select(User.username, User.user_id).where(User.username.in_(usernames))).all())
+
+def team_ids(connection, team_names):
+    # The oldest team wins when several share a name
+    team_names = {name for name in team_names if name}
+    if not team_names:
+        return {}
+    return dict(connection.execute(
+        select(Team.team_name, func.min(Team.team_id)).where(Team.team_name.in_(team_names)).group_by(Team.team_name)
+    ).all())
+
+def import_users(connection, chunk, report):
+    # uids are generated for the whole chunk, then checked against the unique
+    # username, email and uid columns in one query
+    rows = []
+    for line, record in chunk:
+        username, email = record.get("username"), record.get("email")
+        if not username or not email:
+            report_error(report, line, "username and email are required")
+            continue
+        rows.append((line, {"username": username, "email": email, "uid": record.get("uid") or User.generate_uid(email, username)}))
+    if not rows:
+        return
+
+    taken = {"username": set(), "email": set(), "uid": set()}
+    existing = connection.execute(select(User.username, User.email, User.uid).where(or_(
+        User.username.in_([row["username"] for _, row in rows]),
+        User.email.in_([row["email"] for _, row in rows]),
+        User.uid.in_([row["uid"] for _, row in rows]),
+    )))
+    for username, email, uid in existing:
+        taken["username"].add(username)
+        taken["email"].add(email)
+        taken["uid"].add(uid)
+
+    new_rows = []
+    for line, row in rows:
+        duplicate = next((field for field in taken if row[field] in taken[field]), None)
+        if duplicate:
+            report_error(report, line, f"{duplicate} {row[duplicate]!r} already exists")
+            continue
+        for field in taken:
+            taken[field].add(row[field])
+        new_rows.append(row)
+    if new_rows:
+        connection.execute(insert(User), new_rows)
+        report["inserted"] += len(new_rows)
+
+def import_teams(connection, chunk, report):
+    existing = team_ids(connection, [record.get("team_name") for _, record in chunk])
+    new_rows = []
+    for line, record in chunk:
+        team_name = record.get("team_name")
+        if not team_name:
+            report_error(report, line, "team_name is required")
+        elif team_name in existing:
+            report_error(report, line, f"team {team_name!r} already exists")
+        else:
+            existing[team_name] = None
+            new_rows.append({"team_name": team_name})
+    if new_rows:
+        connection.execute(insert(Team), new_rows)
+        report["inserted"] += len(new_rows)
+
+def import_memberships(connection, chunk, report):
+    teams = team_ids(connection, [record.get("team_name") for _, record in chunk])
+    users = user_ids(connection, [record.get("username") for _, record in chunk])
+    taken = set()
+    if teams and users:
+        taken = set(connection.execute(
+            select(TeamMember.team_id, TeamMember.user_id)
+            .where(TeamMember.team_id.in_(teams.values()), TeamMember.user_id.in_(users.values()))
+        ).all())
+
+    new_rows = []
+    for line, record in chunk:
+        team_id, user_id = teams.get(record.get("team_name")), users.get(record.get("username"))
+        if team_id is None or user_id is None:
+            report_error(report, line, "unknown team or user")
+        elif (team_id, user_id) in taken:
+            report_error(report, line, "already a member")
+        else:
+            taken.add((team_id, user_id))
+            new_rows.append({"team_id": team_id, "user_id": user_id})
+    if new_rows:
+        connection.execute(insert(TeamMember), new_rows)
+        report["inserted"] += len(new_rows)
+
+def resolve_tag_ids(connection, scoped_names):
+    # {(name, user_id, team_id): tag_id} for every scoped name, creating the
+    # missing tags; matches the uix_tag_name_user_team constraint
+    names = {name for name, _, _ in scoped_names}
+    tag_ids = {}
+    if names:
+        existing = connection.execute(select(Tag.name, Tag.user_id, Tag.team_id, Tag.tag_id).where(Tag.name.in_(names)))
+        for name, user_id, team_id, tag_id in existing:
+            if (name, user_id, team_id) in scoped_names:
+                tag_ids[(name, user_id, team_id)] = tag_id
+    missing = [key for key in scoped_names if key not in tag_ids]
+    if missing:
+        created = connection.execute(
+            insert(Tag).returning(Tag.tag_id, sort_by_parameter_order=True),
+            [{"name": name, "user_id": user_id, "team_id": team_id} for name, user_id, team_id in missing],
+        ).scalars().all()
+        tag_ids.update(zip(missing, created))
+        for user_id, team_id in {(user_id, team_id) for _, user_id, team_id in missing}:
+            invalidate_tag_scope(user_id, team_id)
+    return tag_ids
+
+def import_tasks(connection, chunk, report):
+    # Tasks go in as one multi-row insert per chunk, then their tags and
+    # assignees as two more
+    users = user_ids(connection, [
+        username for _, record in chunk
+        for username in [record.get("created_by")] + list(record.get("assignees") or [])
+    ])
+    teams = team_ids(connection, [record.get("team_name") for _, record in chunk])
+
+    rows = []
+    for line, record in chunk:
+        try:
+            title = record.get("title")
+            if not title:
+                raise ValueError("title is required")
+            status = record.get("status") or TASK_STATUSES[0]
+            if status not in TASK_STATUSES:
+                raise ValueError(f"unknown status {status!r}")
+            created_by = users.get(record.get("created_by")) if record.get("created_by") else None
+            team_id = teams.get(record.get("team_name")) if record.get("team_name") else None
+            if (record.get("created_by") and created_by is None) or (record.get("team_name") and team_id is None):
+                raise ValueError("unknown creator or team")
+            assignees = list(dict.fromkeys(record.get("assignees") or []))
+            if any(username not in users for username in assignees):
+                raise ValueError("unknown assignee")
+            due_date = record.get("due_date")
+            task = {
+                "title": title,
+                "description": record.get("description"),
+                "status": status,
+                "due_date": date.fromisoformat(due_date) if due_date else None,
+                "created_by": created_by,
+                "team_id": team_id,
+            }
+        except ValueError as e:
+            report_error(report, line, str(e))
+            continue
+        # Team tasks share the team's tags; personal tasks use the creator's
+        scope = (None, team_id) if team_id is not None else (created_by, None)
+        tags = [(name, *scope) for name in dict.fromkeys(record.get("tags") or [])]
+        rows.append((task, tags, [users[username] for username in assignees]))
+    if not rows:
+        return
+
+    task_ids = connection.execute(
+        insert(Task).returning(Task.task_id, sort_by_parameter_order=True),
+        [task for task, _, _ in rows],
+    ).scalars().all()
+    tag_ids = resolve_tag_ids(connection, {tag for _, tags, _ in rows for tag in tags})
+    task_tags = [
+        {"task_id": task_id, "tag_id": tag_ids[tag]}
+        for task_id, (_, tags, _) in zip(task_ids, rows) for tag in tags
+    ]
+    task_assignees = [
+        {"task_id": task_id, "user_id": user_id}
+        for task_id, (_, _, assignees) in zip(task_ids, rows) for user_id in assignees
+    ]
+    if task_tags:
+        connection.execute(insert(TaskTag), task_tags)
+    if task_assignees:
+        connection.execute(insert(TaskAssignee), task_assignees)
+    report["inserted"] += len(rows)
+
+    # Live boards hear about a chunk as one bulk change per board rather than
+    # one per task; it is published once the chunk commits
+    boards = {}
+    for task, _, assignees in rows:
+        people, statuses = boards.setdefault(task["team_id"], (set(), set()))
+        people.update([task["created_by"]] + assignees)
+        statuses.add(task["status"])
+    connection.info.setdefault("pending_changes", []).extend(
+        task_change("bulk", None, team_id, people, statuses) for team_id, (people, statuses) in boards.items()
+    )
+
+IMPORTERS = {
+    "users": import_users,
+    "teams": import_teams,
+    "memberships": import_memberships,
+    "tasks": import_tasks,
+}
+
+def record_problem(kind, record):
+    # What is wrong with the shape of a record, or None. JSON Lines can hold
+    # any value, and a string where a list belongs would be read as one name
+    # per character.
+    if isinstance(record, UnreadableRecord):
+        return f"unreadable JSON: {record.error}"
+    if not isinstance(record, dict):
+        return "not an object"
+    for field in KINDS[kind]:
+        value = record.get(field)
+        if field in LIST_FIELDS:
+            if value is not None and not (isinstance(value, list) and all(isinstance(name, str) for name in value)):
+                return f"{field} must be a list of names"
+        elif value is not None and not isinstance(value, str):
+            return f"{field} must be a string"
+    return None
+
+def import_records(engine, kind, records, chunk_size=CHUNK_SIZE):
+    # Each chunk commits on its own, so a bad row never loses earlier chunks
+    # and rows already loaded are found by the duplicate checks of later ones.
+    # Importers get (line, record) pairs of the records that passed the shape
+    # check.
+    importer = IMPORTERS[kind]
+    report = new_report()
+    start = 1
+    for chunk in chunks(records, chunk_size):
+        numbered = []
+        for line, record in enumerate(chunk, start):
+            problem = record_problem(kind, record)
+            if problem:
+                report_error(report, line, problem)
+            else:
+                numbered.append((line, record))
+        if numbered:
+            with engine.begin() as connection:
+                importer(connection, numbered, report)
+                pending = connection.info.pop("pending_changes", [])
+            feed.publish(pending)
+        start += len(chunk)
+    return report
+
+def export_rows(connection, kind):
+    # Chunks of records in KINDS order, read with yield_per
+    if kind == "users":
+        statement = select(User.username, User.email, User.uid).order_by(User.user_id)
+    elif kind == "teams":
+        statement = select(Team.team_name).order_by(Team.team_id)
+    elif kind == "memberships":
+        statement = (
+            select(Team.team_name, User.username)
+            .join(Team, Team.team_id == TeamMember.team_id)
+            .join(User, User.user_id == TeamMember.user_id)
+            .order_by(TeamMember.team_id, TeamMember.user_id)
+        )
+    else:
+        statement = (
+            select(Task.task_id, Task.title, Task.description, Task.status, Task.due_date,
+                   User.username.label("created_by"), Team.team_name)
+            .outerjoin(User, User.user_id == Task.created_by)
+            .outerjoin(Team, Team.team_id == Task.team_id)
+            .order_by(Task.task_id)
+        )
+    result = connection.execution_options(yield_per=CHUNK_SIZE).execute(statement)
+    for partition in result.partitions():
+        records = [dict(row._mapping) for row in partition]
+        if kind == "tasks":
+            add_task_names(connection, records)
+        yield records
+
+def add_task_names(connection, records):
+    # Tag names and assignee usernames for one chunk of tasks, two queries
+    tasks = {}
+    for record in records:
+        record["due_date"] = record["due_date"].isoformat() if record["due_date"] else None
+        record["tags"] = []
+        record["assignees"] = []
+        tasks[record.pop("task_id")] = record
+    tag_rows = connection.execute(
+        select(TaskTag.task_id, Tag.name).join(Tag, Tag.tag_id == TaskTag.tag_id).where(TaskTag.task_id.in_(tasks))
+    )
+    for task_id, name in tag_rows:
+        tasks[task_id]["tags"].append(name)
+    assignee_rows = connection.execute(
+        select(TaskAssignee.task_id, User.username)
+        .join(User, User.user_id == TaskAssignee.user_id)
+        .where(TaskAssignee.task_id.in_(tasks))
+    )
+    for task_id, username in assignee_rows:
+        tasks[task_id]["assignees"].append(username)
+
+def export_lines(engine, kind, fmt):
+    # Yields the file a chunk at a time, ready for a streaming response
+    fields = KINDS[kind]
+    with engine.connect() as connection:
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            for records in export_rows(connection, kind):
+                for record in records:
+                    writer.writerow([
+                        LIST_SEPARATOR.join(record[field]) if field in LIST_FIELDS else record[field]
+                        for field in fields
+                    ])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        elif fmt == "jsonl":
+            for records in export_rows(connection, kind):
+                yield "".join(json.dumps({field: record[field] for field in fields}) + "\n" for record in records)
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+def import_upload(engine, kind, stream, fmt):
+    # Handler for POST /import/{kind}?format=csv|jsonl, streaming the body
+    if kind not in KINDS or fmt not in FORMATS:
+        return 400, {"detail": f"Unsupported import: {kind} as {fmt}"}, {}
+    try:
+        report = import_records(engine, kind, read_records(text_stream(stream), fmt))
+    except (ValueError, csv.Error) as e:
+        return 400, {"detail": f"Unreadable {fmt} file: {e}"}, {}
+    return 200, report, {}
+
+def export_download(engine, kind, fmt):
+    # Handler for GET /export/{kind}?format=csv|jsonl; the body is a generator
+    if kind not in KINDS or fmt not in FORMATS:
+        return 400, {"detail": f"Unsupported export: {kind} as {fmt}"}, {}
+    return 200, export_lines(engine, kind, fmt), {"Content-Type": FORMATS[fmt]}
+
+if __name__ == "__main__":
+    # python transfer.py import|export <kind> <file.csv|file.jsonl>, against DATABASE_URL
+    engine = create_engine(os.environ.get("DATABASE_URL", "sqlite:///tasks.db"))
+    action, kind, path = sys.argv[1:4]
+    fmt = detect_format(path)
+    if action == "import":
+        with open(path, newline="", encoding="utf-8") as stream:
+            report = import_records(engine, kind, read_records(stream, fmt))
+        print(f"{report['inserted']} inserted, {report['skipped']} skipped")
+        for error in report["errors"]:
+            print(error)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as stream:
+            for lines in export_lines(engine, kind, fmt):
+                stream.write(lines)
@@ -0,0 +1,21 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+def fan_out(calls, max_workers=8):
+    # calls maps a key to (fn, *args); every call runs concurrently and the
+    # outcome for each key is (result, None) or (None, exception), so one
+    # failing call never hides the others. Each call runs in a copy of the
+    # caller's context, so context variables such as the session's metrics
+    # registry follow it into the workers.
+    outcomes = {}
+    if not calls:
+        return outcomes
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, *call): key for key, call in calls.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                outcomes[key] = (future.result(), None)
+            except Exception as e:
+                outcomes[key] = (None, e)
+    return outcomes
@@ -0,0 +1,137 @@
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:
+    # MessagePack is optional on both ends; without it bodies stay JSON
+    msgpack = None
+
+# Task reads can come back normalized: every tag and user appears once in a
+# shared dictionary and tasks refer to them by id, as rows or as columns.
+# Clients ask with SHAPE_HEADER and the server echoes the shape it used.
+SHAPE_HEADER = "X-Task-Shape"
+SHAPES = ("normalized", "columnar")
+WIRE_VERSION = 1
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+# Smaller bodies cost more to compress than they save
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+TASK_FIELDS = ("task_id", "title", "description", "status", "due_date", "created_at", "updated_at", "created_by", "team_id")
+PACKED_FIELDS = TASK_FIELDS + ("tag_ids", "assignee_ids")
+
+
+def is_task_list(value):
+    return isinstance(value, list) and bool(value) and isinstance(value[0], dict) and "task_id" in value[0] and "tags" in value[0]
+
+def pack_tasks(tasks, tags, users, columnar=False):
+    rows = []
+    for task in tasks:
+        tag_ids = []
+        for tag in task.get("tags") or []:
+            tags[tag["tag_id"]] = tag["name"]
+            tag_ids.append(tag["tag_id"])
+        assignee_ids = []
+        for assignee in task.get("assignees") or []:
+            users[assignee["user_id"]] = assignee["username"]
+            assignee_ids.append(assignee["user_id"])
+        rows.append([task.get(field) for field in TASK_FIELDS] + [tag_ids, assignee_ids])
+    if columnar:
+        return {"fields": PACKED_FIELDS, "columns": [list(column) for column in zip(*rows)]}
+    return {"fields": PACKED_FIELDS, "rows": rows}
+
+def pack_body(body, shape="normalized"):
+    # Replaces every task list in a response body, at any depth, and puts the
+    # tag and user dictionaries for all of them in one envelope
+    tags, users = {}, {}
+
+    def pack(value):
+        if is_task_list(value):
+            return pack_tasks(value, tags, users, columnar=shape == "columnar")
+        if isinstance(value, dict):
+            return {key: pack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [pack(item) for item in value]
+        return value
+
+    packed = pack(body)
+    return {
+        "wire": WIRE_VERSION,
+        "tags": [list(tags), list(tags.values())],
+        "users": [list(users), list(users.values())],
+        "body": packed,
+    }
+
+def unpack_tasks(packed, tags, users):
+    # tags and users map ids to shared objects, so each tag or user is
+    # built once however many tasks carry it
+    fields = packed["fields"]
+    rows = packed["rows"] if "rows" in packed else zip(*packed["columns"])
+    tasks = []
+    for row in rows:
+        task = dict(zip(fields, row))
+        task["tags"] = [tags[tag_id] for tag_id in task.pop("tag_ids")]
+        task["assignees"] = [users[user_id] for user_id in task.pop("assignee_ids")]
+        tasks.append(task)
+    return tasks
+
+def unpack_body(body):
+    # Inverse of pack_body; anything that is not an envelope passes through
+    if not isinstance(body, dict) or "wire" not in body:
+        return body
+    tags = {tag_id: {"tag_id": tag_id, "name": name} for tag_id, name in zip(*body["tags"])}
+    users = {user_id: {"user_id": user_id, "username": username} for user_id, username in zip(*body["users"])}
+
+    def unpack(value):
+        if isinstance(value, dict):
+            if "fields" in value and ("rows" in value or "columns" in value):
+                return unpack_tasks(value, tags, users)
+            return {key: unpack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [unpack(item) for item in value]
+        return value
+
+    return unpack(body["body"])
+
+def encode_response(status_code, body, headers, accept="", accept_encoding="", shape=None):
+    # Serializes a (status_code, body, headers) handler result for the HTTP
+    # layer, honouring the client's Accept, Accept-Encoding and SHAPE_HEADER
+    headers = dict(headers)
+    if body is None:
+        return status_code, b"", headers
+    if shape in SHAPES:
+        body = pack_body(body, shape)
+        headers[SHAPE_HEADER] = shape
+    if msgpack is not None and MSGPACK_TYPE in (accept or ""):
+        data = msgpack.packb(body, use_bin_type=True)
+        headers["Content-Type"] = MSGPACK_TYPE
+    else:
+        data = json.dumps(body, separators=(",", ":")).encode()
+        headers["Content-Type"] = JSON_TYPE
+    headers["Vary"] = f"Accept, Accept-Encoding, {SHAPE_HEADER}"
+    if "gzip" in (accept_encoding or "") and len(data) >= GZIP_MIN_SIZE:
+        data = gzip.compress(data, GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    headers["Content-Length"] = str(len(data))
+    return status_code, data, headers
+
+def request_headers(shape="normalized"):
+    # What a client sends to get the compact encodings it can read
+    accept = f"{MSGPACK_TYPE}, {JSON_TYPE};q=0.9" if msgpack is not None else JSON_TYPE
+    headers = {"Accept": accept, "Accept-Encoding": "gzip"}
+    if shape in SHAPES:
+        headers[SHAPE_HEADER] = shape
+    return headers
+
+def decode_body(content_type, content):
+    # content is already gunzipped by the HTTP client
+    if content_type.startswith(MSGPACK_TYPE):
+        if msgpack is None:
+            raise ValueError("Received a MessagePack body without msgpack installed")
+        body = msgpack.unpackb(content, raw=False, strict_map_key=False)
+    else:
+        body = json.loads(content)
+    return unpack_body(body)